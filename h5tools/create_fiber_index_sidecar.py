@@ -0,0 +1,152 @@
+# -*- coding: utf-8 -*-
+"""
+Created: 2026/10/18
+
+Script to export the survey FiberIndex table to a columnar,
+memory-mapped sidecar directory. Each column is written to its own
+.npy file with the rows sorted by healpix, together with a healpix
+offset table giving the row range of every healpix pixel.
+
+Open the sidecar with
+
+>>> from hetdex_api.survey import FiberIndex
+>>> FibIndex = FiberIndex(memmap=True)
+
+Columns are then mapped zero-copy so that queries only touch the
+pages they need and several processes on a node share the page cache.
+
+To run:
+
+python3 create_fiber_index_sidecar.py -survey hdr2.1
+
+"""
+
+import os
+import os.path as op
+import json
+import numpy as np
+import tables as tb
+import argparse as ap
+
+from hetdex_api.input_utils import setup_logging
+from hetdex_api.config import HDRconfig
+from hetdex_api.survey import SIDECAR_OFFSETS, SIDECAR_INFO
+
+
+def write_fiberindex_sidecar(table, outdir, chunksize=5000000, log=None):
+    """
+    Write a FiberIndex table to a columnar .npy sidecar sorted by healpix
+
+    Parameters
+    ----------
+    table
+        the pytables FiberIndex table. It must have a completely
+        sorted index (CSI) on the healpix column
+    outdir
+        output directory
+    chunksize
+        number of rows read from the HDF5 file at a time
+    log
+        optional logger
+    """
+    if not op.exists(outdir):
+        os.makedirs(outdir)
+
+    nrows = int(table.nrows)
+    colnames = table.colnames
+
+    # coldtypes of a subarray column carry the cell shape, which is
+    # already part of the file shape, so the base dtype is stored
+    outcols = {}
+    for name in colnames:
+        outcols[name] = np.lib.format.open_memmap(
+            op.join(outdir, name + ".npy"),
+            mode="w+",
+            dtype=table.coldtypes[name].base,
+            shape=(nrows,) + table.coldtypes[name].shape,
+        )
+
+    for start in range(0, nrows, chunksize):
+        stop = min(start + chunksize, nrows)
+        if log is not None:
+            log.info("Writing rows %i to %i of %i" % (start, stop, nrows))
+        rows = table.read_sorted("healpix", checkCSI=True, start=start, stop=stop)
+        for name in colnames:
+            outcols[name][start:stop] = rows[name]
+
+    for name in colnames:
+        outcols[name].flush()
+
+    # row range for each healpix pixel
+    healpix = outcols["healpix"]
+    pix, start = np.unique(healpix, return_index=True)
+    stop = np.append(start[1:], nrows)
+
+    offsets = np.zeros(
+        np.size(pix), dtype=[("healpix", "i8"), ("start", "i8"), ("stop", "i8")]
+    )
+    offsets["healpix"] = pix
+    offsets["start"] = start
+    offsets["stop"] = stop
+    np.save(op.join(outdir, SIDECAR_OFFSETS), offsets)
+
+    with open(op.join(outdir, SIDECAR_INFO), "w") as f:
+        json.dump({"colnames": colnames, "nrows": nrows}, f)
+
+    del outcols
+
+
+def main(argv=None):
+    """ Main Function """
+    parser = ap.ArgumentParser(
+        description="""Export the FiberIndex table to a memory-mapped sidecar.""",
+        add_help=True,
+    )
+
+    parser.add_argument(
+        "-f",
+        "--fiberindexh5",
+        help="""FiberIndex HDF5 file. Defaults to config.fiberindexh5""",
+        type=str,
+        default=None,
+    )
+
+    parser.add_argument(
+        "-o",
+        "--outdir",
+        help="""Output sidecar directory. Defaults to config.fiberindex_sidecar""",
+        type=str,
+        default=None,
+    )
+
+    parser.add_argument(
+        "-n",
+        "--chunksize",
+        help="""Number of rows to read at a time""",
+        type=int,
+        default=5000000,
+    )
+
+    parser.add_argument("-survey", "--survey", type=str, default="hdr2.1")
+
+    args = parser.parse_args(argv)
+    args.log = setup_logging()
+
+    config = HDRconfig(survey=args.survey)
+
+    if args.fiberindexh5 is None:
+        args.fiberindexh5 = config.fiberindexh5
+    if args.outdir is None:
+        args.outdir = config.fiberindex_sidecar
+
+    args.log.info("Exporting %s to %s" % (args.fiberindexh5, args.outdir))
+
+    fileh = tb.open_file(args.fiberindexh5, "r")
+    write_fiberindex_sidecar(
+        fileh.root.FiberIndex, args.outdir, chunksize=args.chunksize, log=args.log
+    )
+    fileh.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -17,7 +17,8 @@ import ipywidgets as widgets
 from ipywidgets import Layout
 
 from hetdex_api.config import HDRconfig
-from hetdex_api.shot import Fibers, get_image2D_amp, open_shot_file
+from hetdex_api.shot import (Fibers, get_image2D_amp, open_shot_file,
+                             close_shot_file, get_shot_fibers)
 from hetdex_api.survey import Survey, FiberIndex
 
 
@@ -260,7 +261,7 @@ class AmpWidget:
 
     def shotid_widget_change(self, b):
         self.bottombox.clear_output()
-        self.shoth5.close()
+        close_shot_file(self.shoth5)
         self.coords = None
         self.detectid = None
         self.im_ra.value = 0.0
@@ -397,7 +398,7 @@ class AmpWidget:
             
             if self.shotid != det_row["shotid"]:
                 try:
-                    self.shoth5.close()
+                    close_shot_file(self.shoth5)
                 except:
                     pass
                 self.shotid = det_row['shotid']
@@ -448,7 +449,7 @@ class AmpWidget:
 
         self.wave = self.wave_widget.value
 
-        fibers = Fibers(self.shotid_widget.value)
+        fibers = get_shot_fibers(self.shotid_widget.value, survey=self.survey)
 
         self.coords = SkyCoord(
             ra=self.im_ra.value * u.deg, dec=self.im_dec.value * u.deg
@@ -461,6 +462,8 @@ class AmpWidget:
         expnum_obj = fibers.table.cols.expnum[idx]
         x, y = fibers.get_image_xy(idx, self.wave)
 
+        fibers.close()
+
         self.imw.marker = {"color": "green", "radius": 10, "type": "circle"}
         self.imw.add_markers(Table([[x - 1], [y - 1]], names=["x", "y"]))
 
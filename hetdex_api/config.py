@@ -2,14 +2,32 @@
 Config file for HETDEX data release paths
 """
 
+import copy
 import os
 import os.path as op
 
+# resolved paths for each (survey, working directory) so the filesystem
+# is only probed the first time a survey is configured in a process.
+# Each instance gets a deep copy so editing e.g. hdr_dir on one config
+# does not change the others
+_resolved = {}
+
+
 class HDRconfig:
 
     LATEST_HDR_NAME = "hdr2.1"
 
     def __init__(self, survey=LATEST_HDR_NAME):
+        key = (survey, os.getcwd())
+        if key in _resolved:
+            self.__dict__.update(copy.deepcopy(_resolved[key]))
+            return
+
+        self._resolve(survey)
+
+        _resolved[key] = copy.deepcopy(self.__dict__)
+
+    def _resolve(self, survey):
         # Check corral first. This only works from a login node
         if op.exists("/corral-repl/utexas/Hobby-Eberly-Teelsco"):
             self.host_dir = "/corral-repl/utexas/Hobby-Eberly-Teelsco"
@@ -80,6 +98,9 @@ class HDRconfig:
         self.fiberindexh5 = op.join(
             self.hdr_dir[survey], "survey", "fiber_index_" + survey + ".h5"
         )
+        self.fiberindex_sidecar = op.join(
+            self.hdr_dir[survey], "survey", "fiber_index_" + survey + "_npy"
+        )
         self.detectml = op.join(
             self.hdr_dir[survey], "detect", "detect_ml_" + survey + ".h5"
         )
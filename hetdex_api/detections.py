@@ -17,8 +17,9 @@ import os.path as op
 import numpy as np
 import tables as tb
 import copy
+import warnings
 
-np.warnings.filterwarnings("ignore")
+warnings.filterwarnings("ignore")
 
 import matplotlib
 
@@ -30,14 +31,20 @@ import astropy.units as u
 from astropy.coordinates import SkyCoord
 from astropy.io import ascii
 import pickle
-import speclite.filters
 
-from hetdex_api.survey import Survey
+from hetdex_api.survey import Survey, match_index
+from hetdex_api.spatial_index import SkyKDTree, angular_separation, to_degrees
 from hetdex_api.config import HDRconfig
 from hetdex_api.mask import *
-from hetdex_api.extinction import get_2pt1_extinction_fix, deredden_spectra
-from dustmaps.sfd import SFDQuery
-import extinction
+from hetdex_api.known_issues import get_known_issues, BAD_AMP
+from hetdex_api.h5utils import read_rows
+from hetdex_api.extinction import (
+    get_2pt1_extinction_fix,
+    deredden_spectra,
+    get_ebv,
+    get_deredden_factor,
+    get_apcor_at_wave,
+)
 
 PYTHON_MAJOR_VERSION = sys.version_info[0]
 PYTHON_VERSION = sys.version_info
@@ -59,6 +66,7 @@ class Detections:
         catalog_type="lines",
         curated_version=None,
         loadtable=True,
+        lazy=False,
     ):
         """
         Initialize the detection catalog class for a given data release
@@ -74,6 +82,14 @@ class Detections:
         load_table : bool
            Boolean flag to load all detection table info upon initialization.
            For example, if you just want to grab a spectrum this isn't needed.
+        lazy : bool
+           Only used with loadtable=True. Instead of reading everything up
+           front, each Detections/Elixer column is read from the HDF5 file
+           the first time it is accessed, and derived columns (apcor, ebv,
+           dereddened fluxes, field/fwhm/throughput...) are computed on
+           first access. Values are kept once read. Slicing with
+           detects[mask] carries the row selection over to columns that
+           have not been read yet. Not available for hdr1.
         
         """
         survey_options = ["hdr1", "hdr2", "hdr2.1"]
@@ -113,6 +129,12 @@ class Detections:
                 print("Could not locate broad line catalog")
 
         self.hdfile = tb.open_file(self.filename, mode="r")
+        self.catalog_type = catalog_type
+        self.lazy = lazy and loadtable and (curated_version is None)
+
+        if self.lazy and self.survey == "hdr1":
+            print("Lazy loading is not available for hdr1. Loading all columns")
+            self.lazy = False
 
         # store to class
         if curated_version is not None:
@@ -143,6 +165,12 @@ class Detections:
                 print("Could not open curated catalog version: " + self.version)
                 return None
 
+        elif self.lazy:
+            # columns are read on first access in __getattr__. _rowindex
+            # holds the HDF5 rows of this object and is sliced along
+            # with every other attribute in __getitem__
+            self._rowindex = np.arange(self.hdfile.root.Detections.nrows)
+
         elif self.loadtable:
             colnames = self.hdfile.root.Detections.colnames
             for name in colnames:
@@ -159,58 +187,11 @@ class Detections:
                         self, name, getattr(self.hdfile.root.Detections.cols, name)[:]
                     )
             if self.survey == "hdr2.1":
-                # Fix fluxes and continuum values for aperture corrections  
-                wave = self.hdfile.root.Detections.cols.wave[:]
-                apcor = self.hdfile.root.Spectra.cols.apcor[:]
-                wave_spec = self.hdfile.root.Spectra.cols.wave1d[:]
-
-                apcor_array = np.ones_like(wave)
-                for idx in np.arange(0, np.size(wave)):
-                    sel_apcor = np.where(wave_spec[idx, :] > wave[idx])[0][0]
-                    apcor_array[idx]=apcor[idx, sel_apcor]
-                self.apcor = apcor_array
+                # Fix fluxes and continuum values for aperture corrections
+                self._load_apcor()
 
                 if catalog_type == "lines":
-
-                    # remove E(B-V)=0.02 screen extinction
-                    fix = get_2pt1_extinction_fix()
-                    
-                    self.flux /= fix(wave)
-                    self.flux_err /= fix(wave)
-                    self.continuum /= fix(wave)
-                    self.continuum_err /= fix(wave)
-
-                    # store observed flux values in new columns
-                    self.flux_obs = self.flux
-                    self.flux_err_obs = self.flux_err
-                    self.continuum_obs = self.continuum
-                    self.continuum_err_obs = self.continuum_err
-
-                    # apply extinction to observed values to get
-                    # dust corrected values
-                    # Apply S&F 2011 Extinction from SFD Map
-                    # https://iopscience.iop.org/article/10.1088/0004-637X/737/2/103#apj398709t6
-
-                    self.coords = SkyCoord(self.ra * u.degree, self.dec * u.degree, frame="icrs")
-                    
-                    sfd = SFDQuery()
-                    self.ebv = sfd(self.coords)
-                    Rv = 2.742  # Landolt V  
-                    ext = []
-                    
-                    self.Av = Rv*self.ebv
-                    
-                    for index in np.arange( np.size(self.detectid)):
-                        src_wave = np.array([np.double(self.wave[index])])
-                        ext_i = extinction.fitzpatrick99(src_wave, self.Av[index], Rv)[0]
-                        ext.append(ext_i)
-
-                    deredden = 10**(0.4*np.array(ext))
-
-                    self.flux *= deredden
-                    self.flux_err *= deredden
-                    self.continuum *= deredden
-                    self.continuum_err *= deredden
+                    self._load_extinction()
 
             # add in the elixer probabilties and associated info:
             if self.survey == "hdr1" and catalog_type == "lines":
@@ -276,46 +257,17 @@ class Detections:
                     print("No Elixer table found")
 
             # also assign a field and some QA identifiers
-            self.field = np.chararray(np.size(self.detectid), 12, unicode=True)
-            self.fwhm = np.zeros(np.size(self.detectid))
-            if self.survey == "hdr1":
-                self.fluxlimit_4550 = np.zeros(np.size(self.detectid))
-            else:
-                self.fluxlimit_4540 = np.zeros(np.size(self.detectid))
-
-            self.throughput = np.zeros(np.size(self.detectid))
-            self.n_ifu = np.zeros(np.size(self.detectid), dtype=int)
-
-            S = Survey(self.survey)
-
-            for index, shot in enumerate(S.shotid):
-                ix = np.where(self.shotid == shot)
-                self.field[ix] = S.field[index].astype(str)
-                # NOTE: python2 to python3 strings now unicode
-                if self.survey == "hdr1":
-                    self.fwhm[ix] = S.fwhm_moffat[index]
-                    self.fluxlimit_4550[ix] = S.fluxlimit_4550[index]
-                else:
-                    self.fwhm[ix] = S.fwhm_virus[index]
-                try:
-                    self.fluxlimit_4540[ix] = S.fluxlimit_4540[index]
-                except:
-                    pass
-                self.throughput[ix] = S.response_4540[index]
-                self.n_ifu[ix] = S.n_ifu[index]
-
-                # assign a vis_class field for future classification
-                # -2 = ignore (bad detectid, shot)
-                # -1 = no assignemnt
-                # 0 = artifact
-                # 1 = OII emitter
-                # 2 = LAE emitter
-                # 3 = star
-                # 4 = nearby galaxies (HBeta, OIII usually)
-                # 5 = other line
-            # close the survey HDF5 file
-            S.close()
-
+            self._load_survey_info()
+
+            # assign a vis_class field for future classification
+            # -2 = ignore (bad detectid, shot)
+            # -1 = no assignemnt
+            # 0 = artifact
+            # 1 = OII emitter
+            # 2 = LAE emitter
+            # 3 = star
+            # 4 = nearby galaxies (HBeta, OIII usually)
+            # 5 = other line
             self.vis_class = -1 * np.ones(np.size(self.detectid))
 
             if self.survey == "hdr1":
@@ -341,8 +293,186 @@ class Detections:
             self.wave = self.hdfile.root.Detections.cols.wave[:]
             
         # set the SkyCoords
+        if not self.lazy:
+            self.coords = SkyCoord(self.ra * u.degree, self.dec * u.degree, frame="icrs")
+
+    def __getattr__(self, name):
+        """
+        Read a column or compute a derived column the first time it is
+        accessed in lazy mode. The value is stored on the object so
+        this is only called once per attribute
+        """
+        if name.startswith("_") or not self.__dict__.get("lazy", False):
+            raise AttributeError(
+                "'Detections' object has no attribute '{}'".format(name)
+            )
+
+        loader = self._get_lazy_loader(name)
+
+        if loader is not None:
+            loader()
+        elif name in self.hdfile.root.Detections.colnames:
+            setattr(self, name, self._read_column(self.hdfile.root.Detections, name))
+        elif (
+            "Elixer" in self.hdfile.root
+            and name in self.hdfile.root.Elixer.colnames
+            and name != "detectid"
+        ):
+            setattr(self, name, self._read_column(self.hdfile.root.Elixer, name))
+
+        try:
+            return self.__dict__[name]
+        except KeyError:
+            raise AttributeError(
+                "'Detections' object has no attribute '{}'".format(name)
+            )
+
+    def _get_lazy_loader(self, name):
+        """
+        Return the method that computes a derived column in lazy mode
+        or None if name is not a derived column
+        """
+        if name == "coords":
+            return self._load_coords
+        if name == "vis_class":
+            return self._load_vis_class
+        if name in ["gmag", "gmag_err"]:
+            return self._load_gmag
+        if name in ["field", "fwhm", "fluxlimit_4540", "throughput", "n_ifu"]:
+            return self._load_survey_info
+        if self.survey == "hdr2.1":
+            if name == "apcor":
+                return self._load_apcor
+            if self.catalog_type == "lines" and name in [
+                "flux", "flux_err", "continuum", "continuum_err",
+                "flux_obs", "flux_err_obs", "continuum_obs", "continuum_err_obs",
+                "ebv", "Av",
+            ]:
+                return self._load_extinction
+        return None
+
+    def _read_column(self, table, name):
+        """
+        Read a column of table for the rows of this object. Byte strings
+        are converted to str
+        """
+        rowindex = self.__dict__.get("_rowindex")
+
+        if rowindex is None:
+            data = table.col(name)
+        else:
+            data = read_rows(table, rowindex, field=name)
+
+        if data.dtype.kind == "S":
+            data = data.astype(str)
+
+        return data
+
+    def _detections_column(self, name):
+        """
+        Return a column of the Detections table as stored in the file.
+        In eager mode the column is already in memory and is not read
+        again
+        """
+        if not self.lazy and name in self.__dict__:
+            return self.__dict__[name]
+        return self._read_column(self.hdfile.root.Detections, name)
+
+    def _load_coords(self):
         self.coords = SkyCoord(self.ra * u.degree, self.dec * u.degree, frame="icrs")
 
+    def _load_vis_class(self):
+        self.vis_class = -1 * np.ones(np.size(self.detectid))
+
+    def _load_gmag(self):
+        self.gmag = self.mag_sdss_g
+        self.gmag_err = self.mag_sdss_g
+
+    def _load_apcor(self):
+        """
+        Aperture correction at the wavelength of each detection
+        """
+        wave = self._detections_column("wave")
+        apcor = self._read_column(self.hdfile.root.Spectra, "apcor")
+        wave_spec = self._read_column(self.hdfile.root.Spectra, "wave1d")
+
+        self.apcor = get_apcor_at_wave(wave, wave_spec, apcor)
+
+    def _load_extinction(self):
+        """
+        Remove the E(B-V)=0.02 screen applied in hdr2.1 and apply the
+        SFD extinction at each detection. The observed (screen removed)
+        values are kept in the *_obs columns
+        """
+        wave = self._detections_column("wave")
+
+        # remove E(B-V)=0.02 screen extinction
+        fix = get_2pt1_extinction_fix()(wave)
+
+        # store observed flux values in new columns
+        self.flux_obs = self._detections_column("flux") / fix
+        self.flux_err_obs = self._detections_column("flux_err") / fix
+        self.continuum_obs = self._detections_column("continuum") / fix
+        self.continuum_err_obs = self._detections_column("continuum_err") / fix
+
+        # apply extinction to observed values to get
+        # dust corrected values
+        # Apply S&F 2011 Extinction from SFD Map
+        # https://iopscience.iop.org/article/10.1088/0004-637X/737/2/103#apj398709t6
+
+        if "coords" not in self.__dict__:
+            self._load_coords()
+
+        self.ebv = get_ebv(self.coords)
+        Rv = 2.742  # Landolt V
+
+        self.Av = Rv * self.ebv
+
+        deredden = get_deredden_factor(wave, self.ebv, Rv=Rv)
+
+        self.flux = self.flux_obs * deredden
+        self.flux_err = self.flux_err_obs * deredden
+        self.continuum = self.continuum_obs * deredden
+        self.continuum_err = self.continuum_err_obs * deredden
+
+    def _load_survey_info(self):
+        """
+        Assign the field, fwhm, flux limit, throughput and n_ifu of the
+        shot of each detection from the Survey table
+        """
+        self.field = np.chararray(np.size(self.detectid), 12, unicode=True)
+        self.fwhm = np.zeros(np.size(self.detectid))
+        if self.survey == "hdr1":
+            self.fluxlimit_4550 = np.zeros(np.size(self.detectid))
+        else:
+            self.fluxlimit_4540 = np.zeros(np.size(self.detectid))
+
+        self.throughput = np.zeros(np.size(self.detectid))
+        self.n_ifu = np.zeros(np.size(self.detectid), dtype=int)
+
+        S = Survey(self.survey)
+
+        idx = match_index(self.shotid, S.shotid)
+        ix = idx >= 0
+        idx = idx[ix]
+
+        self.field[ix] = S.field[idx].astype(str)
+        # NOTE: python2 to python3 strings now unicode
+        if self.survey == "hdr1":
+            self.fwhm[ix] = S.fwhm_moffat[idx]
+            self.fluxlimit_4550[ix] = S.fluxlimit_4550[idx]
+        else:
+            self.fwhm[ix] = S.fwhm_virus[idx]
+        try:
+            self.fluxlimit_4540[ix] = S.fluxlimit_4540[idx]
+        except:
+            pass
+        self.throughput[ix] = S.response_4540[idx]
+        self.n_ifu[ix] = S.n_ifu[idx]
+
+        # close the survey HDF5 file
+        S.close()
+
     def __getitem__(self, indx):
         """ 
         This allows for slicing of the Detections class
@@ -360,6 +490,11 @@ class Detections:
                 setattr(p, attrname, getattr(self, attrname)[indx])
             except:
                 setattr(p, attrname, getattr(self, attrname))
+
+        # the search indexes refer to the rows before slicing
+        p._tree = None
+        p._wave_index = None
+
         return p
 
     def refine(self, gmagcut=None, remove_large_gal=True, d25scale=3.0):
@@ -387,6 +522,25 @@ class Detections:
 
         return self[mask]
 
+    def get_tree(self):
+        """
+        Returns a unit-vector KD-tree of the detection positions. It is
+        built on the first call and reused for all later queries.
+        """
+        if self.__dict__.get("_tree") is None:
+            self._tree = SkyKDTree(self.ra, self.dec)
+        return self._tree
+
+    def get_wave_index(self):
+        """
+        Returns the wavelength sorted order of the detections and the
+        sorted wavelengths. Built on the first call and reused.
+        """
+        if self.__dict__.get("_wave_index") is None:
+            sorter = np.argsort(self.wave, kind="stable")
+            self._wave_index = (sorter, np.asarray(self.wave)[sorter])
+        return self._wave_index
+
     def query_by_coords(self, coords, radius):
         """
         Returns mask based on a coordinate search
@@ -395,16 +549,68 @@ class Detections:
         coords - astropy coordinate object
         radius - an astropy Quantity object, or a string 
         that can be parsed into one.  e.g., '1 degree' 
-        or 1*u.degree. Will assume arcsec if no units given
+        or 1*u.degree. Will assume arcmin if no units given
         
         """
-        sep = self.coords.separation(coords)
-        try:
-            maskcoords = sep < radius
-        except:
-            maskcoords = sep.arcmin < radius
+        maskcoords = np.zeros(np.size(self.detectid), dtype=bool)
+        for idx in self.query_by_coords_many(coords, radius):
+            maskcoords[idx] = True
         return maskcoords
 
+    def query_by_coords_many(self, coords, radius):
+        """
+        Returns the detections around each coordinate with a single
+        batched KD-tree search
+
+        Parameters
+        ----------
+        coords
+            astropy coordinate object (scalar or array)
+        radius
+            an astropy Quantity object, or a string that can be parsed
+            into one. Will assume arcmin if no units given. May be an
+            array with one radius per coordinate
+
+        Returns
+        -------
+        idx_list
+            list of sorted index arrays, one per input coordinate
+        """
+        if isinstance(radius, str):
+            radius = u.Quantity(radius)
+        rad_deg = to_degrees(radius, default_unit=u.arcmin)
+
+        return self.get_tree().query_radius(
+            np.atleast_1d(coords.ra.deg), np.atleast_1d(coords.dec.deg), rad_deg
+        )
+
+    def query_by_wave_many(self, wave, dwave=5.0):
+        """
+        Returns the detections within dwave of each wavelength from
+        the wavelength sorted index
+
+        Parameters
+        ----------
+        wave
+            array of central wavelengths in AA
+        dwave
+            delta wavelength to search. A value or an array with one
+            value per wavelength
+
+        Returns
+        -------
+        idx_list
+            list of sorted index arrays, one per input wavelength
+        """
+        sorter, wave_sorted = self.get_wave_index()
+        wave = np.atleast_1d(wave)
+        dwave = np.broadcast_to(dwave, wave.shape)
+
+        start = np.searchsorted(wave_sorted, wave - dwave, side="right")
+        stop = np.searchsorted(wave_sorted, wave + dwave, side="left")
+
+        return [np.sort(sorter[i:j]) for i, j in zip(start, stop)]
+
     def find_match(
         self, coord, radius=5.0 * u.arcsec, wave=None, dwave=5.0, shotid=None
     ):
@@ -414,7 +620,8 @@ class Detections:
         Parameters
         ----------
         coord
-            an astropy coordinates object
+            an astropy coordinates object. If None only the
+            wavelength (and shotid) constraints are used
         wave
             central wavelength in AA you want to search. If
             nothing is given, it will search without any
@@ -431,18 +638,114 @@ class Detections:
         match_index
             index of matches
         """
+        selmatch = np.zeros(np.size(self.detectid), dtype=bool)
+
+        if coord is None:
+            if wave is None:
+                selmatch[:] = True
+            else:
+                selmatch[self.query_by_wave_many(wave, dwave=dwave)[0]] = True
+            if shotid is not None:
+                selmatch *= self.shotid == shotid
+            return selmatch
+
+        for idx in self.find_match_many(
+            coord, radius=radius, wave=wave, dwave=dwave, shotid=shotid
+        ):
+            selmatch[idx] = True
+
+        return selmatch
+
+    def find_match_many(
+        self, coords, radius=5.0 * u.arcsec, wave=None, dwave=5.0, shotid=None
+    ):
+        """
+        Cross match a list of positions, and optionally wavelengths,
+        to the detections in one call
+
+        Parameters
+        ----------
+        coords
+            an astropy coordinates object (scalar or array)
+        radius
+            search radius. An astropy quantity
+        wave
+            central wavelength in AA of each coordinate, or a single
+            value for all. If None, no wavelength constraint
+        dwave
+            delta wavelength to search
+        shotid
+            optional shotid, or array of shotids, for a specific
+            observation
+
+        Returns
+        -------
+        idx_list
+            list of sorted index arrays of the matches, one per input
+            coordinate
+        """
+        idx_list = self.query_by_coords_many(coords, radius)
 
-        selmatch = self.query_by_coords(coord, radius)
+        if wave is None and shotid is None:
+            return idx_list
+
+        nmatch = np.array([np.size(idx) for idx in idx_list])
+        src = np.repeat(np.arange(np.size(nmatch)), nmatch)
+        idx = np.concatenate(idx_list + [np.zeros(0, dtype=np.int64)])
+        keep = np.ones(np.size(idx), dtype=bool)
 
         if wave is not None:
-            selwave = np.abs(self.wave - wave) < dwave
-            selmatch = selwave * selmatch
+            wave = np.broadcast_to(wave, nmatch.shape)
+            dwave = np.broadcast_to(dwave, nmatch.shape)
+            keep &= np.abs(np.asarray(self.wave)[idx] - wave[src]) < dwave[src]
 
         if shotid is not None:
-            selshot = self.shotid == shotid
-            selmatch = selshot * selmatch
+            shotid = np.broadcast_to(shotid, nmatch.shape)
+            keep &= np.asarray(self.shotid)[idx] == shotid[src]
 
-        return selmatch
+        counts = np.bincount(src[keep], minlength=np.size(nmatch))
+
+        return np.split(idx[keep], np.cumsum(counts)[:-1])
+
+    def find_nearest_match(
+        self, coords, radius=5.0 * u.arcsec, wave=None, dwave=5.0, shotid=None
+    ):
+        """
+        Closest detection to each position that passes the same
+        constraints as find_match_many()
+
+        Returns
+        -------
+        idx
+            index of the closest match, -1 where there is none
+        sep
+            separation of the closest match as an astropy quantity,
+            nan where there is none
+        """
+        idx_list = self.find_match_many(
+            coords, radius=radius, wave=wave, dwave=dwave, shotid=shotid
+        )
+
+        nmatch = np.array([np.size(idx) for idx in idx_list])
+        src = np.repeat(np.arange(np.size(nmatch)), nmatch)
+        idx = np.concatenate(idx_list + [np.zeros(0, dtype=np.int64)])
+
+        ra = np.atleast_1d(coords.ra.deg)
+        dec = np.atleast_1d(coords.dec.deg)
+        sep = angular_separation(
+            ra[src], dec[src], np.asarray(self.ra)[idx], np.asarray(self.dec)[idx]
+        )
+
+        # closest match is the first of each source after sorting
+        order = np.lexsort((sep, src))
+        first = order[np.unique(src[order], return_index=True)[1]]
+
+        best_idx = np.full(np.size(nmatch), -1, dtype=np.int64)
+        best_sep = np.full(np.size(nmatch), np.nan)
+        best_idx[src[first]] = idx[first]
+        best_sep[src[first]] = sep[first]
+
+        return best_idx, best_sep * u.deg
 
     def query_by_dictionary(self, limits):
         """
@@ -574,15 +877,7 @@ class Detections:
         Don't use for machine learning or other
         classifying algorithms tests.
         """
-        global config
-        # set an empty mask to start
-        mask = np.zeros(np.size(self.detectid), dtype=bool)
-
-        baddetects = np.loadtxt(config.baddetect, dtype=int)
-
-        for baddet in baddetects:
-            maskdet = self.detectid == baddet
-            mask = np.logical_or(mask, maskdet)
+        mask = get_known_issues(self.survey).bad_detect(self.detectid)
 
         return np.invert(mask)
 
@@ -631,39 +926,13 @@ class Detections:
 
             return np.logical_not(mask)
         else:
-
-            # first read in amp_flag.fits file
-            badamps = Table.read(config.badamp)
-
-            det_table = self.return_astropy_table()
-
-            join_tab = join(
-                det_table, badamps, keys=["shotid", "multiframe"], join_type="left"
+            # amps flagged in amp_flag.fits and any newly found badamps
+            # that haven't made it into the amp_flag.fits file yet
+            mask = get_known_issues(self.survey).bad_amp(
+                self.shotid, self.multiframe, self.date
             )
-            # this is needed to match with detection class object sorting
-            join_tab.sort("detectid")
-
-            mask1 = join_tab["flag"] != 0
 
-            del det_table, join_tab
-
-            # add in any newly found badamps that haven't made it into the
-            # amp_flag.fits file yet
-
-            mask2 = np.zeros(np.size(self.detectid), dtype=bool)
-
-            badamps2 = Table.read(config.badamp2, format="ascii")
-
-            for row in badamps2:
-                selmf = self.multiframe == row["multiframe"]
-                seldate = (self.date >= row["date_start"]) * (
-                    self.date <= row["date_end"]
-                )
-                mask2 = np.logical_or(mask2, selmf * seldate)
-
-            mask = mask1 * np.logical_not(mask2)
-
-            return mask
+            return np.invert(mask)
 
     def remove_bad_pix(self):
         """
@@ -689,27 +958,11 @@ class Detections:
         
         """
 
-        if True:
-            badpixlist = ascii.read(
-                config.badpix, names=["multiframe", "x1", "x2", "y1", "y2"]
-            )
-
-            mask = np.zeros(np.size(self.detectid), dtype=bool)
-
-            for row in badpixlist:
-                maskbadpix = (
-                    (self.multiframe == row["multiframe"])
-                    * (self.x_raw >= row["x1"])
-                    * (self.x_raw <= row["x2"])
-                    * (self.y_raw >= row["y1"])
-                    * (self.y_raw <= row["y2"])
-                )
-                mask = np.logical_or(maskbadpix, mask)
-
-            self.vis_class[mask] = 0
+        mask = get_known_issues(self.survey).bad_pix(
+            self.multiframe, self.x_raw, self.y_raw
+        )
 
-        else:  # except:
-            mask = np.zeros(np.size(self.detectid), dtype=bool)
+        self.vis_class[mask] = 0
 
         return np.invert(mask)
 
@@ -719,13 +972,7 @@ class Detections:
         to detections in these shots so they are not used 
         in any MLing analysis
         """
-        global config
-        mask = np.zeros(np.size(self.detectid), dtype=bool)
-        badshots = np.loadtxt(config.badshot, dtype=int)
-
-        for shot in badshots:
-            maskshot = self.shotid == shot
-            mask = np.logical_or(maskshot, mask)
+        mask = get_known_issues(self.survey).bad_shot(self.shotid)
 
         self.vis_class[mask] = -2
 
@@ -783,18 +1030,33 @@ class Detections:
         streaks masked. Use np.invert(mask) to find meteors
         """
 
-        global config
+        mask = get_known_issues(self.survey).meteor(self.ra, self.dec, self.shotid)
 
-        met_tab = Table.read(config.meteor, format="ascii")
+        return np.invert(mask)
 
-        mask = np.ones_like(self.detectid, dtype=bool)
+    def get_known_issues_flags(self):
+        """
+        Returns a bitmask of the known issues rules that flag each
+        detection. 0 means no known issue, see
+        hetdex_api.known_issues.ISSUE_BITS for the bits. Unlike the
+        remove_* methods this leaves vis_class unchanged
+        """
+        issues = get_known_issues(self.survey)
 
-        for row in met_tab:
-            sel_shot = np.where(self.shotid == row["shotid"])[0]
-            for idx in sel_shot:
-                coord = self.coords[idx]
-                mask[idx] = meteor_flag_from_coords(coord, row["shotid"])
-        return mask
+        if self.survey == "hdr1":
+            bitmask = issues.get_bitmask(
+                self.detectid, self.shotid, multiframe=self.multiframe,
+                x_raw=self.x_raw, y_raw=self.y_raw, ra=self.ra, dec=self.dec,
+            )
+            bitmask[np.invert(self.remove_bad_amps())] |= BAD_AMP
+        else:
+            bitmask = issues.get_bitmask(
+                self.detectid, self.shotid, multiframe=self.multiframe,
+                date=self.date, x_raw=self.x_raw, y_raw=self.y_raw,
+                ra=self.ra, dec=self.dec,
+            )
+
+        return bitmask
 
     def remove_large_gal(self, d25scale=3.0):
         """
@@ -869,6 +1131,8 @@ class Detections:
         Calculates the gband magnitude from the 1D spectrum
         """
 
+        import speclite.filters
+
         spec_table = self.get_spectrum(detectid_i)
         gfilt = speclite.filters.load_filters("sdss2010-g")
         flux, wlen = gfilt.pad_spectrum(
@@ -902,6 +1166,8 @@ class Detections:
             # convert from ergs/s/cm2 to ergs/s/cm2/AA
             spec1d /= 2.0
             wave_rect = 2.0 * np.arange(1036) + 3470.0
+            import speclite.filters
+
             gfilt = speclite.filters.load_filters("sdss2010-g")
             flux, wlen = gfilt.pad_spectrum(1.0e-17 * spec1d, wave_rect)
             gmags = gfilt.get_ab_magnitudes(flux, wlen)
@@ -921,6 +1187,8 @@ class Detections:
 
         """
         spec_table = self.get_spectrum(detectid_i)
+        import speclite.filters
+
         filt = speclite.filters.load_filters(filter)
         flux, wlen = filt.pad_spectrum(
             np.array(1.0e-17 * spec_table["spec1d"]), np.array(spec_table["wave1d"])
@@ -6,9 +6,6 @@ This includes HDR2.1 flat extinction fix
 """
 
 import numpy as np
-from scipy import interpolate
-import extinction
-from dustmaps.sfd import SFDQuery
 from hetdex_api.config import HDRconfig
 
 
@@ -37,6 +34,8 @@ def get_2pt1_extinction_fix(pad=True):
     This is to pad curve to 3470 and 5400 to match
     wave_rect
     """
+    from scipy import interpolate
+
     config = HDRconfig()
 
     karl_data = np.loadtxt( config.extinction_fix)
@@ -57,6 +56,99 @@ def get_2pt1_extinction_fix(pad=True):
     return correction
 
 
+def get_ebv(coords):
+    """
+    Return the SFD E(B-V) value at each coordinate
+
+    Parameters
+    ----------
+    coords    SkyCoord object
+        sky coordinates (scalar or array)
+    """
+    from dustmaps.sfd import SFDQuery
+
+    sfd = SFDQuery()
+    return sfd(coords)
+
+
+def get_deredden_factor(wave, ebv, Rv=2.742):
+    """
+    Multiplicative factor that removes Fitzpatrick (1999) extinction
+
+    The extinction curve is linear in Av so it is evaluated once per
+    unit Av and scaled, instead of calling extinction.fitzpatrick99
+    for every source. wave and ebv broadcast against each other: use
+    one wavelength per source (eg. a line wavelength) or a spectral
+    grid with ebv[:, None] for many spectra.
+
+    Parameters
+    ---------
+    wave      array
+        wavelength in AA to apply correction
+    ebv       float or array
+        E(B-V) from eg. get_ebv()
+    Rv        float
+        Default is 2.742 (Landolt V from S&F 2011)
+
+    Returns
+    -------
+    deredden  array
+        10**(0.4 * A_lambda)
+    """
+    import extinction
+
+    wave = np.asarray(wave, dtype=np.double)
+
+    wave_uniq, inverse = np.unique(wave, return_inverse=True)
+    curve = extinction.fitzpatrick99(wave_uniq, 1.0, Rv)[inverse].reshape(
+        np.shape(wave)
+    )
+
+    Av = Rv * np.asarray(ebv, dtype=np.double)
+
+    return 10 ** (0.4 * Av * curve)
+
+
+def get_apcor_at_wave(wave, wave_spec, apcor, chunksize=100000):
+    """
+    Return the aperture correction of each detection at its line
+    wavelength: the apcor value at the first spectral pixel redward of
+    the wavelength. Wavelengths at or beyond the red end of the
+    spectrum use the last pixel.
+
+    Parameters
+    ---------
+    wave       array
+        line wavelength of each detection, shape (N,)
+    wave_spec  array
+        wavelength array of each spectrum, shape (N, nwave)
+    apcor      array
+        aperture correction spectrum, shape (N, nwave)
+    chunksize  int
+        rows processed at a time to bound the memory of the
+        (chunksize, nwave) comparison
+
+    Returns
+    -------
+    apcor_array  array
+        shape (N,)
+    """
+    wave = np.asarray(wave)
+    apcor_array = np.ones_like(wave)
+
+    for start in range(0, np.size(wave), chunksize):
+        stop = start + chunksize
+        redward = wave_spec[start:stop] > wave[start:stop, None]
+        sel = np.argmax(redward, axis=1)
+        # argmax is 0 when no pixel is redward, use the last pixel instead
+        sel[~redward.any(axis=1)] = np.shape(wave_spec)[1] - 1
+        apcor_array[start:stop] = np.take_along_axis(
+            apcor[start:stop], sel[:, None], axis=1
+        )[:, 0]
+
+    return apcor_array
+
+
 def deredden_spectra(wave, coords):
     """
     Apply S&F 2011 Extinction from SFD Map
@@ -67,14 +159,14 @@ def deredden_spectra(wave, coords):
     wave      array
         wavelength to apply correction
     coords    SkyCoord object
-        sky coordinates
+        sky coordinates. For an array of coordinates the result has
+        shape (ncoords, nwave)
     """
-    Rv = 2.742  # Landolt V
-    sfd = SFDQuery()
-    ebv = sfd(coords)
-    Av = Rv*ebv
-    ext = extinction.fitzpatrick99(np.array(wave, dtype=np.double), Av, Rv)
+    ebv = np.asarray(get_ebv(coords))
+
+    if ebv.ndim > 0:
+        ebv = ebv[:, None]
 
-    deredden = 10**(0.4*np.array(ext))
+    deredden = get_deredden_factor(wave, ebv)
 
     return deredden
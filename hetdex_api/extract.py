@@ -7,12 +7,20 @@ Created on Mon Mar 11 11:48:55 2019
 
 import numpy as np
 
+from collections import OrderedDict
+from functools import lru_cache
+
 from astropy.convolution import Gaussian2DKernel, convolve
 from astropy.coordinates import SkyCoord
 from astropy.modeling.models import Moffat2D, Gaussian2D
 from astropy import units as u
-from scipy.interpolate import griddata, LinearNDInterpolator
-from hetdex_api.shot import Fibers, open_shot_file, get_fibers_table
+from scipy import sparse
+from scipy.interpolate import griddata, LinearNDInterpolator, RegularGridInterpolator
+from scipy.signal import fftconvolve
+from scipy.spatial import Delaunay
+from hetdex_api.shot import (Fibers, open_shot_file, get_fibers_table,
+                             read_fiber_rows, read_fiber_rows_many,
+                             get_shot_fibers, close_shot_file)
 from hetdex_api.input_utils import setup_logging
 
 try:
@@ -25,6 +33,104 @@ except Exception as e:
     LATEST_HDR_NAME = "hdr2.1"
     config = None
 
+# Maximum number of distinct PSF models and PSF interpolators kept in memory
+PSF_CACHE_SIZE = 512
+
+# PSF interpolators for cached (read-only) PSF arrays keyed by id(psf)
+_psf_interpolator_cache = OrderedDict()
+
+
+def _make_moffat_psf(seeing, boxsize, scale, alpha=3.5):
+    """ Moffat PSF profile image. See Extract.moffat_psf """
+    M = Moffat2D()
+    M.alpha.value = alpha
+    M.gamma.value = 0.5 * seeing / np.sqrt(2 ** (1.0 / M.alpha.value) - 1.0)
+    xl, xh = (0.0 - boxsize / 2.0, 0.0 + boxsize / 2.0 + scale)
+    yl, yh = (0.0 - boxsize / 2.0, 0.0 + boxsize / 2.0 + scale)
+    x, y = (np.arange(xl, xh, scale), np.arange(yl, yh, scale))
+    xgrid, ygrid = np.meshgrid(x, y)
+    zarray = np.array([M(xgrid, ygrid), xgrid, ygrid])
+    zarray[0] /= zarray[0].sum()
+    return zarray
+
+
+@lru_cache(maxsize=PSF_CACHE_SIZE)
+def _cached_moffat_psf(seeing, boxsize, scale, alpha):
+    zarray = _make_moffat_psf(seeing, boxsize, scale, alpha=alpha)
+    # the same array is handed to every caller so protect it
+    zarray.setflags(write=False)
+    return zarray
+
+
+def get_moffat_psf(seeing, boxsize, scale, alpha=3.5):
+    """
+    Return a cached Moffat PSF profile image. The seeing FWHM is
+    quantized to 0.01 arcsec so that shots with the same seeing share
+    a single PSF model. The returned array is read-only; copy it
+    before modifying it in place.
+
+    Parameters
+    ----------
+    seeing: float
+        FWHM of the Moffat profile
+    boxsize: float
+        Size of image on a side for Moffat profile
+    scale: float
+        Pixel scale for image
+    alpha: float
+        Power index in Moffat profile function
+
+    Returns
+    -------
+    zarray: numpy 3d array
+        An array with length 3 for the first axis: PSF image, xgrid, ygrid
+    """
+    try:
+        key = (round(float(seeing), 2), float(boxsize), float(scale), float(alpha))
+    except TypeError:
+        # astropy quantities and other unhashable input are not cached
+        return _make_moffat_psf(seeing, boxsize, scale, alpha=alpha)
+
+    return _cached_moffat_psf(*key)
+
+
+def clear_psf_cache():
+    """ Empty the PSF model and PSF interpolator caches """
+    _cached_moffat_psf.cache_clear()
+    _psf_interpolator_cache.clear()
+
+
+def _convolve_images(images, kernel):
+    """
+    Convolve a stack of images with a kernel the way astropy's convolve
+    does by default (normalized kernel, NaN interpolation, zero fill at
+    the boundary), for all images at once with FFTs.
+
+    Parameters
+    ----------
+    images: numpy 3d array
+        (nimage, ny, nx) stack. NaN pixels are interpolated over
+    kernel: numpy 2d array
+        odd sized convolution kernel
+
+    Returns
+    -------
+    numpy 3d array
+        convolved images, NaN where no valid pixel is in reach
+    """
+    kernel = kernel / kernel.sum()
+    valid = np.isfinite(images)
+    filled = np.where(valid, images, 0.0)
+
+    num = fftconvolve(filled, kernel[np.newaxis], mode="same", axes=(1, 2))
+    den = fftconvolve(valid.astype(float), kernel[np.newaxis], mode="same", axes=(1, 2))
+    # pixels beyond the boundary are zero but still count as valid
+    inside = fftconvolve(np.ones(images.shape[1:]), kernel, mode="same")
+    den += 1.0 - inside[np.newaxis]
+
+    with np.errstate(divide="ignore", invalid="ignore"):
+        return np.where(den > 1e-8, num / den, np.nan)
+
 
 class Extract:
     def __init__(self, wave=None):
@@ -94,7 +200,7 @@ class Extract:
         self.survey = survey
 
         if fibers:
-            self.fibers = Fibers(self.shot, survey=survey)
+            self.fibers = get_shot_fibers(self.shot, survey=survey)
             self.shoth5 = self.fibers.hdfile
         else:
             self.fibers = None
@@ -189,32 +295,12 @@ class Extract:
             if len(idx) < fiber_lower_limit:
                 return None
 
-            ifux = self.fibers.table.read_coordinates(idx, "ifux")
-            ifuy = self.fibers.table.read_coordinates(idx, "ifuy")
-            ra = self.fibers.table.read_coordinates(idx, "ra")
-            dec = self.fibers.table.read_coordinates(idx, "dec")
-
-            if ffsky:
-                spec = self.fibers.table.read_coordinates(idx, "spec_fullsky_sub") / 2.0
-            else:
-                spec = self.fibers.table.read_coordinates(idx, "calfib") / 2.0
-
-            spece = self.fibers.table.read_coordinates(idx, "calfibe") / 2.0
-            ftf = self.fibers.table.read_coordinates(idx, "fiber_to_fiber")
-
-            if self.survey == "hdr1":
-                mask = self.fibers.table.read_coordinates(idx, "Amp2Amp")
-                mask = (mask > 1e-8) * (np.median(ftf, axis=1) > 0.5)[:, np.newaxis]
-            else:
-                mask = self.fibers.table.read_coordinates(idx, "calfibe")
-                mask = (mask > 1e-8) * (np.median(ftf, axis=1) > 0.5)[:, np.newaxis]
-            expn = np.array(
-                self.fibers.table.read_coordinates(idx, "expnum"), dtype=int
+            rows = read_fiber_rows(
+                self.fibers.table, idx, fields=self.get_fiberinfo_fields(ffsky)
+            )
+            return self.get_fiberinfo_from_rows(
+                rows, coord, ffsky=ffsky, return_fiber_info=return_fiber_info
             )
-            mf_array = self.fibers.table.read_coordinates(
-                idx, "multiframe").astype(str)
-            fiber_id_array = self.fibers.table.read_coordinates(
-                idx, "fiber_id").astype(str)
         else:
 
             fib_table = get_fibers_table(
@@ -224,29 +310,46 @@ class Extract:
             if np.size(fib_table) < fiber_lower_limit:
                 return None
 
-            ifux = fib_table["ifux"]
-            ifuy = fib_table["ifuy"]
-            ra = fib_table["ra"]
-            dec = fib_table["dec"]
-            if ffsky:
-                spec = fib_table["spec_fullsky_sub"]
-            else:
-                spec = fib_table["calfib"]
-            spece = fib_table["calfibe"]
-            ftf = fib_table["fiber_to_fiber"]
-            if self.survey == "hdr1":
-                mask = fib_table["Amp2Amp"]
-                mask = (mask > 1e-8) * (np.median(ftf, axis=1) > 0.5)[:, np.newaxis]
-            else:
-                mask = fib_table["calfibe"]
-                mask = (mask > 1e-8) * (np.median(ftf, axis=1) > 0.5)[:, np.newaxis]
+            return self.get_fiberinfo_from_table(
+                fib_table, coord, ffsky=ffsky, return_fiber_info=return_fiber_info
+            )
 
-            expn = np.array(fib_table["expnum"], dtype=int)
-            mf_array = fib_table['multiframe']
-            try:
-                fiber_id_array = fib_table['fiber_id']
-            except:
-                fiber_id_array = []
+    def get_fiberinfo_from_table(self, fib_table, coord, ffsky=False,
+                                 return_fiber_info=False):
+        """
+        Build the get_fiberinfo_for_coord() output from a table returned
+        by get_fibers_table()
+
+        Parameters
+        ----------
+        fib_table: astropy Table or numpy structured array
+            fibers around coord
+        coord: SkyCoord Object
+            a single SkyCoord object for a given ra and dec
+        """
+        ifux = fib_table["ifux"]
+        ifuy = fib_table["ifuy"]
+        ra = fib_table["ra"]
+        dec = fib_table["dec"]
+        if ffsky:
+            spec = fib_table["spec_fullsky_sub"]
+        else:
+            spec = fib_table["calfib"]
+        spece = fib_table["calfibe"]
+        ftf = fib_table["fiber_to_fiber"]
+        if self.survey == "hdr1":
+            mask = fib_table["Amp2Amp"]
+            mask = (mask > 1e-8) * (np.median(ftf, axis=1) > 0.5)[:, np.newaxis]
+        else:
+            mask = fib_table["calfibe"]
+            mask = (mask > 1e-8) * (np.median(ftf, axis=1) > 0.5)[:, np.newaxis]
+
+        expn = np.array(fib_table["expnum"], dtype=int)
+        mf_array = fib_table['multiframe']
+        try:
+            fiber_id_array = fib_table['fiber_id']
+        except:
+            fiber_id_array = []
 
         ifux[:] = ifux + self.dither_pattern[expn - 1, 0]
         ifuy[:] = ifuy + self.dither_pattern[expn - 1, 1]
@@ -258,6 +361,147 @@ class Extract:
         else:
             return ifux, ifuy, xc, yc, ra, dec, spec, spece, mask
 
+    def get_fiberinfo_for_coords(self,
+                                 coords,
+                                 radius=3.5,
+                                 ffsky=False,
+                                 return_fiber_info=False):
+        """
+        Batched version of get_fiberinfo_for_coord(). The fibers for
+        all coordinates are found with a single KD-tree query and read
+        from the shot file in a single pass.
+
+        Parameters
+        ----------
+        coords: SkyCoord Object
+            an array of SkyCoord objects
+        radius:
+            radius to extract fibers in arcsec
+        ffsky: bool
+            Flag to choose local (ffsky=False) or full frame (ffsky=True)
+            sky subtraction
+        return_fiber_info: bool
+            Return fiberid and multiframe arrays for each source
+
+        Returns
+        -------
+        results: list
+            one entry per coordinate with the same tuple returned by
+            get_fiberinfo_for_coord(), or None if fewer than 7 fibers
+            are found
+        """
+        if coords.isscalar:
+            coords = coords.reshape((1,))
+
+        fiber_lower_limit = 7
+
+        if not self.fibers and self.survey != "hdr1":
+            # all coordinates in one indexed pass over the shot file
+            fib_tables = get_fibers_table(
+                self.shot, coords, survey=self.survey, radius=radius
+            )
+            return [
+                self.get_fiberinfo_from_table(
+                    fib_table,
+                    coord,
+                    ffsky=ffsky,
+                    return_fiber_info=return_fiber_info,
+                )
+                if np.size(fib_table) >= fiber_lower_limit
+                else None
+                for coord, fib_table in zip(coords, fib_tables)
+            ]
+
+        if not self.fibers:
+            return [
+                self.get_fiberinfo_for_coord(
+                    coord,
+                    radius=radius,
+                    ffsky=ffsky,
+                    return_fiber_info=return_fiber_info,
+                )
+                for coord in coords
+            ]
+
+        idx_list = self.fibers.query_region_idx_many(coords, radius=radius)
+        good = [len(idx) >= fiber_lower_limit for idx in idx_list]
+
+        rows_list = read_fiber_rows_many(
+            self.fibers.table,
+            [idx for idx, g in zip(idx_list, good) if g],
+            fields=self.get_fiberinfo_fields(ffsky),
+        )
+        rows_iter = iter(rows_list)
+
+        results = []
+        for coord, g in zip(coords, good):
+            if g:
+                results.append(
+                    self.get_fiberinfo_from_rows(
+                        next(rows_iter),
+                        coord,
+                        ffsky=ffsky,
+                        return_fiber_info=return_fiber_info,
+                    )
+                )
+            else:
+                results.append(None)
+        return results
+
+    def get_fiberinfo_fields(self, ffsky=False):
+        """ Fiber table columns needed by get_fiberinfo_from_rows() """
+        if ffsky:
+            fields = ["spec_fullsky_sub"]
+        else:
+            fields = ["calfib"]
+        fields += ["ifux", "ifuy", "ra", "dec", "calfibe", "fiber_to_fiber",
+                   "expnum", "multiframe", "fiber_id"]
+        if self.survey == "hdr1":
+            fields.append("Amp2Amp")
+        return fields
+
+    def get_fiberinfo_from_rows(self, rows, coord, ffsky=False, return_fiber_info=False):
+        """
+        Build the get_fiberinfo_for_coord() output from fiber table rows
+        read with read_fiber_rows()
+
+        Parameters
+        ----------
+        rows: numpy structured array
+            fiber table rows with the fields from get_fiberinfo_fields()
+        coord: SkyCoord Object
+            a single SkyCoord object for a given ra and dec
+        """
+        expn = np.array(rows["expnum"], dtype=int)
+        ifux = rows["ifux"] + self.dither_pattern[expn - 1, 0]
+        ifuy = rows["ifuy"] + self.dither_pattern[expn - 1, 1]
+        ra = rows["ra"]
+        dec = rows["dec"]
+
+        if ffsky:
+            spec = rows["spec_fullsky_sub"] / 2.0
+        else:
+            spec = rows["calfib"] / 2.0
+
+        spece = rows["calfibe"] / 2.0
+        ftf = rows["fiber_to_fiber"]
+
+        if self.survey == "hdr1":
+            mask = rows["Amp2Amp"]
+        else:
+            mask = rows["calfibe"]
+        mask = (mask > 1e-8) * (np.median(ftf, axis=1) > 0.5)[:, np.newaxis]
+
+        xc, yc = self.convert_radec_to_ifux_ifuy(
+            ifux, ifuy, ra, dec, coord.ra.deg, coord.dec.deg
+        )
+        if return_fiber_info:
+            mf_array = rows["multiframe"].astype(str)
+            fiber_id_array = rows["fiber_id"].astype(str)
+            return ifux, ifuy, xc, yc, ra, dec, spec, spece, mask, fiber_id_array, mf_array
+        else:
+            return ifux, ifuy, xc, yc, ra, dec, spec, spece, mask
+
     def get_starcatalog_params(self):
         """
         Load Star Catalog coordinates, g' magnitude, and star ID
@@ -397,7 +641,9 @@ class Extract:
 
     def moffat_psf(self, seeing, boxsize, scale, alpha=3.5):
         """
-        Moffat PSF profile image
+        Moffat PSF profile image. Models are cached by get_moffat_psf()
+        with the seeing quantized to 0.01 arcsec, so the returned array
+        is read-only.
         
         Parameters
         ----------
@@ -415,16 +661,7 @@ class Extract:
         zarray: numpy 3d array
             An array with length 3 for the first axis: PSF image, xgrid, ygrid
         """
-        M = Moffat2D()
-        M.alpha.value = alpha
-        M.gamma.value = 0.5 * seeing / np.sqrt(2 ** (1.0 / M.alpha.value) - 1.0)
-        xl, xh = (0.0 - boxsize / 2.0, 0.0 + boxsize / 2.0 + scale)
-        yl, yh = (0.0 - boxsize / 2.0, 0.0 + boxsize / 2.0 + scale)
-        x, y = (np.arange(xl, xh, scale), np.arange(yl, yh, scale))
-        xgrid, ygrid = np.meshgrid(x, y)
-        zarray = np.array([M(xgrid, ygrid), xgrid, ygrid])
-        zarray[0] /= zarray[0].sum()
-        return zarray
+        return get_moffat_psf(seeing, boxsize, scale, alpha=alpha)
 
     def model_psf(
         self,
@@ -753,6 +990,195 @@ class Extract:
 
         return zarray
 
+    def get_interpolation_matrix(self, tri, xgrid, ygrid):
+        """
+        Sparse matrix of linear (barycentric) interpolation weights
+        from the vertices of a triangulation to a set of grid points.
+
+        Parameters
+        ----------
+        tri: scipy.spatial.Delaunay
+            triangulation of the fiber positions
+        xgrid, ygrid: numpy arrays
+            coordinates of the grid points
+
+        Returns
+        -------
+        weights: scipy.sparse.csr_matrix
+            (npix, nfib) matrix with three entries per grid point
+            inside the convex hull and an empty row otherwise.
+            weights.dot(values) is the same as
+            griddata(points, values, (xgrid, ygrid), method="linear")
+            with zero in place of NaN outside the hull
+        """
+        xi = np.column_stack([np.ravel(xgrid), np.ravel(ygrid)])
+        simplex = tri.find_simplex(xi)
+        inside = np.where(simplex >= 0)[0]
+
+        T = tri.transform[simplex[inside]]
+        bary = np.einsum("nij,nj->ni", T[:, :2, :], xi[inside] - T[:, 2, :])
+        w = np.column_stack([bary, 1.0 - bary.sum(axis=1)])
+
+        rows = np.repeat(inside, 3)
+        cols = tri.simplices[simplex[inside]].ravel()
+
+        return sparse.csr_matrix(
+            (w.ravel(), (rows, cols)), shape=(xi.shape[0], tri.npoints)
+        )
+
+    def make_data_cube(
+        self,
+        xc,
+        yc,
+        xloc,
+        yloc,
+        data,
+        mask,
+        scale=0.25,
+        seeing_fac=1.8,
+        boxsize=4.0,
+        wrange=[3470, 5540],
+        dwave=2.0,
+        convolve_image=False,
+        subcont=False,
+        dcont=50.0,
+        adr_tol=0.01,
+    ):
+        """
+        Make a data cube of narrowband images, one for each dwave wide
+        slice in wrange. Each slice matches make_narrowband_image with
+        wrange=[wave, wave + dwave] and interp_kind="linear".
+
+        The fiber positions are triangulated once. Slices with the same
+        ADR offset (to within adr_tol) share one sparse matrix of
+        barycentric weights, so each slice is a sparse matrix product
+        over the fiber spectra. Fibers that are masked in a slice are
+        dropped by renormalising the weights of the remaining fibers.
+        Wavelength sums and the continuum are taken from cumulative
+        sums along wavelength.
+
+        Parameters
+        ----------
+        xc: float
+            The ifu x-coordinate for the center of the cube
+        yc: float
+            The ifu y-coordinate for the center of the cube
+        xloc: numpy array
+            The ifu x-coordinate for each fiber
+        yloc: numpy array
+            The ifu y-coordinate for each fiber
+        data: numpy 2d array
+            The calibrated spectra for each fiber
+        mask: numpy 2d array
+            The good fiber wavelengths to be used in the cube
+        scale: float
+            Pixel scale for output cube
+        seeing_fac: float
+            seeing_fac = 2.35 * radius of the Gaussian kernel used
+            if convolving the images to smooth out features. Unit: arcseconds
+        boxsize: float
+            Length of the side in arcseconds of the cube
+        wrange: list
+            Start and stop wavelength of the cube
+        dwave: float
+            Width of each slice in Angstrom
+        convolve_image: bool
+            If true, each slice is smoothed at the seeing_fac scale
+        subcont: bool
+            If true, subtract the continuum measured dcont wide on
+            either side of each slice
+        dcont: float
+            Width in Angstrom of each continuum region
+        adr_tol: float
+            Slices whose ADR offsets agree to within adr_tol arcsec
+            share interpolation weights
+
+        Returns
+        -------
+        cube: numpy 3d array
+            (nwave, N, N) array of slices in units of 10^-17/ergs/cm^2
+        """
+        N = int(boxsize / scale)
+        xl, xh = (xc - boxsize / 2.0, xc + boxsize / 2.0)
+        yl, yh = (yc - boxsize / 2.0, yc + boxsize / 2.0)
+        x, y = (np.linspace(xl, xh, N), np.linspace(yl, yh, N))
+        xgrid, ygrid = np.meshgrid(x, y)
+        area = np.pi * 0.75 ** 2
+
+        nwave = int((wrange[1] - wrange[0]) / dwave + 1)
+        wave_lo = wrange[0] + dwave * np.arange(nwave)
+        wave_hi = wave_lo + dwave
+
+        cube = np.zeros((nwave, N, N))
+
+        if convolve_image:
+            seeing = seeing_fac / scale
+            G = Gaussian2DKernel(seeing / 2.35)
+
+        # cumulative sums along wavelength with a leading zero column so
+        # that the sum over wave in (lo, hi] is csum[i_hi] - csum[i_lo]
+        def cumsum0(arr):
+            out = np.zeros(arr.shape[:-1] + (arr.shape[-1] + 1,))
+            np.cumsum(arr, axis=-1, out=out[..., 1:])
+            return out
+
+        def index(wave):
+            return np.searchsorted(self.wave, wave, side="right")
+
+        good = mask >= 1e-8
+        csum_data = cumsum0(np.where(good, data, 0.0))
+        csum_good = cumsum0(good.astype(float))
+        csum_adrx = cumsum0(self.ADRx)
+        csum_adry = cumsum0(self.ADRy)
+
+        i_lo, i_hi = index(wave_lo), index(wave_hi)
+        nsel = i_hi - i_lo
+        slices = np.where(nsel > 0)[0]
+        if np.size(slices) == 0:
+            return cube
+
+        i_lo, i_hi, nsel = i_lo[slices], i_hi[slices], nsel[slices]
+
+        # multiply for 2AA bins
+        image = 2.0 * (csum_data[:, i_hi] - csum_data[:, i_lo])
+        valid = (csum_good[:, i_hi] - csum_good[:, i_lo]) > 0
+
+        if subcont:
+            blue = csum_data[:, i_lo] - csum_data[:, index(wave_lo[slices] - dcont)]
+            red = csum_data[:, index(wave_hi[slices] + dcont)] - csum_data[:, i_hi]
+            cont = 2.0 * (blue + red) / (2 * dcont)
+            image -= dwave * cont
+
+        adrx = (csum_adrx[i_hi] - csum_adrx[i_lo]) / nsel
+        adry = (csum_adry[i_hi] - csum_adry[i_lo]) / nsel
+
+        # shifting the fibers by -ADR is the same as shifting the grid by +ADR
+        tri = Delaunay(np.column_stack([xloc, yloc]))
+
+        adr_bins = np.round(np.column_stack([adrx, adry]) / adr_tol)
+        _, adr_index = np.unique(adr_bins, axis=0, return_inverse=True)
+        adr_index = np.ravel(adr_index)
+
+        for ibin in np.unique(adr_index):
+            isel = np.where(adr_index == ibin)[0]
+            weights = self.get_interpolation_matrix(
+                tri, xgrid + np.mean(adrx[isel]), ygrid + np.mean(adry[isel])
+            )
+            good_fib = valid[:, isel].astype(float)
+            num = weights.dot(image[:, isel] * good_fib)
+            den = weights.dot(good_fib)
+
+            with np.errstate(divide="ignore", invalid="ignore"):
+                grid_z = np.where(den > 1e-8, num / den, np.nan)
+            grid_z = grid_z.T.reshape(-1, N, N) * scale ** 2 / area
+
+            if convolve_image:
+                grid_z = _convolve_images(grid_z, G.array)
+            grid_z[np.isnan(grid_z)] = 0.0
+            cube[slices[isel]] = grid_z
+
+        return cube
+
     def get_psf_curve_of_growth(self, psf):
         """
         Analyse the curve of growth for an input psf
@@ -776,6 +1202,65 @@ class Extract:
         cog = np.cumsum(psf[0].ravel()[inds][sel]) / np.sum(psf[0].ravel()[inds][sel])
         return r[inds][sel], cog
 
+    def get_psf_interpolator(self, psf):
+        """
+        Return an interpolator for a PSF image. PSF models made by this
+        class are sampled on a regular grid, so a bilinear regular-grid
+        interpolator is used. Irregular grids fall back to a
+        LinearNDInterpolator.
+
+        Parameters
+        ----------
+        psf: numpy 3d array
+            zeroth dimension: psf image, xgrid, ygrid
+
+        Returns
+        -------
+        interp: function
+            takes arrays of x and y offsets (any matching shape) and
+            returns the PSF value at those offsets (zero outside the grid)
+        """
+        # read-only PSFs come from the PSF cache and cannot change, so
+        # their interpolator can be reused
+        cacheable = isinstance(psf, np.ndarray) and not psf.flags.writeable
+        if cacheable:
+            cached = _psf_interpolator_cache.get(id(psf))
+            if cached is not None and cached[0] is psf:
+                _psf_interpolator_cache.move_to_end(id(psf))
+                return cached[1]
+
+        x = psf[1][0, :]
+        y = psf[2][:, 0]
+
+        regular = (
+            np.all(np.diff(x) > 0)
+            and np.all(np.diff(y) > 0)
+            and np.allclose(psf[1], x[np.newaxis, :])
+            and np.allclose(psf[2], y[:, np.newaxis])
+        )
+
+        if regular:
+            I = RegularGridInterpolator(
+                (y, x), psf[0], method="linear", bounds_error=False, fill_value=0.0
+            )
+
+            def interp(dx, dy):
+                return I(np.stack([dy, dx], axis=-1))
+
+        else:
+            T = np.array([psf[1].ravel(), psf[2].ravel()]).swapaxes(0, 1)
+            I = LinearNDInterpolator(T, psf[0].ravel(), fill_value=0.0)
+
+            def interp(dx, dy):
+                return I(dx, dy)
+
+        if cacheable:
+            _psf_interpolator_cache[id(psf)] = (psf, interp)
+            if len(_psf_interpolator_cache) > PSF_CACHE_SIZE:
+                _psf_interpolator_cache.popitem(last=False)
+
+        return interp
+
     def build_weights(self, xc, yc, ifux, ifuy, psf):
         """
         Build weight matrix for spectral extraction
@@ -798,18 +1283,51 @@ class Extract:
         weights: numpy 2d array (len of fibers by wavelength dimension)
             Weights for each fiber as function of wavelength for extraction
         """
-        S = np.zeros((len(ifux), 2))
-        T = np.array([psf[1].ravel(), psf[2].ravel()]).swapaxes(0, 1)
-        I = LinearNDInterpolator(T, psf[0].ravel(), fill_value=0.0)
-        weights = np.zeros((len(ifux), len(self.wave)))
+        return self.build_weights_many([xc], [yc], [ifux], [ifuy], psf)[0]
+
+    def build_weights_many(self, xc, yc, ifux, ifuy, psf):
+        """
+        Build weight matrices for many sources sharing the same PSF in
+        a single interpolation call. The fiber offsets for every source
+        and every wavelength are evaluated at once.
+
+        Parameters
+        ----------
+        xc: list or numpy array
+            The ifu x-coordinate for the center of each source
+        yc: list or numpy array
+            The ifu y-coordinate for the center of each source
+        ifux: list of numpy arrays
+            The ifu x-coordinate for each fiber of each source
+        ifuy: list of numpy arrays
+            The ifu y-coordinate for each fiber of each source
+        psf: numpy 3d array
+            zeroth dimension: psf image, xgrid, ygrid
+
+        Returns
+        -------
+        weights_list: list of numpy 2d arrays
+            Weights (len of fibers by wavelength dimension) for each source
+        """
+        nfib = [np.size(x) for x in ifux]
+
+        if np.sum(nfib) == 0:
+            return [np.zeros((n, len(self.wave))) for n in nfib]
+
+        xc_fib = np.repeat(np.asarray(xc, dtype=float), nfib)
+        yc_fib = np.repeat(np.asarray(yc, dtype=float), nfib)
+        x_fib = np.concatenate([np.asarray(x, dtype=float) for x in ifux])
+        y_fib = np.concatenate([np.asarray(y, dtype=float) for y in ifuy])
+
+        dx = (x_fib - xc_fib)[:, np.newaxis] - self.ADRx[np.newaxis, :]
+        dy = (y_fib - yc_fib)[:, np.newaxis] - self.ADRy[np.newaxis, :]
+
         scale = np.abs(psf[1][0, 1] - psf[1][0, 0])
         area = 0.75 ** 2 * np.pi
-        for i in np.arange(len(self.wave)):
-            S[:, 0] = ifux - self.ADRx[i] - xc
-            S[:, 1] = ifuy - self.ADRy[i] - yc
-            weights[:, i] = I(S[:, 0], S[:, 1]) * area / scale ** 2
 
-        return weights
+        weights = self.get_psf_interpolator(psf)(dx, dy) * area / scale ** 2
+
+        return np.split(weights, np.cumsum(nfib)[:-1])
 
     def get_spectrum(self, data, error, mask, weights):
         """
@@ -855,4 +1373,4 @@ class Extract:
         Close open shot h5 file if open
         """
         if self.shoth5 is not None:
-            self.shoth5.close()
+            close_shot_file(self.shoth5)
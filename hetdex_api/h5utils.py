@@ -0,0 +1,52 @@
+# -*- coding: utf-8 -*-
+"""
+
+Helpers for reading rows of pytables Tables.
+
+Created on 2026/10/18
+
+"""
+
+import numpy as np
+
+
+def read_rows(table, idx, field=None, max_span_factor=4):
+    """
+    Read a set of rows (or one column of them) from a pytables Table
+    in a single pass
+
+    Parameters
+    ----------
+    table
+        a pytables Table
+    idx
+        array of row indices, any shape
+    field
+        column name. If given only this column is read and a plain
+        array of its values is returned. Default is whole rows
+    max_span_factor
+        if the indices are clustered so that their span is at most
+        max_span_factor times the number of rows, a single contiguous
+        read is done instead of a coordinate read
+
+    Returns
+    -------
+    rows
+        numpy structured array of the rows, or array of the column
+        values if field is given, in the order and shape of idx
+    """
+    idx = np.asarray(idx, dtype=np.int64)
+
+    if np.size(idx) == 0:
+        return table.read(0, 0, field=field)
+
+    uniq, inverse = np.unique(idx, return_inverse=True)
+    start = uniq[0]
+    stop = uniq[-1] + 1
+
+    if (stop - start) <= max_span_factor * np.size(uniq):
+        rows = table.read(start, stop, field=field)[uniq - start]
+    else:
+        rows = table.read_coordinates(uniq, field=field)
+
+    return rows[inverse.reshape(np.shape(idx))]
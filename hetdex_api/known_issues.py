@@ -0,0 +1,373 @@
+# -*- coding: utf-8 -*-
+"""
+
+Compiled known issues lists for masking HETDEX detections.
+
+The bad detection, bad shot, bad amp, bad pixel and meteor lists of a
+data release are read once and compiled into plain numpy arrays that
+are cached on disk as an .npz file. The cache file name holds a hash
+of the paths, sizes and modification times of the source lists, so
+any update of a list triggers a recompile. Masks are then computed
+with np.isin, sorted key lookups and vectorized range checks.
+
+Each rule has a bit in the combined bitmask returned by
+KnownIssues.get_bitmask()
+
+BAD_DETECT  1   detectid in config.baddetect
+BAD_SHOT    2   shotid in config.badshot
+BAD_AMP     4   amp flagged 0 in config.badamp or in a date range of
+                config.badamp2
+BAD_PIX     8   inside a bad pixel box of config.badpix
+METEOR     16   on a meteor streak of config.meteor
+
+Examples
+--------
+
+>>> from hetdex_api.known_issues import get_known_issues, BAD_AMP
+>>> issues = get_known_issues('hdr2.1')
+>>> bitmask = issues.get_bitmask(detects.detectid, detects.shotid)
+
+or for a Detections object
+
+>>> bitmask = detects.get_known_issues_flags()
+>>> bad_amp = (bitmask & BAD_AMP) > 0
+
+Created on 2026/10/18
+
+"""
+
+import os
+import os.path as op
+import hashlib
+import json
+import warnings
+
+import numpy as np
+from astropy.table import Table
+from astropy.io import ascii
+import astropy.units as u
+
+from hetdex_api.config import HDRconfig
+from hetdex_api.mask import get_amp_keys, meteor_flags_from_radec
+
+BAD_DETECT = 1
+BAD_SHOT = 2
+BAD_AMP = 4
+BAD_PIX = 8
+METEOR = 16
+
+ISSUE_BITS = {
+    "bad_detect": BAD_DETECT,
+    "bad_shot": BAD_SHOT,
+    "bad_amp": BAD_AMP,
+    "bad_pix": BAD_PIX,
+    "meteor": METEOR,
+}
+
+# bump when the compiled layout changes
+CACHE_VERSION = 2
+
+CACHE_DIR = os.environ.get(
+    "HETDEX_CACHE_DIR", op.join(op.expanduser("~"), ".cache", "hetdex_api")
+)
+
+# KnownIssues objects of this process, keyed by survey
+_known_issues = {}
+
+
+def get_source_files(config):
+    """
+    Known issues lists of a data release. The bad amp table is only
+    used if it is the amp_flag.fits table of hdr2.1 and later
+    """
+    sources = {}
+    for name in ["baddetect", "badshot", "badamp", "badamp2", "badpix", "meteor"]:
+        path = getattr(config, name, None)
+        if path is None:
+            continue
+        if name == "badamp" and not path.endswith(".fits"):
+            continue
+        sources[name] = path
+    return sources
+
+
+def get_cache_key(sources):
+    """ Hash of the paths, sizes and modification times of the lists """
+    stamp = [CACHE_VERSION]
+    for name in sorted(sources):
+        path = sources[name]
+        try:
+            st = os.stat(path)
+            stamp.append([name, op.abspath(path), st.st_size, st.st_mtime_ns])
+        except OSError:
+            stamp.append([name, op.abspath(path), None, None])
+
+    return hashlib.sha1(json.dumps(stamp).encode()).hexdigest()[:16]
+
+
+def compile_known_issues(sources):
+    """
+    Read the known issues lists into a dictionary of numpy arrays.
+    Missing lists compile to empty arrays, KnownIssues refuses to use
+    them
+
+    Parameters
+    ----------
+    sources
+        dictionary of list name to path as from get_source_files()
+
+    Returns
+    -------
+    arrays
+        dictionary of numpy arrays
+    """
+    arrays = {
+        "baddetect": np.zeros(0, dtype=np.int64),
+        "badshot": np.zeros(0, dtype=np.int64),
+        "amp_keys": np.zeros(0, dtype="U1"),
+        "amp_multiframe": np.zeros(0, dtype="U1"),
+        "amp_date_start": np.zeros(0, dtype=np.int64),
+        "amp_date_end": np.zeros(0, dtype=np.int64),
+        "pix_multiframe": np.zeros(0, dtype="U1"),
+        "pix_lo": np.zeros((0, 2)),
+        "pix_hi": np.zeros((0, 2)),
+        "meteor_shotid": np.zeros(0, dtype=np.int64),
+        "meteor_a": np.zeros(0),
+        "meteor_b": np.zeros(0),
+    }
+
+    def exists(name):
+        return name in sources and op.exists(sources[name])
+
+    if exists("baddetect"):
+        arrays["baddetect"] = np.unique(
+            np.atleast_1d(np.loadtxt(sources["baddetect"], dtype=np.int64))
+        )
+
+    if exists("badshot"):
+        arrays["badshot"] = np.unique(
+            np.atleast_1d(np.loadtxt(sources["badshot"], dtype=np.int64))
+        )
+
+    if exists("badamp"):
+        badamps = Table.read(sources["badamp"])
+        bad = np.asarray(badamps["flag"]) == 0
+        arrays["amp_keys"] = np.unique(
+            get_amp_keys(badamps["shotid"][bad], badamps["multiframe"][bad])
+        )
+
+    if exists("badamp2"):
+        badamps2 = Table.read(sources["badamp2"], format="ascii")
+        arrays["amp_multiframe"] = np.asarray(badamps2["multiframe"]).astype(str)
+        arrays["amp_date_start"] = np.asarray(badamps2["date_start"], dtype=np.int64)
+        arrays["amp_date_end"] = np.asarray(badamps2["date_end"], dtype=np.int64)
+
+    if exists("badpix"):
+        badpix = ascii.read(sources["badpix"], names=["multiframe", "x1", "x2", "y1", "y2"])
+        arrays["pix_multiframe"] = np.asarray(badpix["multiframe"]).astype(str)
+        arrays["pix_lo"] = np.column_stack([badpix["x1"], badpix["y1"]]).astype(float)
+        arrays["pix_hi"] = np.column_stack([badpix["x2"], badpix["y2"]]).astype(float)
+
+    if exists("meteor"):
+        met_tab = Table.read(sources["meteor"], format="ascii")
+        arrays["meteor_shotid"] = np.asarray(met_tab["shotid"], dtype=np.int64)
+        arrays["meteor_a"] = np.asarray(met_tab["a"], dtype=float)
+        arrays["meteor_b"] = np.asarray(met_tab["b"], dtype=float)
+
+    return arrays
+
+
+def in_ranges(keys, values, range_keys, lo, hi):
+    """
+    Find the inputs that fall in any range with the same key
+
+    Parameters
+    ----------
+    keys
+        array of N keys, eg. the multiframe of each detection
+    values
+        array of N values, or (N, D) array for boxes
+    range_keys
+        array of M range keys
+    lo, hi
+        arrays of M (or (M, D)) inclusive range limits
+
+    Returns
+    -------
+    inside
+        boolean array of N
+    """
+    keys = np.asarray(keys)
+    values = np.asarray(values, dtype=float).reshape(np.size(keys), -1)
+    inside = np.zeros(np.size(keys), dtype=bool)
+
+    if np.size(range_keys) == 0 or np.size(keys) == 0:
+        return inside
+
+    sorter = np.argsort(range_keys, kind="stable")
+    range_keys = np.asarray(range_keys)[sorter]
+    lo = np.asarray(lo, dtype=float).reshape(np.size(range_keys), -1)[sorter]
+    hi = np.asarray(hi, dtype=float).reshape(np.size(range_keys), -1)[sorter]
+
+    # ranges sharing the key of each input are range_keys[start:stop]
+    start = np.searchsorted(range_keys, keys, side="left")
+    stop = np.searchsorted(range_keys, keys, side="right")
+
+    # one pass per range of the most flagged key
+    for j in range(int(np.max(stop - start))):
+        sel = np.where(start + j < stop)[0]
+        r = start[sel] + j
+        inside[sel] |= np.all((values[sel] >= lo[r]) & (values[sel] <= hi[r]), axis=1)
+
+    return inside
+
+
+class KnownIssues:
+    def __init__(self, survey=HDRconfig.LATEST_HDR_NAME, cache_dir=CACHE_DIR,
+                 rebuild=False, sources=None):
+        """
+        Load the compiled known issues lists of a data release,
+        compiling them first if the cache is missing or out of date
+
+        Parameters
+        ----------
+        survey
+            data release, eg. 'hdr2.1'
+        cache_dir
+            directory of the compiled .npz files. If it can not be
+            written the lists are compiled in memory only
+        rebuild
+            recompile even if an up to date cache exists
+        sources
+            optional dictionary of list name to path to use instead
+            of the lists in HDRconfig, see get_source_files()
+
+        Lists that are configured but missing on disk are not cached
+        and the rules that need them raise FileNotFoundError
+        """
+        self.survey = survey.lower()
+
+        if sources is None:
+            self.sources = get_source_files(HDRconfig(survey=self.survey))
+        else:
+            self.sources = sources
+        self.filename = op.join(
+            cache_dir,
+            "known_issues_%s_%s.npz" % (self.survey, get_cache_key(self.sources)),
+        )
+
+        self.missing = sorted(
+            name for name, path in self.sources.items() if not op.exists(path)
+        )
+
+        if op.exists(self.filename) and not rebuild and not self.missing:
+            with np.load(self.filename, allow_pickle=False) as data:
+                self.arrays = {name: data[name] for name in data.files}
+        else:
+            self.arrays = compile_known_issues(self.sources)
+            if self.missing:
+                warnings.warn(
+                    "Known issues lists not found: "
+                    + ", ".join(self.sources[name] for name in self.missing)
+                )
+            else:
+                self.save()
+
+    def require(self, *names):
+        """ Raise FileNotFoundError if a configured list is missing """
+        for name in names:
+            if name in self.missing:
+                raise FileNotFoundError(
+                    "%s list %s not found" % (name, self.sources[name])
+                )
+
+    def save(self):
+        """ Write the compiled lists to the cache, if possible """
+        try:
+            os.makedirs(op.dirname(self.filename), exist_ok=True)
+            tmpfile = self.filename + ".%i.tmp.npz" % os.getpid()
+            np.savez(tmpfile, **self.arrays)
+            os.replace(tmpfile, self.filename)
+        except OSError:
+            pass
+
+    def bad_detect(self, detectid):
+        """ True for detectids in the bad detection list """
+        self.require("baddetect")
+        return np.isin(detectid, self.arrays["baddetect"])
+
+    def bad_shot(self, shotid):
+        """ True for shots in the bad shot list """
+        self.require("badshot")
+        return np.isin(shotid, self.arrays["badshot"])
+
+    def bad_amp(self, shotid, multiframe, date):
+        """
+        True for amps flagged 0 in the amp flag table of their shot or
+        listed as bad at their date in the bad amp list. Amps missing
+        from the amp flag table are not flagged
+        """
+        self.require("badamp", "badamp2")
+        flagged = np.isin(get_amp_keys(shotid, multiframe), self.arrays["amp_keys"])
+        flagged |= in_ranges(
+            np.asarray(multiframe).astype(str),
+            date,
+            self.arrays["amp_multiframe"],
+            self.arrays["amp_date_start"],
+            self.arrays["amp_date_end"],
+        )
+        return flagged
+
+    def bad_pix(self, multiframe, x, y):
+        """ True for positions inside a bad pixel box of their amp """
+        self.require("badpix")
+        return in_ranges(
+            np.asarray(multiframe).astype(str),
+            np.column_stack([x, y]),
+            self.arrays["pix_multiframe"],
+            self.arrays["pix_lo"],
+            self.arrays["pix_hi"],
+        )
+
+    def meteor(self, ra, dec, shotid, streaksize=12.0 * u.arcsec):
+        """ True for positions on a meteor streak of their shot """
+        self.require("meteor")
+        met_tab = {
+            "shotid": self.arrays["meteor_shotid"],
+            "a": self.arrays["meteor_a"],
+            "b": self.arrays["meteor_b"],
+        }
+        return ~meteor_flags_from_radec(ra, dec, shotid, met_tab, streaksize=streaksize)
+
+    def get_bitmask(self, detectid, shotid, multiframe=None, date=None,
+                    x_raw=None, y_raw=None, ra=None, dec=None):
+        """
+        Combined bitmask of the rules that flag each row. Rules whose
+        inputs are not given are skipped
+
+        Returns
+        -------
+        bitmask
+            integer array, 0 for rows without known issues. See
+            ISSUE_BITS for the meaning of each bit
+        """
+        bitmask = np.zeros(np.size(detectid), dtype=np.int32)
+
+        bitmask[self.bad_detect(detectid)] |= BAD_DETECT
+        bitmask[self.bad_shot(shotid)] |= BAD_SHOT
+        if multiframe is not None and date is not None:
+            bitmask[self.bad_amp(shotid, multiframe, date)] |= BAD_AMP
+        if multiframe is not None and x_raw is not None and y_raw is not None:
+            bitmask[self.bad_pix(multiframe, x_raw, y_raw)] |= BAD_PIX
+        if ra is not None and dec is not None:
+            bitmask[self.meteor(ra, dec, shotid)] |= METEOR
+
+        return bitmask
+
+
+def get_known_issues(survey=HDRconfig.LATEST_HDR_NAME):
+    """ KnownIssues of a data release, loaded once per process """
+    survey = survey.lower()
+    if survey not in _known_issues:
+        _known_issues[survey] = KnownIssues(survey)
+    return _known_issues[survey]
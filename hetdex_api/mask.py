@@ -22,9 +22,12 @@ from astropy import wcs
 from regions import EllipseSkyRegion, EllipsePixelRegion
 
 from hetdex_api.config import HDRconfig
-from hetdex_api.survey import FiberIndex
+from hetdex_api.survey import FiberIndex, match_index
+from hetdex_api.spatial_index import SkyKDTree, radec_to_xyz, angular_separation
+
+# meteor tables read by get_meteor_table(), keyed by file name
+_meteor_tables = {}
 
-config = HDRconfig()
 
 def amp_flag_from_coords(coords, FibIndex, bad_amps_table, radius=3.*u.arcsec, shotid=None):
     """
@@ -169,7 +172,91 @@ def amp_flag_from_closest_fiber(coords, FibIndex, bad_amps_table,
         
     return flag
 
-    
+
+def get_amp_keys(shotid, multiframe):
+    """ String keys joining a shotid and a multiframe for amp lookups """
+    return np.char.add(
+        np.asarray(shotid).astype(np.int64).astype(str),
+        np.asarray(multiframe).astype(str),
+    )
+
+
+def get_amp_flag_index(bad_amps_table):
+    """
+    Sorted lookup of the bad amp table by (shotid, multiframe) for
+    amp_flags_from_fiberids(). Build it once and reuse it
+
+    Parameters
+    ----------
+    bad_amps_table
+        astropy table containing the bad amp flag values. This can
+        be retrieved from config.badamp
+
+    Returns
+    -------
+    amp_index
+        tuple of the table keys, their sort order and the flags
+    """
+    keys = get_amp_keys(bad_amps_table['shotid'], bad_amps_table['multiframe'])
+    sorter = np.argsort(keys, kind='stable')
+    flags = np.asarray(bad_amps_table['flag']).astype(bool)
+
+    return keys, sorter, flags
+
+
+def amp_flags_from_fiberids(fiberids, amp_index):
+    """
+    Vectorized amp_flag_from_fiberid() for an array of fiberids
+
+    Parameters
+    ----------
+    fiberids
+        array of fiber_id strings
+    amp_index
+        lookup returned by get_amp_flag_index()
+
+    Returns
+    -------
+    flags
+        boolean array, True if the amp of the fiber is usable. Amps
+        missing from the table are not flagged, as in
+        KnownIssues.bad_amp()
+    """
+    keys, sorter, flags = amp_index
+
+    fiber_keys = np.array(
+        [f[0:11] + f[14:34] for f in np.atleast_1d(fiberids).astype(str)],
+        dtype=keys.dtype,
+    )
+    idx = match_index(fiber_keys, keys, sorter=sorter)
+
+    good = np.ones(np.shape(idx), dtype=bool)
+    hit = idx >= 0
+    good[hit] = flags[idx[hit]]
+
+    return good
+
+
+def get_meteor_table(filename=None):
+    """
+    Returns the meteor table from config.meteor. It is read once per
+    process and filename
+
+    Parameters
+    ----------
+    filename
+        meteor list to read. Defaults to config.meteor of the
+        latest data release
+    """
+    if filename is None:
+        filename = HDRconfig().meteor
+
+    if filename not in _meteor_tables:
+        _meteor_tables[filename] = Table.read(filename, format='ascii')
+
+    return _meteor_tables[filename]
+
+
 def meteor_flag_from_coords(coords, shotid=None, streaksize=12.*u.arcsec):
     """
     Returns a boolean flag value to mask out meteors
@@ -197,33 +284,154 @@ def meteor_flag_from_coords(coords, shotid=None, streaksize=12.*u.arcsec):
     
     """
 
-    global config
+    met_tab = get_meteor_table()
+
+    ra = np.atleast_1d(coords.ra.deg)
+    dec = np.atleast_1d(coords.dec.deg)
+
+    if shotid is None:
+        # test the positions against the streaks of every shot
+        flags = [
+            meteor_flags_from_radec(ra, dec, shot, met_tab, streaksize=streaksize)
+            for shot in np.unique(met_tab['shotid'])
+        ]
+        return bool(np.all(flags))
 
-    # meteors are found with +/- X arcsec of the line DEC=a+RA*b in this file
+    return bool(np.all(
+        meteor_flags_from_radec(ra, dec, shotid, met_tab, streaksize=streaksize)
+    ))
 
-    met_tab = Table.read(config.meteor, format='ascii')
-    sel_shot = met_tab['shotid'] == shotid
 
-    if np.sum(sel_shot) > 0:
-        a = met_tab['a'][sel_shot]
-        b = met_tab['b'][sel_shot]
+def great_circle_segment_distance(ra, dec, ra1, dec1, ra2, dec2):
+    """
+    Angular distance of positions to the great circle segment between
+    (ra1, dec1) and (ra2, dec2) from the closed form cross-track and
+    along-track angles. Positions beyond the ends of the segment get
+    the distance to the closest end
 
-        ra_met = coords.ra + np.arange(-180, 180, 0.1)*u.arcsec
-        dec_met = (a + ra_met.deg*b ) * u.deg
+    Parameters
+    ----------
+    ra, dec
+        arrays of positions in degrees
+    ra1, dec1, ra2, dec2
+        segment ends in degrees
 
-        met_coords = SkyCoord(ra=ra_met, dec=dec_met)
+    Returns
+    -------
+    dist
+        array of distances in degrees
+    """
+    p = radec_to_xyz(ra, dec)
+    p1 = radec_to_xyz(ra1, dec1)[0]
+    p2 = radec_to_xyz(ra2, dec2)[0]
 
-        meteor_match = met_coords.separation(coords) < streaksize
+    # pole of the great circle through the segment
+    n = np.cross(p1, p2)
+    n /= np.linalg.norm(n)
 
-        
-        if np.any(meteor_match):
-            flag = False
-        else:
-            flag = True
-    else:
-        flag = True
+    cross_track = np.arcsin(np.clip(p @ n, -1., 1.))
 
-    return flag
+    # angle from p1 along the track of the projection of p
+    along_track = np.arctan2(np.cross(p1, p) @ n, p @ p1)
+    length = np.arctan2(np.linalg.norm(np.cross(p1, p2)), p1 @ p2)
+
+    on_segment = (along_track >= 0.) & (along_track <= length)
+
+    dist_end = np.minimum(
+        angular_separation(ra, dec, ra1, dec1), angular_separation(ra, dec, ra2, dec2)
+    )
+
+    return np.where(on_segment, np.rad2deg(np.abs(cross_track)), dist_end)
+
+
+def meteor_distance(ra, dec, a, b, halflength=180.*u.arcsec):
+    """
+    Distance of positions to the meteor track DEC = a + RA*b. The track
+    covers halflength in RA beyond the smallest and largest RA of the
+    positions, the +/- halflength RA range searched around each
+    position by the original sampled search. It is followed by great
+    circle segments no longer than 2*halflength in RA, so the curvature
+    of the fitted line across a shot is kept
+
+    Parameters
+    ----------
+    ra, dec
+        arrays of positions in degrees, eg. all positions in a shot
+    a, b
+        meteor track parameters from the config.meteor table
+    halflength
+        RA range searched on either side of the positions
+
+    Returns
+    -------
+    dist
+        array of distances in degrees
+    """
+    ra = np.atleast_1d(np.asarray(ra, dtype=float))
+    dec = np.atleast_1d(np.asarray(dec, dtype=float))
+
+    if np.size(ra) == 0:
+        return np.zeros(0)
+
+    halflength = halflength.to_value(u.deg)
+
+    # unwrap RA around the first position for shots crossing RA=0
+    ra_unwrap = ra[0] + (ra - ra[0] + 180.) % 360. - 180.
+    ra1 = np.min(ra_unwrap) - halflength
+    ra2 = np.max(ra_unwrap) + halflength
+
+    nseg = int(np.ceil((ra2 - ra1) / (2. * halflength)))
+    ra_node = np.linspace(ra1, ra2, nseg + 1)
+    dec_node = a + b * (ra_node % 360.)
+
+    dist = np.full(np.size(ra), np.inf)
+    for k in range(nseg):
+        dist = np.minimum(dist, great_circle_segment_distance(
+            ra, dec, ra_node[k], dec_node[k], ra_node[k + 1], dec_node[k + 1]
+        ))
+
+    return dist
+
+
+def meteor_flags_from_radec(ra, dec, shotid, met_tab=None, streaksize=12.*u.arcsec):
+    """
+    Vectorized meteor_flag_from_coords() for arrays of positions. The
+    positions are grouped by shot and each shot with a meteor is
+    flagged in one pass per streak
+
+    Parameters
+    ----------
+    ra, dec
+        arrays of positions in degrees
+    shotid
+        shotid of each position, or a single shotid for all
+    met_tab
+        the meteor table from config.meteor. Defaults to
+        get_meteor_table()
+    streaksize
+        how far off the meteor streak to mask out
+
+    Returns
+    -------
+    flags
+        boolean array, True if no meteor falls on the position
+    """
+    if met_tab is None:
+        met_tab = get_meteor_table()
+
+    ra = np.atleast_1d(np.asarray(ra, dtype=float))
+    dec = np.atleast_1d(np.asarray(dec, dtype=float))
+    shotid = np.broadcast_to(np.asarray(shotid, dtype=np.int64), ra.shape)
+
+    flags = np.ones(ra.shape, dtype=bool)
+
+    met_shotid = np.asarray(met_tab['shotid'], dtype=np.int64)
+    for i in np.where(np.isin(met_shotid, shotid))[0]:
+        sel = shotid == met_shotid[i]
+        dist = meteor_distance(ra[sel], dec[sel], met_tab['a'][i], met_tab['b'][i])
+        flags[sel] &= dist >= streaksize.to_value(u.deg)
+
+    return flags
 
 
 def create_gal_ellipse(galaxy_cat, row_index=None, pgcname=None, d25scale=3.):
@@ -286,7 +494,7 @@ def create_dummy_wcs(coords, pixscale=0.5*u.arcsec, imsize=60.*u.arcmin):
     ra_cen = coords.ra.deg
     dec_cen = coords.dec.deg
     
-    ndim = np.int(2 * gridsize / gridstep + 1)
+    ndim = int(2 * gridsize / gridstep + 1)
     center = ndim / 2
     w = wcs.WCS(naxis=2)
     w.wcs.crval = [ra_cen, dec_cen]
@@ -345,3 +553,90 @@ def gal_flag_from_coords(coords, galaxy_cat, d25scale=3., nmatches=1):
             flag = True
 
     return flag
+
+
+def get_galaxy_index(galaxy_cat):
+    """
+    Positions, shapes and a spatial index of a galaxy catalog for
+    gal_flags_from_radec(). Build it once and reuse it
+
+    Parameters
+    ----------
+    galaxy_cat
+        an astropy table containing the large galaxy parameters as
+        in gal_flag_from_coords()
+
+    Returns
+    -------
+    galaxy_index
+        dictionary of the SkyKDTree, positions in degrees, axes in
+        arcmin and position angles in degrees of the galaxies
+    """
+    gal_coords = SkyCoord(galaxy_cat['Coords'])
+
+    return {
+        'tree': SkyKDTree(gal_coords.ra.deg, gal_coords.dec.deg),
+        'ra': gal_coords.ra.deg,
+        'dec': gal_coords.dec.deg,
+        'major': np.asarray(galaxy_cat['SemiMajorAxis'], dtype=float),
+        'minor': np.asarray(galaxy_cat['SemiMinorAxis'], dtype=float),
+        'pa': np.asarray(galaxy_cat['PositionAngle'], dtype=float),
+    }
+
+
+def gal_flags_from_radec(ra, dec, galaxy_index, d25scale=3., nmatches=1):
+    """
+    Vectorized gal_flag_from_coords() for arrays of positions. Each
+    position is tested against the analytic ellipses of its nmatches
+    closest galaxies in the tangent plane of the galaxy instead of
+    through a WCS and a region object
+
+    Parameters
+    ----------
+    ra, dec
+        arrays of positions in degrees
+    galaxy_index
+        dictionary returned by get_galaxy_index()
+    d25scale
+        The scaling of ellipses as in gal_flag_from_coords()
+    nmatches
+        the closest nmatches are searched for
+
+    Returns
+    -------
+    flags
+        boolean array, True if the position lies within an ellipse
+    """
+    ra = np.atleast_1d(np.asarray(ra, dtype=float))
+    dec = np.atleast_1d(np.asarray(dec, dtype=float))
+
+    nmatches = min(nmatches, len(galaxy_index['tree']))
+    sep, idx = galaxy_index['tree'].query_nearest(ra, dec, k=nmatches)
+    idx = np.reshape(idx, (np.size(ra), nmatches))
+
+    ra0 = galaxy_index['ra'][idx]
+    dec0 = np.deg2rad(galaxy_index['dec'][idx])
+    dra = np.deg2rad(ra[:, None] - ra0)
+    decr = np.deg2rad(dec)[:, None]
+
+    # gnomonic offsets east and north of the galaxy in arcmin
+    cosc = np.sin(dec0) * np.sin(decr) + np.cos(dec0) * np.cos(decr) * np.cos(dra)
+    east = np.cos(decr) * np.sin(dra) / cosc
+    north = (np.cos(dec0) * np.sin(decr)
+             - np.sin(dec0) * np.cos(decr) * np.cos(dra)) / cosc
+    east = np.rad2deg(east) * 60.
+    north = np.rad2deg(north) * 60.
+
+    # the major axis lies at the position angle east of north. The
+    # axes are used as full lengths, as in create_gal_ellipse()
+    pa = np.deg2rad(galaxy_index['pa'][idx])
+    along = east * np.sin(pa) + north * np.cos(pa)
+    across = east * np.cos(pa) - north * np.sin(pa)
+    semimajor = 0.5 * d25scale * galaxy_index['major'][idx]
+    semiminor = 0.5 * d25scale * galaxy_index['minor'][idx]
+
+    inside = (cosc > 0) & (
+        (along / semimajor) ** 2 + (across / semiminor) ** 2 <= 1.
+    )
+
+    return np.any(inside, axis=1)
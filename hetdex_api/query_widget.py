@@ -33,6 +33,7 @@ import plotly.graph_objects as go
 from hetdex_api.shot import *
 from hetdex_api.config import HDRconfig
 from hetdex_tools.get_spec import get_spectra
+from hetdex_tools import get_spec_server
 
 from astroquery.sdss import SDSS
 from elixer import catalogs
@@ -298,7 +299,17 @@ class QueryWidget:
         self.bottombox.clear_output()
 
         with self.bottombox:
-            self.spec_table = get_spectra(self.marker_tab["coord"], survey=self.survey)
+            self.spec_table = None
+            # use a running get_spec_server if there is one for this survey
+            if get_spec_server.server_available():
+                try:
+                    self.spec_table = get_spec_server.get_spectra(
+                        self.marker_tab["coord"], survey=self.survey
+                    )
+                except RuntimeError:
+                    pass
+            if self.spec_table is None:
+                self.spec_table = get_spectra(self.marker_tab["coord"], survey=self.survey)
 
         # set up tabs for plotting
         ID_list = np.unique(self.spec_table["ID"])
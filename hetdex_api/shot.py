@@ -11,19 +11,34 @@ import os.path as op
 import re
 import tables as tb
 import numpy as np
+from numpy.lib import recfunctions as rfn
 
 import warnings
 import sys
+from collections import OrderedDict
 
 from astropy.table import Table
 import astropy.units as u
 from astropy.coordinates import SkyCoord
+from scipy.spatial import cKDTree
 
 from hetdex_api.config import HDRconfig
+from hetdex_api.spatial_index import SkyKDTree, to_degrees, angular_separation
+from hetdex_api.h5utils import read_rows
 
 if not sys.warnoptions:
     warnings.simplefilter("ignore")
 
+# shared ShotPool used by open_shot_file() once enable_shot_pool() is called
+_shot_pool = None
+
+# memory budget in MB for amp images kept by read_amp_image()
+AMP_IMAGE_CACHE_MB = 512
+
+_amp_image_cache = OrderedDict()
+_amp_image_cache_nbytes = 0
+_images_row_index = {}
+
     
 def open_shot_file(shotid, survey="hdr2.1"):
     """
@@ -51,8 +66,21 @@ def open_shot_file(shotid, survey="hdr2.1"):
 
     >>> fileh = open_shot_file('20180123v009')
 
+    If a ShotPool has been turned on with enable_shot_pool() the shared
+    handle from the pool is returned. Release it with close_shot_file()
+    rather than fileh.close().
+
     """
+    if _shot_pool is not None:
+        return _shot_pool.get_file(shotid, survey=survey)
 
+    return _open_shot_file(shotid, survey=survey)
+
+
+def _open_shot_file(shotid, survey="hdr2.1"):
+    """
+    Open a new read-only handle to a shot H5 file
+    """
     global config
     config = HDRconfig(survey=survey.lower())
 
@@ -66,8 +94,543 @@ def open_shot_file(shotid, survey="hdr2.1"):
     return fileh
 
 
+def read_fibers_in_region(table, coords, radius):
+    """
+    Return the rows of a shot Fibers table within radius of each
+    coordinate. Candidate rows in an ra/dec box around each coordinate
+    are found with in-kernel queries that use the CS index on ra, then
+    all candidates are read in a single pass and cut with the exact
+    angular separation.
+
+    Parameters
+    ----------
+    table
+        a pytables Table, e.g. fileh.root.Data.Fibers
+    coords
+        astropy SkyCoord object (scalar or array)
+    radius
+        an astropy quantity object or radius in arcsec
+
+    Returns
+    -------
+    rows_list
+        list of numpy structured arrays, one per coordinate
+    """
+    ra_obj = np.atleast_1d(coords.ra.deg)
+    dec_obj = np.atleast_1d(coords.dec.deg)
+    rad = to_degrees(radius)
+
+    idx_list = []
+    for ra_i, dec_i in zip(ra_obj, dec_obj):
+        dec_lo = dec_i - rad
+        dec_hi = dec_i + rad
+
+        if np.abs(dec_i) + rad < 90.0:
+            ra_half = rad / np.cos(np.deg2rad(np.abs(dec_i) + rad))
+        else:
+            # the circle contains a pole
+            ra_half = 180.0
+        ra_lo = ra_i - ra_half
+        ra_hi = ra_i + ra_half
+
+        if ra_half >= 180.0:
+            # every RA is inside the box
+            ra_lo = -1.0
+            ra_hi = 361.0
+            ra_cond = "(ra > ra_lo) & (ra < ra_hi)"
+        elif ra_lo < 0.0:
+            ra_lo += 360.0
+            ra_cond = "((ra > ra_lo) | (ra < ra_hi))"
+        elif ra_hi > 360.0:
+            ra_hi -= 360.0
+            ra_cond = "((ra > ra_lo) | (ra < ra_hi))"
+        else:
+            ra_cond = "(ra > ra_lo) & (ra < ra_hi)"
+
+        idx_list.append(
+            np.sort(
+                table.get_where_list(
+                    ra_cond + " & (dec > dec_lo) & (dec < dec_hi)",
+                    condvars={
+                        "ra": table.cols.ra,
+                        "dec": table.cols.dec,
+                        "ra_lo": ra_lo,
+                        "ra_hi": ra_hi,
+                        "dec_lo": dec_lo,
+                        "dec_hi": dec_hi,
+                    },
+                )
+            )
+        )
+
+    rows_list = read_fiber_rows_many(table, idx_list)
+
+    return [
+        rows[angular_separation(ra_i, dec_i, rows["ra"], rows["dec"]) < rad]
+        for ra_i, dec_i, rows in zip(ra_obj, dec_obj, rows_list)
+    ]
+
+
+def get_datevobs(shotid):
+    """
+    Return the datevobs string (eg. '20180123v009') for an integer shotid
+    or datevobs
+    """
+    if re.search("v", str(shotid)):
+        return str(shotid)
+    return str(shotid)[0:8] + "v" + str(shotid)[8:11]
+
+
+class ShotPool:
+    def __init__(self, max_files=16, max_memory_mb=4000):
+        """
+        LRU pool of open shot H5 files and Fibers objects keyed by
+        (survey, datevobs). Handles are opened read-only and shared by
+        every caller, so a shot that is used many times in a session is
+        opened once.
+
+        Every handle given out by get_file() or get_fibers() is counted
+        until it is released with close_shot_file() (or Fibers.close()).
+        Only handles without outstanding references are evicted, so
+        handles still held by Extract, Fibers or widget objects stay
+        open, and the pool may hold more than max_files until they are
+        released.
+
+        Parameters
+        ----------
+        max_files
+            maximum number of open shot files. When a file is evicted
+            its Fibers object is dropped and the handle is closed
+        max_memory_mb
+            memory budget in MB for the arrays held by pooled Fibers
+            objects. The least recently used Fibers are dropped first
+        """
+        self.max_files = max_files
+        self.max_memory_mb = max_memory_mb
+
+        self.files = OrderedDict()
+        self.fibers = OrderedDict()
+
+        # outstanding references per handle, keyed by the handle itself
+        # so an entry cannot be inherited by a new handle that reuses the
+        # id of a closed one. Entries are dropped when a file is closed
+        self.refs = {}
+
+        self.file_hits = 0
+        self.file_misses = 0
+        self.fibers_hits = 0
+        self.fibers_misses = 0
+
+    def get_file(self, shotid, survey="hdr2.1"):
+        """
+        Return the shared read-only handle for a shot
+        """
+        key = (survey.lower(), get_datevobs(shotid))
+
+        if key in self.files and self.files[key].isopen:
+            self.file_hits += 1
+            self.files.move_to_end(key)
+        else:
+            self.file_misses += 1
+            if key in self.files:
+                self.refs.pop(self.files.pop(key), None)
+                self.fibers.pop(key, None)
+            self.files[key] = _open_shot_file(shotid, survey=survey)
+            self.refs[self.files[key]] = 0
+
+        fileh = self.files[key]
+        self.refs[fileh] += 1
+
+        self.trim()
+
+        return fileh
+
+    def release(self, fileh):
+        """
+        Release one reference to a pooled handle and evict files above
+        max_files that are no longer referenced
+        """
+        if self.refs.get(fileh, 0) > 0:
+            self.refs[fileh] -= 1
+        self.trim()
+
+    def external_refs(self, key):
+        """
+        References to the handle of key held outside the pool. The
+        pooled Fibers object of a shot holds one reference itself
+        """
+        fileh = self.files[key]
+        internal = 1 if key in self.fibers and self.fibers[key].hdfile is fileh else 0
+        return self.refs.get(fileh, 0) - internal
+
+    def trim(self):
+        """
+        Close the least recently used unreferenced files until at most
+        max_files are open
+        """
+        while len(self.files) > self.max_files:
+            unused = [key for key in self.files if self.external_refs(key) <= 0]
+            if len(unused) == 0:
+                break
+            fileh = self.files.pop(unused[0])
+            self.fibers.pop(unused[0], None)
+            self.refs.pop(fileh, None)
+            fileh.close()
+
+    def get_fibers(self, shotid, survey="hdr2.1"):
+        """
+        Return a cached lazy Fibers object for a shot
+        """
+        key = (survey.lower(), get_datevobs(shotid))
+
+        if key in self.fibers and self.fibers[key].hdfile.isopen:
+            self.fibers_hits += 1
+            self.fibers.move_to_end(key)
+        else:
+            self.fibers_misses += 1
+            if key in self.fibers:
+                self.release(self.fibers.pop(key).hdfile)
+            # the reference taken here is the pool's own
+            self.fibers[key] = Fibers(shotid, survey=survey, lazy=True)
+
+        fibers = self.fibers[key]
+
+        # the caller's reference, released by fibers.close()
+        self.refs[fibers.hdfile] += 1
+
+        # lazy columns grow after they are handed out so the budget
+        # is checked on every call
+        while len(self.fibers) > 1 and self.get_memory() > self.max_memory_mb * 1e6:
+            old_key, old_fibers = self.fibers.popitem(last=False)
+            self.release(old_fibers.hdfile)
+
+        return fibers
+
+    def get_memory(self):
+        """
+        Approximate number of bytes held by the pooled Fibers objects
+        """
+        nbytes = 0
+        for fibers in self.fibers.values():
+            for value in fibers.__dict__.values():
+                if isinstance(value, np.ndarray):
+                    nbytes += value.nbytes
+            if fibers._tree is not None:
+                nbytes += 2 * fibers._tree.xyz.nbytes
+        return nbytes
+
+    def owns(self, fileh):
+        """
+        True if fileh is one of the pooled handles
+        """
+        return fileh in self.refs
+
+    def stats(self):
+        """
+        Return a dictionary of hit/miss counts and current pool size
+        """
+        return {
+            "file_hits": self.file_hits,
+            "file_misses": self.file_misses,
+            "fibers_hits": self.fibers_hits,
+            "fibers_misses": self.fibers_misses,
+            "open_files": len(self.files),
+            "referenced_files": sum(
+                1 for key in self.files if self.external_refs(key) > 0
+            ),
+            "fibers": len(self.fibers),
+            "memory_mb": self.get_memory() / 1e6,
+        }
+
+    def close(self):
+        """
+        Drop all Fibers objects and close every pooled file
+        """
+        self.fibers.clear()
+        for fileh in self.files.values():
+            fileh.close()
+        self.files.clear()
+        self.refs.clear()
+
+
+def enable_shot_pool(max_files=16, max_memory_mb=4000):
+    """
+    Turn on a process-wide ShotPool. open_shot_file(), get_shot_fibers()
+    and the functions built on them (get_fibers_table,
+    get_image2D_cutout, get_image2D_amp, Extract.load_shot...) then
+    share open handles and Fibers objects instead of reopening shots.
+
+    Returns
+    -------
+    the ShotPool object
+    """
+    global _shot_pool
+
+    if _shot_pool is None:
+        _shot_pool = ShotPool(max_files=max_files, max_memory_mb=max_memory_mb)
+    else:
+        _shot_pool.max_files = max_files
+        _shot_pool.max_memory_mb = max_memory_mb
+
+    return _shot_pool
+
+
+def disable_shot_pool():
+    """
+    Close every pooled handle and go back to opening a new handle per call
+    """
+    global _shot_pool
+
+    if _shot_pool is not None:
+        _shot_pool.close()
+    _shot_pool = None
+
+
+def get_shot_pool():
+    """
+    Return the active ShotPool or None
+    """
+    return _shot_pool
+
+
+def close_shot_file(fileh):
+    """
+    Close a handle from open_shot_file(). For pooled handles this
+    releases the caller's reference and the pool closes the file once
+    it is evicted and no longer referenced
+    """
+    if _shot_pool is not None and _shot_pool.owns(fileh):
+        _shot_pool.release(fileh)
+        return
+    fileh.close()
+
+
+def get_shot_fibers(shot, survey="hdr2.1"):
+    """
+    Return a lazy Fibers object for a shot, shared through the ShotPool
+    if one is enabled. Call fibers.close() when done with it
+    """
+    if _shot_pool is not None:
+        return _shot_pool.get_fibers(shot, survey=survey)
+    return Fibers(shot, survey=survey, lazy=True)
+
+
+def get_images_row_index(fileh):
+    """
+    Return a dictionary mapping (multiframe, expnum) to the row of the
+    Data.Images table. It is built once per shot file from the small
+    multiframe and expnum columns only
+
+    Parameters
+    ----------
+    fileh
+        an open shot HDF5 file
+    """
+    filename = fileh.filename
+
+    if filename not in _images_row_index:
+        images = fileh.root.Data.Images
+        multiframe = images.col("multiframe").astype(str)
+        expnum = images.col("expnum")
+        _images_row_index[filename] = {
+            (mf, int(exp)): row
+            for row, (mf, exp) in enumerate(zip(multiframe, expnum))
+        }
+
+    return _images_row_index[filename]
+
+
+def read_amp_image(fileh, multiframe=None, expnum=1, imtype="clean_image", row=None):
+    """
+    Return a single 1032x1032 amp image from the Data.Images table.
+    Only the requested imtype column of one row is read and the decoded
+    image is kept in an LRU cache (AMP_IMAGE_CACHE_MB) so that repeated
+    cutouts from the same amp do not read the file again.
+
+    Parameters
+    ----------
+    fileh
+        an open shot HDF5 file
+    multiframe
+        amp multiframe ID
+    expnum
+        dither exposure number [1,2,3]
+    imtype
+        'clean_image', 'image' or 'error'
+    row
+        row of the Images table. Use instead of multiframe/expnum
+
+    Returns
+    -------
+    a read-only 2D numpy array
+    """
+    global _amp_image_cache_nbytes
+
+    if row is None:
+        if isinstance(multiframe, bytes):
+            multiframe = multiframe.decode()
+        row = get_images_row_index(fileh)[(multiframe, int(expnum))]
+
+    key = (fileh.filename, int(row), imtype)
+
+    try:
+        _amp_image_cache.move_to_end(key)
+        return _amp_image_cache[key]
+    except KeyError:
+        pass
+
+    im = fileh.root.Data.Images.read(row, row + 1, field=imtype)[0]
+    im.flags.writeable = False
+
+    _amp_image_cache[key] = im
+    _amp_image_cache_nbytes += im.nbytes
+
+    while _amp_image_cache_nbytes > AMP_IMAGE_CACHE_MB * 1e6 and len(_amp_image_cache) > 1:
+        _, old = _amp_image_cache.popitem(last=False)
+        _amp_image_cache_nbytes -= old.nbytes
+
+    return im
+
+
+def clear_amp_image_cache():
+    """
+    Empty the amp image cache and the Images row indexes
+    """
+    global _amp_image_cache_nbytes
+
+    _amp_image_cache.clear()
+    _amp_image_cache_nbytes = 0
+    _images_row_index.clear()
+
+
+def read_fiber_rows(table, idx, fields=None, max_span_factor=4):
+    """
+    Read a set of rows from a fiber table in a single pass and return
+    only the requested fields. Reading every needed column at once
+    decompresses each HDF5 chunk once instead of once per column.
+
+    Parameters
+    ----------
+    table
+        a pytables Table, e.g. fileh.root.Data.Fibers
+    idx
+        array of row indices
+    fields
+        list of column names to keep. Default is all columns
+    max_span_factor
+        if the indices are clustered so that their span is at most
+        max_span_factor times the number of rows, a single contiguous
+        read is done instead of a coordinate read
+
+    Returns
+    -------
+    rows
+        numpy structured array of the rows in the order of idx
+    """
+    rows = read_rows(table, idx, max_span_factor=max_span_factor)
+
+    if fields is not None:
+        rows = rfn.repack_fields(rows[list(fields)])
+
+    return rows
+
+
+def read_fiber_rows_many(table, idx_list, fields=None, max_span_factor=4):
+    """
+    Read the rows for several index sets (eg. one per source) in a
+    single pass of read_fiber_rows()
+
+    Returns
+    -------
+    rows_list
+        list of numpy structured arrays, one per index set
+    """
+    idx_list = [np.asarray(idx, dtype=np.int64) for idx in idx_list]
+
+    if len(idx_list) == 0:
+        return []
+
+    uniq = np.unique(np.concatenate(idx_list))
+    rows = read_fiber_rows(table, uniq, fields=fields, max_span_factor=max_span_factor)
+
+    return [rows[np.searchsorted(uniq, idx)] for idx in idx_list]
+
+
+def match_string_dtype(value, array):
+    """
+    Return value encoded to bytes if array holds fixed-width byte
+    strings, so that str inputs can be compared with columns that were
+    not decoded to unicode
+    """
+    if isinstance(value, str) and np.asarray(array).dtype.kind == "S":
+        return value.encode()
+    return value
+
+
+def get_ifu_footprint(shotid, survey="hdr2.1"):
+    """
+    Return the fplane table (ifuslot, fpx, fpy, ...) of the IFUs
+    installed for a shot, stored in the Astrometry group of the shot
+    file. Returns None if the shot file has no fplane table
+    """
+    fileh = open_shot_file(shotid, survey=survey)
+    try:
+        fplane = fileh.root.Astrometry.fplane.read()
+    except tb.NoSuchNodeError:
+        fplane = None
+    close_shot_file(fileh)
+    return fplane
+
+
+def in_ifu_footprint(ra, dec, ra0, dec0, pa, fplane, halfsize=25.0):
+    """
+    Boolean mask of the positions that fall on an IFU of a shot.
+
+    Positions are projected onto the tangent plane of the shot centre
+    rotated by the shot PA, with the same convention as the IFU masks
+    in hetdex_api.mask_tools.generate_sky_masks, and compared to square
+    IFUs centred on the fplane positions
+
+    Parameters
+    ----------
+    ra, dec
+        arrays of positions in degrees
+    ra0, dec0
+        shot centre in degrees
+    pa
+        shot position angle in degrees
+    fplane
+        fplane table from get_ifu_footprint
+    halfsize
+        half the side of an IFU in arcsec. Increase it to keep
+        positions near the IFU edges
+
+    Returns
+    -------
+    numpy boolean array
+    """
+    from astropy import wcs
+
+    w = wcs.WCS(naxis=2)
+    w.wcs.crpix = [0.0, 0.0]
+    w.wcs.cdelt = [-1.0 / 3600.0, 1.0 / 3600.0]
+    w.wcs.crval = [ra0, dec0]
+    w.wcs.ctype = ["RA---TAN", "DEC--TAN"]
+    rrot = np.deg2rad(360.0 - (pa + 90.0))
+    w.wcs.pc = [[np.cos(rrot), np.sin(rrot)], [-1.0 * np.sin(rrot), np.cos(rrot)]]
+
+    x, y = w.wcs_world2pix(np.atleast_1d(ra), np.atleast_1d(dec), 1)
+
+    # fplane x/y run along the tangent plane y/x axes
+    ifu_xy = np.column_stack([fplane["fpy"], fplane["fpx"]])
+    dist, _ = cKDTree(ifu_xy).query(
+        np.column_stack([x, y]), p=np.inf, distance_upper_bound=halfsize
+    )
+    return np.isfinite(dist)
+
+
 class Fibers:
-    def __init__(self, shot, survey="hdr2.1"):
+    def __init__(self, shot, survey="hdr2.1", lazy=False, columns=None, unicode=True):
         """
         Initialize Fibers Class
 
@@ -88,6 +651,17 @@ class Fibers:
         survey
             Data release you would like to load, i.e., 'HDR1', 'hdr2', 'hdr2.1'
             This is case insensitive.
+        lazy
+            If True only ra and dec (plus any listed in columns) are read
+            on initialization. Every other FiberIndex column is read the
+            first time it is accessed and the coords SkyCoord is only built
+            if it is used. Positional queries use the KD-tree on ra/dec.
+        columns
+            list of extra columns to read up front in lazy mode
+        unicode
+            String columns are decoded to str, as in eager mode. In lazy
+            mode pass unicode=False to keep them as fixed-width bytes,
+            which is faster to read and smaller in memory
 
         Attributes
         ----------
@@ -106,8 +680,25 @@ class Fibers:
 
         self.table = self.hdfile.root.Data.Fibers
 
+        self.lazy = lazy
+        self.unicode = unicode
+        self.wave_rect = 2.0 * np.arange(1036) + 3470.0
+
+        # spatial index is built on the first positional query
+        self._tree = None
+
         # Grab attributes from FiberIndex table if survey!='hdr1'
 
+        if survey == "hdr1":
+            self._index_table = self.hdfile.root.Data.Fibers
+        else:
+            self._index_table = self.hdfile.root.Data.FiberIndex
+
+        if lazy:
+            for name in ["ra", "dec"] + list(columns or []):
+                setattr(self, name, self._read_column(name))
+            return
+
         if survey == "hdr1":
             colnames = self.hdfile.root.Data.Fibers.colnames
             for name in colnames:
@@ -148,7 +739,47 @@ class Fibers:
         self.coords = SkyCoord(
             self.ra[:] * u.degree, self.dec[:] * u.degree, frame="icrs",
         )
-        self.wave_rect = 2.0 * np.arange(1036) + 3470.0
+
+    def __getattr__(self, name):
+        """
+        In lazy mode read a FiberIndex column, or build coords, the
+        first time it is accessed. The value is stored on the object so
+        this is only called once per attribute
+        """
+        if name.startswith("_") or not self.__dict__.get("lazy", False):
+            raise AttributeError("'Fibers' object has no attribute '{}'".format(name))
+
+        if name == "coords":
+            self.coords = SkyCoord(
+                self.ra[:] * u.degree, self.dec[:] * u.degree, frame="icrs",
+            )
+        elif name in self._index_table.colnames:
+            setattr(self, name, self._read_column(name))
+        else:
+            raise AttributeError("'Fibers' object has no attribute '{}'".format(name))
+
+        return self.__dict__[name]
+
+    def _read_column(self, name):
+        """
+        Read a column of the fiber index table, decoding byte strings
+        unless lazy mode was asked to keep them with unicode=False
+        """
+        data = self._index_table.col(name)
+
+        if data.dtype.kind == "S" and (self.unicode or not self.lazy):
+            data = data.astype(str)
+
+        return data
+
+    def get_tree(self):
+        """
+        Returns a unit-vector KD-tree of the fiber positions. It is
+        built on the first call and reused for all later queries.
+        """
+        if self._tree is None:
+            self._tree = SkyKDTree(self.ra, self.dec)
+        return self._tree
 
     def query_region(self, coords, radius=3.0 / 3600.0):
         """
@@ -164,9 +795,9 @@ class Fibers:
             radius in degrees
         """
 
-        idx = coords.separation(self.coords) < radius * u.degree
+        idx = self.query_region_idx(coords, radius=radius * u.degree)
 
-        return self.table[idx]
+        return self.table.read_coordinates(idx)
 
     def query_region_idx(self, coords, radius=3.0):
         """
@@ -177,11 +808,28 @@ class Fibers:
         coords - astropy coordinate object
         radius - astropy quantity object or value in arcsec
         """
-        try:
-            idx = coords.separation(self.coords) < radius
-        except:
-            idx = coords.separation(self.coords) < radius * u.arcsec
-        return np.where(idx)[0]
+        return self.query_region_idx_many(coords, radius=radius)[0]
+
+    def query_region_idx_many(self, coords, radius=3.0):
+        """
+        Returns a list of fiber indices for each coordinate in
+        a SkyCoord array using a single batched KD-tree search
+
+        Parameters
+        ----------
+        coords
+            astropy coordinate object (scalar or array)
+        radius
+            astropy quantity object or value in arcsec
+
+        Returns
+        -------
+        idx_list
+            list of sorted index arrays, one per input coordinate
+        """
+        rad_deg = to_degrees(radius, default_unit=u.arcsec)
+
+        return self.get_tree().query_radius(coords.ra.deg, coords.dec.deg, rad_deg)
 
     def get_closest_fiber(self, coords, exp=None):
         """
@@ -198,7 +846,9 @@ class Fibers:
             sel = self.expnum = exp
             fib_idx = coords.match_to_catalog_sky(self.coords[sel])[0]
         else:
-            fib_idx = coords.match_to_catalog_sky(self.coords)[0]
+            sep, fib_idx = self.get_tree().query_nearest(coords.ra.deg, coords.dec.deg)
+            if coords.isscalar:
+                fib_idx = fib_idx[0]
         return fib_idx
 
     def get_image_xy(self, idx, wave_obj):
@@ -285,7 +935,7 @@ class Fibers:
 
     def close(self):
         """ Close the H5 file related to the Fibers call"""
-        self.hdfile.close()
+        close_shot_file(self.hdfile)
 
     def get_fib_image2D(
         self,
@@ -330,15 +980,17 @@ class Fibers:
         """
 
         if fiber_id:
-            idx = np.where(self.fiber_id == fiber_id)[0][0]
+            fiber_id_obj = match_string_dtype(fiber_id, self.fiber_id)
+            idx = np.where(self.fiber_id == fiber_id_obj)[0][0]
             shotid = int(fiber_id[0:11])
             expnum_obj = int(fiber_id[12:13])
             multiframe_obj = fiber_id[14:34]
             fibnum_obj = int(fiber_id[35:39])
         else:
+            multiframe_cmp = match_string_dtype(multiframe_obj, self.multiframe)
             idx = np.where(
                 (self.fibidx == (fibnum_obj - 1))
-                * (self.multiframe == multiframe_obj)
+                * (self.multiframe == multiframe_cmp)
                 * (self.expnum == expnum_obj)
             )[0][0]
         if np.size(idx) > 1:
@@ -352,8 +1004,8 @@ class Fibers:
 
         x, y = self.get_image_xy(idx, wave_obj)
 
-        im0 = self.hdfile.root.Data.Images.read_where(
-            "(multiframe == multiframe_obj) & (expnum == expnum_obj)"
+        im0 = read_amp_image(
+            self.hdfile, multiframe=multiframe_obj, expnum=expnum_obj, imtype=imtype
         )
 
         # create image of forced dims of input width x height
@@ -394,7 +1046,7 @@ class Fibers:
             x1_slice = 0
             x2_slice = height
 
-        im_reg = im0[imtype][0][x1:x2, y1:y2]
+        im_reg = im0[x1:x2, y1:y2]
 
         im_base[x1_slice:x2_slice, y1_slice:y2_slice] = im_reg
 
@@ -429,9 +1081,10 @@ def get_fibers_table(
     shot
         either shotid or datevobs
     coords
-        astropy coordinate object
+        astropy coordinate object. For hdr2 and later this can be an
+        array of coordinates, which are all queried in a single pass
     radius
-        an astropy quantity object or radius in degrees
+        an astropy quantity object or radius in arcsec
     astropy
         flag to make it an astropy table
     survey
@@ -440,7 +1093,8 @@ def get_fibers_table(
     Returns
     -------
     A table of fibers within the defined aperture. Will be an astropy table
-    object if astropy=True is set
+    object if astropy=True is set. For an array of coordinates a list with
+    one table (or None) per coordinate is returned
 
     """
 
@@ -483,17 +1137,24 @@ def get_fibers_table(
 
     else:
 
-        # use FiberIndex table to find fiber_ids
-        fiberindex = Fibers(shot, survey=survey)
-        fibers_table = fiberindex.query_region(coords, radius=rad_in.value)
+        # in-kernel range query on the indexed ra column
+        rows_list = read_fibers_in_region(fibers, coords, radius)
 
-        if np.size(fibers_table) > 0:
-            if astropy:
-                fibers_table = Table(fibers_table)
+        fibers_tables = []
+        for rows in rows_list:
+            if np.size(rows) > 0:
+                if astropy:
+                    rows = Table(rows)
+                fibers_tables.append(rows)
+            else:
+                fibers_tables.append(None)
+
+        if coords.isscalar:
+            fibers_table = fibers_tables[0]
         else:
-            fibers_table = None
+            fibers_table = fibers_tables
 
-    fileh.close()
+    close_shot_file(fileh)
     return fibers_table
 
 
@@ -528,21 +1189,22 @@ def get_image2D_cutout(
     -------
     
     """
-    fibers = Fibers(shot)
+    fibers = get_shot_fibers(shot, survey=survey)
 
     idx = fibers.get_closest_fiber(coords)
     multiframe_obj = fibers.table.cols.multiframe[idx].astype(str)
     expnum_obj = fibers.table.cols.expnum[idx]
     x, y = fibers.get_image_xy(idx, wave_obj)
 
-    im0 = fibers.hdfile.root.Data.Images.read_where(
-        "(multiframe == multiframe_obj) & (expnum == expnum_obj)"
+    im0 = read_amp_image(
+        fibers.hdfile, multiframe=multiframe_obj, expnum=expnum_obj, imtype=imtype
     )
+    fibers.close()
 
-    return im0[imtype][0][
+    return im0[
         x - int(np.floor(height / 2)): x + int(np.ceil(height / 2)),
         y - int(np.floor(width / 2)): y + int(np.ceil(width / 2)),
-    ]
+    ].copy()
 
 
 def get_image2D_amp(
@@ -586,34 +1248,35 @@ def get_image2D_amp(
 
     _expnum = expnum
 
+    row = None
+
     if multiframe:
-        _multiframe = multiframe
-        im0 = fileh.root.Data.Images.read_where(
-            "(multiframe == _multiframe) & (expnum == _expnum)"
-        )
+        row = get_images_row_index(fileh)[(multiframe, int(expnum))]
     elif specid:
         _specid = specid
 
         if amp:
             _amp = amp
-            im0 = fileh.root.Data.Images.read_where(
+            row = fileh.root.Data.Images.get_where_list(
                 "(specid == _specid) & (amp == _amp) & (expnum == _expnum)"
-            )
+            )[0]
         else:
             print("You must provide both specid and amp")
     elif ifuslot:
         _ifuslot = ifuslot
         if amp:
             _amp = amp
-            im0 = fileh.root.Data.Images.read_where(
+            row = fileh.root.Data.Images.get_where_list(
                 "(ifuslot == _ifuslot) & (amp == _amp) & (expnum == _expnum)"
-            )
+            )[0]
         else:
             print("You must provide both ifuslot and amp")
 
     else:
         print("You need to provide a multiframe or specid/amp or ifuslot/amp")
 
-    fileh.close()
+    im = read_amp_image(fileh, imtype=imtype, row=row).copy()
+
+    close_shot_file(fileh)
 
-    return im0[imtype][0]
+    return im
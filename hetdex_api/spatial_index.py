@@ -0,0 +1,198 @@
+# -*- coding: utf-8 -*-
+"""
+
+Spatial indexing tools for fast positional queries on the sky.
+
+RA/DEC positions are converted to cartesian unit vectors so that an
+angular radius maps onto a fixed chord length. A scipy cKDTree built
+on those vectors then answers cone searches and nearest neighbour
+queries in O(log N) instead of computing a separation to every
+position.
+
+Created on 2026/10/18
+
+"""
+
+import numpy as np
+from scipy.spatial import cKDTree
+import astropy.units as u
+
+
+def radec_to_xyz(ra, dec):
+    """
+    Convert RA/DEC in degrees to an (N, 3) array of unit vectors
+
+    Parameters
+    ----------
+    ra
+        right ascension in degrees (scalar or array)
+    dec
+        declination in degrees (scalar or array)
+
+    Returns
+    -------
+    xyz
+        numpy array of shape (N, 3)
+    """
+    ra_rad = np.deg2rad(np.atleast_1d(np.asarray(ra, dtype=np.float64)))
+    dec_rad = np.deg2rad(np.atleast_1d(np.asarray(dec, dtype=np.float64)))
+    cos_dec = np.cos(dec_rad)
+
+    return np.column_stack(
+        [cos_dec * np.cos(ra_rad), cos_dec * np.sin(ra_rad), np.sin(dec_rad)]
+    )
+
+
+def coords_to_xyz(coords):
+    """
+    Convert an astropy SkyCoord object (scalar or array) to unit vectors
+    """
+    return radec_to_xyz(coords.ra.deg, coords.dec.deg)
+
+
+def angle_to_chord(angle):
+    """
+    Convert an angular separation to the chord length between two
+    unit vectors
+
+    Parameters
+    ----------
+    angle
+        an astropy angle quantity or a value in degrees
+    """
+    try:
+        angle_rad = angle.to(u.rad).value
+    except AttributeError:
+        angle_rad = np.deg2rad(angle)
+    return 2.0 * np.sin(0.5 * np.minimum(angle_rad, np.pi))
+
+
+def chord_to_angle(chord):
+    """
+    Convert a chord length between two unit vectors to an angular
+    separation in degrees
+    """
+    return np.rad2deg(2.0 * np.arcsin(np.clip(0.5 * np.asarray(chord), 0.0, 1.0)))
+
+
+def to_degrees(radius, default_unit=u.arcsec):
+    """
+    Return a radius in degrees from either an astropy quantity or a
+    value assumed to be in default_unit
+    """
+    try:
+        return radius.to(u.deg).value
+    except AttributeError:
+        return (radius * default_unit).to(u.deg).value
+
+
+def angular_separation(ra1, dec1, ra2, dec2):
+    """
+    Angular separation in degrees between positions given in degrees,
+    computed with the haversine formula. Inputs broadcast against each
+    other so one centre can be compared to an array of positions
+    """
+    ra1, dec1, ra2, dec2 = map(np.deg2rad, (ra1, dec1, ra2, dec2))
+    hav = np.sin(0.5 * (dec2 - dec1)) ** 2 + np.cos(dec1) * np.cos(dec2) * np.sin(
+        0.5 * (ra2 - ra1)
+    ) ** 2
+    return np.rad2deg(2.0 * np.arcsin(np.sqrt(np.clip(hav, 0.0, 1.0))))
+
+
+class SkyKDTree:
+    def __init__(self, ra, dec):
+        """
+        Initialize a unit-vector KD-tree for a set of sky positions
+
+        Parameters
+        ----------
+        ra
+            array of right ascension values in degrees
+        dec
+            array of declination values in degrees
+        """
+        self.xyz = radec_to_xyz(ra, dec)
+        self.tree = cKDTree(self.xyz)
+
+    def __len__(self):
+        return self.xyz.shape[0]
+
+    def query_radius(self, ra, dec, radius):
+        """
+        Return the indices of all positions within radius of each input
+        position
+
+        Parameters
+        ----------
+        ra
+            right ascension of the search centre(s) in degrees
+        dec
+            declination of the search centre(s) in degrees
+        radius
+            search radius. An astropy quantity or a value in degrees
+
+        Returns
+        -------
+        idx_list
+            list (one entry per input position) of sorted integer arrays
+        """
+        xyz = radec_to_xyz(ra, dec)
+        chord = angle_to_chord(radius)
+        matches = self.tree.query_ball_point(xyz, chord)
+        return [np.sort(np.asarray(m, dtype=np.int64)) for m in matches]
+
+    def query_nearest(self, ra, dec, k=1, max_radius=None):
+        """
+        Return the k nearest positions to each input position
+
+        Parameters
+        ----------
+        ra
+            right ascension of the search centre(s) in degrees
+        dec
+            declination of the search centre(s) in degrees
+        k
+            number of neighbours to return
+        max_radius
+            optional maximum separation. An astropy quantity or a value
+            in degrees. Missing neighbours get an index equal to the
+            number of positions in the tree and an infinite separation
+
+        Returns
+        -------
+        sep
+            separation in degrees
+        idx
+            index of the neighbour(s)
+        """
+        xyz = radec_to_xyz(ra, dec)
+        if max_radius is None:
+            upper = np.inf
+        else:
+            upper = angle_to_chord(max_radius)
+        chord, idx = self.tree.query(xyz, k=k, distance_upper_bound=upper)
+        sep = np.full(np.shape(chord), np.inf)
+        found = np.isfinite(chord)
+        sep[found] = chord_to_angle(chord[found])
+        return sep, idx
+
+    def query_tree(self, other, radius):
+        """
+        Return the indices in this tree within radius of every position
+        in another SkyKDTree
+
+        Parameters
+        ----------
+        other
+            a SkyKDTree object
+        radius
+            search radius. An astropy quantity or a value in degrees
+
+        Returns
+        -------
+        idx_list
+            list (one entry per position in other) of sorted integer arrays
+        """
+        chord = angle_to_chord(radius)
+        matches = other.tree.query_ball_tree(self.tree, chord)
+        return [np.sort(np.asarray(m, dtype=np.int64)) for m in matches]
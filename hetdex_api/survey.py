@@ -11,6 +11,8 @@ Created on Tue Jan 22 11:02:53 2019
 """
 from __future__ import print_function
 
+import os.path as op
+import json
 import numpy as np
 import tables as tb
 import numpy
@@ -21,6 +23,7 @@ from astropy.table import Table, vstack
 
 import healpy as hp
 from hetdex_api.config import HDRconfig
+from hetdex_api.spatial_index import SkyKDTree, angular_separation
 
 try:
     LATEST_HDR_NAME = HDRconfig.LATEST_HDR_NAME
@@ -28,6 +31,48 @@ except Exception as e:
     print("Warning! Cannot find or import HDRconfig from hetdex_api!!", e)
     LATEST_HDR_NAME = "hdr2.1"
 
+# files written by h5tools/create_fiber_index_sidecar.py alongside the
+# per-column .npy files of the memory-mapped FiberIndex sidecar
+SIDECAR_OFFSETS = "healpix_offsets.npy"
+SIDECAR_INFO = "sidecar_info.json"
+
+
+def match_index(values, keys, sorter=None):
+    """
+    Find the row of keys matching each value with a sort/searchsorted
+    join, O(N log N) instead of one np.where per key
+
+    Parameters
+    ----------
+    values
+        array of values to look up, eg. the shotid of each detection
+    keys
+        array of keys to match against, eg. Survey.shotid. If a key is
+        repeated the first occurrence is used
+    sorter
+        optional np.argsort(keys, kind="stable"), to reuse when the
+        same keys are matched many times
+
+    Returns
+    -------
+    idx
+        index into keys for each value, -1 where there is no match
+    """
+    keys = np.asarray(keys)
+    values = np.asarray(values)
+
+    if sorter is None:
+        sorter = np.argsort(keys, kind="stable")
+
+    if np.size(keys) == 0:
+        return np.full(np.shape(values), -1, dtype=np.int64)
+
+    pos = np.searchsorted(keys, values, sorter=sorter)
+    idx = sorter[np.clip(pos, 0, np.size(keys) - 1)]
+    idx = np.where(keys[idx] == values, idx, -1)
+
+    return idx
+
 
 class Survey:
     def __init__(self, survey=LATEST_HDR_NAME):
@@ -48,6 +93,7 @@ class Survey:
         global config
         config = HDRconfig(survey=survey.lower())
 
+        self.survey = survey.lower()
         self.filename = config.surveyh5
         self.hdfile = tb.open_file(self.filename, mode="r")
         colnames = self.hdfile.root.Survey.colnames
@@ -79,18 +125,11 @@ class Survey:
                 format="ascii",
                 names=["datevobs", "col2", "fluxlimit_4540"],
             )
-            fluxlimit = []
-            for datevobs in self.datevobs:
-                sel = flim["datevobs"] == datevobs
-                if np.sum(sel) == 1:
-                    fluxlimit.extend(flim["fluxlimit_4540"][sel])
-                elif np.sum(sel) > 1:
-                    print("Found two fluxlimits for ", datevobs)
-                    fluxlimit.extend(flim["fluxlimit_4540"][sel][0])
-                else:
-                    fluxlimit.append(np.nan)
+            idx = match_index(self.datevobs, flim["datevobs"])
+            fluxlimit = np.full(np.size(self.datevobs), np.nan)
+            fluxlimit[idx >= 0] = flim["fluxlimit_4540"][idx[idx >= 0]]
 
-            self.fluxlimit_4540 = np.array(fluxlimit)
+            self.fluxlimit_4540 = fluxlimit
 
     def __getitem__(self, indx):
         """ 
@@ -106,6 +145,8 @@ class Survey:
         p = copy.copy(self)
         attrnames = self.__dict__.keys()
         for attrname in attrnames:
+            if isinstance(getattr(self, attrname), str):
+                continue
             try:
                 setattr(p, attrname, getattr(self, attrname)[indx])
             except:
@@ -217,6 +258,68 @@ class Survey:
 
         return self.shotid[idx]
 
+    def get_shot_matches(self, coords, max_sep=11.0 * u.arcmin, footprint=False,
+                         halfsize=25.0):
+        """
+        Find the shots covering each of a set of coordinates in one
+        vectorized call. The input positions are put in a unit-vector
+        KD-tree that is searched around every shot centre.
+
+        Parameters
+        ----------
+        self
+            Survey Class object
+        coords
+            astropy SkyCoord object of the sources
+        max_sep
+            radius around each shot centre. An astropy quantity. The
+            default covers the full VIRUS field of view
+        footprint
+            if True, also drop the sources that fall outside the IFUs
+            of each shot (see hetdex_api.shot.in_ifu_footprint). Shots
+            without an fplane table keep all of their sources
+        halfsize
+            half the side of an IFU in arcsec used for footprint
+
+        Returns
+        -------
+        matched_sources
+            dictionary of shotid to the array of indices in coords of
+            the sources in that shot, in survey order. Shots without
+            sources are left out
+
+        Examples
+        --------
+        S = Survey('hdr2.1')
+        matched_sources = S.get_shot_matches(coords)
+        """
+        if footprint:
+            from hetdex_api.shot import get_ifu_footprint, in_ifu_footprint
+
+        ra = np.atleast_1d(coords.ra.deg)
+        dec = np.atleast_1d(coords.dec.deg)
+
+        tree = SkyKDTree(ra, dec)
+        idx_list = tree.query_radius(self.ra, self.dec, max_sep)
+
+        matched_sources = {}
+        for i, idx in enumerate(idx_list):
+            if np.size(idx) == 0:
+                continue
+            shotid = self.shotid[i]
+            if footprint:
+                fplane = get_ifu_footprint(shotid, survey=self.survey)
+                if fplane is not None:
+                    idx = idx[
+                        in_ifu_footprint(ra[idx], dec[idx], self.ra[i], self.dec[i],
+                                         self.pa[i], fplane, halfsize=halfsize)
+                    ]
+                if np.size(idx) == 0:
+                    continue
+            matched_sources[shotid] = idx
+
+        return matched_sources
+
     def return_astropy_table(self, return_good=True):
         """
         Function to return an astropy table that is machine readable
@@ -271,7 +374,8 @@ class Survey:
 
 
 class FiberIndex:
-    def __init__(self, survey=LATEST_HDR_NAME, loadall=False):
+    def __init__(self, survey=LATEST_HDR_NAME, loadall=False, memmap=False,
+                 sidecar=None):
         """
         Initialize the Fiber class for a given data release
         
@@ -280,6 +384,16 @@ class FiberIndex:
         survey : string
             Data release you would like to load, i.e., 'hdr1','HDR2'
             This is case insensitive.
+        loadall : bool
+            read every column of the FiberIndex table into memory
+        memmap : bool
+            open the columnar sidecar written by
+            h5tools/create_fiber_index_sidecar.py instead of the HDF5
+            file. Columns are memory-mapped read-only so only the pages
+            touched by a query are read and they are shared between
+            processes. No SkyCoord object is built in this mode
+        sidecar : string
+            sidecar directory. Defaults to config.fiberindex_sidecar
 
         Returns
         -------
@@ -294,6 +408,27 @@ class FiberIndex:
         global config
         config = HDRconfig(survey=survey.lower())
 
+        self.memmap = memmap
+
+        if memmap:
+            self.hdfile = None
+            if sidecar is None:
+                self.filename = config.fiberindex_sidecar
+            else:
+                self.filename = sidecar
+
+            with open(op.join(self.filename, SIDECAR_INFO), "r") as f:
+                self.colnames = json.load(f)["colnames"]
+
+            self.hp_offsets = np.load(op.join(self.filename, SIDECAR_OFFSETS))
+
+            for name in self.colnames:
+                setattr(
+                    self, name, np.load(op.join(self.filename, name + ".npy"),
+                                        mmap_mode="r")
+                )
+            return
+
         self.filename = config.fiberindexh5
         self.hdfile = tb.open_file(self.filename, mode="r")
 
@@ -340,37 +475,117 @@ class FiberIndex:
         -------
         An astropy table of Fiber infomation in queried aperture
         """
+        return self.query_region_many(coords, radius=radius, shotid=shotid)[0]
+
+    def query_region_many(self, coords, radius=3.0 * u.arcsec, shotid=None):
+        """
+        Retrieve the fibers around many coordinates in one pass. The
+        healpix pixels of all search discs are merged into contiguous
+        runs and each run is read once from the CS index on healpix
+        (or sliced from the memory-mapped sidecar)
+
+        Parameters
+        ----------
+        self
+            the FiberIndex class for a specific survey
+        coords
+            astropy SkyCoord object (scalar or array) of the centers
+        radius
+            radius you want to search. An astropy quantity object
+        shotid
+            Specific shotid (dtype=int) you want
+
+        Returns
+        -------
+        list of astropy tables, one per input coordinate, of the Fiber
+        infomation in each aperture
+        """
 
         Nside = 2 ** 15
 
-        ra_obj = coords.ra.deg
-        dec_obj = coords.dec.deg
+        ra_obj = np.atleast_1d(coords.ra.deg)
+        dec_obj = np.atleast_1d(coords.dec.deg)
+        radius_deg = radius.to(u.degree).value
 
-        ra_sep = radius.to(u.degree).value + 3.0 / 3600.0
+        ra_sep = radius_deg + 3.0 / 3600.0
 
-        vec = hp.ang2vec(ra_obj, dec_obj, lonlat=True)
+        vec = hp.ang2vec(ra_obj, dec_obj, lonlat=True).reshape(-1, 3)
 
-        pix_region = hp.query_disc(Nside, vec, (ra_sep * np.pi / 180))
+        pix_list = [np.sort(hp.query_disc(Nside, v, (ra_sep * np.pi / 180))) for v in vec]
 
-        seltab = Table()
-        for hpix in pix_region:
-            if shotid:
-                h_tab = self.get_fib_from_hp(hpix, shotid=shotid)
+        rows = self.read_hp_pixels(np.concatenate(pix_list), shotid=shotid)
+
+        # candidate rows sorted by healpix so each disc is a set of slices
+        rows = rows[np.argsort(rows["healpix"], kind="stable")]
+
+        tables = []
+        for ra_i, dec_i, pix in zip(ra_obj, dec_obj, pix_list):
+            lo = np.searchsorted(rows["healpix"], pix, side="left")
+            hi = np.searchsorted(rows["healpix"], pix, side="right")
+            sel = np.concatenate(
+                [np.arange(a, b) for a, b in zip(lo, hi)] + [np.zeros(0, dtype=int)]
+            )
+            cand = rows[sel]
+            sep = angular_separation(ra_i, dec_i, cand["ra"], cand["dec"])
+            tables.append(Table(cand[sep < radius_deg]))
+
+        return tables
+
+    def read_hp_pixels(self, pixels, shotid=None):
+        """
+        Read all FiberIndex rows in a set of healpix pixels. Pixels are
+        merged into runs of consecutive values and each run is read in a
+        single range query
+
+        Parameters
+        ----------
+        pixels
+            array of healpix pixels (Nside = 2**15)
+        shotid
+            Specific shotid (dtype=int) you want
+
+        Returns
+        -------
+        numpy structured array of the matching rows
+        """
+        pixels = np.unique(pixels)
+
+        # first and last pixel of each run of consecutive pixels
+        breaks = np.where(np.diff(pixels) != 1)[0] + 1
+        runs = np.split(pixels, breaks)
+
+        chunks = []
+        for run in runs:
+            if np.size(run) == 0:
+                continue
+            lo = run[0]
+            hi = run[-1]
+            if self.memmap:
+                chunks.append(self.get_fib_from_sidecar_range(lo, hi))
             else:
-                h_tab = self.get_fib_from_hp(hpix)
-            seltab = vstack([seltab, h_tab])
+                chunks.append(
+                    self.hdfile.root.FiberIndex.read_where(
+                        "(healpix >= lo) & (healpix <= hi)"
+                    )
+                )
 
-        fibcoords = SkyCoord(
-            seltab["ra"] * u.degree, seltab["dec"] * u.degree, frame="icrs"
-        )
+        if self.memmap:
+            empty = self.get_fib_from_sidecar_range(0, -1)
+        else:
+            empty = np.zeros(0, dtype=self.hdfile.root.FiberIndex.dtype)
 
-        idx = coords.separation(fibcoords) < radius
-        
-        return seltab[idx]
+        rows = np.concatenate([empty] + chunks)
+
+        if shotid:
+            rows = rows[rows["shotid"] == shotid]
+
+        return rows
 
-        
     def get_fib_from_hp(self, hp, shotid=None, astropy=True):
 
+        if self.memmap:
+            return self.get_fib_from_sidecar(hp, shotid=shotid, astropy=astropy)
+
         if astropy:
 
             tab= Table(self.hdfile.root.FiberIndex.read_where("healpix == hp"))
@@ -386,7 +601,64 @@ class FiberIndex:
                 return self.hdfile.root.FiberIndex.read_where("(healpix == hp) & (shoti d== sid)")
             else:
                 return self.hdfile.root.FiberIndex.read_where("(healpix == hp)")
-                
+
+    def get_fib_from_sidecar(self, hp, shotid=None, astropy=True):
+        """
+        Return the rows of a healpix pixel from the memory-mapped
+        sidecar. The rows of each pixel are contiguous so this is a
+        single slice of every column
+
+        Parameters
+        ----------
+        hp
+            healpix pixel (Nside = 2**15)
+        shotid
+            Specific shotid (dtype=int) you want
+        astropy
+            return an astropy Table. Otherwise a numpy structured array
+
+        Returns
+        -------
+        Table or structured array of the fibers in the pixel
+        """
+        rows = self.get_fib_from_sidecar_range(hp, hp)
+
+        if shotid:
+            rows = rows[rows["shotid"] == shotid]
+
+        if astropy:
+            return Table(rows)
+        else:
+            return rows
+
+    def get_fib_from_sidecar_range(self, hp_lo, hp_hi):
+        """
+        Return the sidecar rows with hp_lo <= healpix <= hp_hi as a
+        numpy structured array. The sidecar is sorted by healpix so
+        this is one contiguous slice of every column
+        """
+        i0 = np.searchsorted(self.hp_offsets["healpix"], hp_lo, side="left")
+        i1 = np.searchsorted(self.hp_offsets["healpix"], hp_hi, side="right")
+
+        if i1 > i0:
+            start = self.hp_offsets["start"][i0]
+            stop = self.hp_offsets["stop"][i1 - 1]
+        else:
+            start = stop = 0
+
+        cols = [getattr(self, name) for name in self.colnames]
+        rows = np.empty(
+            stop - start,
+            dtype=[
+                (name, col.dtype, col.shape[1:])
+                for name, col in zip(self.colnames, cols)
+            ],
+        )
+        for name, col in zip(self.colnames, cols):
+            rows[name] = col[start:stop]
+
+        return rows
+
     def get_closest_fiberid(self, coords, shotid=None, maxdistance=8.*u.arcsec):
         """
         Function to retrieve the closest fiberid in a shot
@@ -411,23 +683,14 @@ class FiberIndex:
         
         """
 
-        #start searching at small radius to search more efficiently
-        search = 2.*u.arcsec
-
-        while search <= maxdistance:
-            fiber_table = self.query_region(coords, radius=search, shotid=shotid)
-            search = search + 4.*u.arcsec
-            if np.size(fiber_table) > 0:
-                break
+        fiber_table = self.query_region(coords, radius=maxdistance, shotid=shotid)
 
         if np.size(fiber_table) > 0:
-            fibcoords = SkyCoord(
-                fiber_table["ra"] * u.degree, fiber_table["dec"] * u.degree, frame="icrs"
+            sep = angular_separation(
+                coords.ra.deg, coords.dec.deg, fiber_table["ra"], fiber_table["dec"]
             )
-            
-            idx = np.argmin(coords.separation(fibcoords))
-            fiberid = fiber_table['fiber_id'][idx]
-        
+            idx = np.argmin(sep)
+
             return fiber_table['fiber_id'][idx]
         else:
             return None
@@ -436,4 +699,5 @@ class FiberIndex:
         """
         Close the hdfile when done
         """
-        self.hdfile.close()
+        if self.hdfile is not None:
+            self.hdfile.close()
@@ -89,7 +89,7 @@ def main(argv=None):
 
     # initiate Fibers and Survey Classes
     print(args)
-    fibers = Fibers(args.datevobs)
+    fibers = Fibers(args.datevobs, lazy=True)
     survey = Survey('hdr1')
     
     fwhm = survey.fwhm_moffat[survey.datevobs == args.datevobs]
@@ -75,6 +75,12 @@ def get_parser():
                         help="""source name""",
                         type=str,
                         default=None)
+
+    parser.add_argument("--footprint",
+                        "-footprint",
+                        help="""Only keep sources that fall on an IFU""",
+                        default=False,
+                        action="store_true")
     return parser
 
 
@@ -103,11 +109,6 @@ def main(argv=None):
 
     args.survey = Survey("hdr1")
 
-    args.matched_sources = {}
-    shots_of_interest = []
-
-    count = 0
-
     # this radius applies to the inital shot search and requires a large
     # aperture for the wide FOV of VIRUS
 
@@ -115,16 +116,10 @@ def main(argv=None):
 
     args.log.info("Finding shots of interest")
 
-    for i, coord in enumerate(args.survey.coords):
-        dist = args.coords.separation(coord)
-        sep_constraint = dist < max_sep
-        shotid = args.survey.shotid[i]
-        idx = np.where(sep_constraint)[0]
-        if np.size(idx) > 0:
-            args.matched_sources[shotid] = idx
-            count += np.size(idx)
-            if len(idx) > 0:
-                shots_of_interest.append(shotid)
+    args.matched_sources = args.survey.get_shot_matches(
+        args.coords, max_sep=max_sep, footprint=args.footprint
+    )
+    shots_of_interest = list(args.matched_sources.keys())
 
     args.log.info("Number of shots of interest: %i" % len(shots_of_interest))
     args.log.info("Saved shot list to file " + str(args.outfile))
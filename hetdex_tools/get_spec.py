@@ -26,6 +26,9 @@ ID
     object ID if using a single source
 shotid
     use if you are running on just a single shotid (or datevobs)
+shotlist
+    file with a list of shotids to run on, e.g. a shard written by
+    get_spec_shards.py
 input
     path to input catalog of ID/RA/DEC, can use any astropy units or program
     will assume degree
@@ -33,6 +36,8 @@ output
     name of output pickle file
 multiprocess
     flag to use python multiprocess, don't use in a slurm job
+nproc
+    number of worker processes for multiprocess, defaults to all cores
 single
     flag to write out several astropy tables for each ID/shot spectra
 merge
@@ -55,6 +60,12 @@ fiberweights: bool
 fiber_info: bool
    returns the fiber_info and weights of the fibers used
    in the extraction
+prefetch: int
+   number of shots read in a background thread ahead of the
+   extraction when not using multiprocess
+h5: bool
+   stream the spectra to outfile.h5 as each shot finishes. A rerun
+   with the same outfile skips the shots already in the file
 
 Examples
 --------
@@ -106,11 +117,14 @@ from hetdex_api.extract import Extract
 from hetdex_api.survey import Survey
 from hetdex_api.mask import *
 from hetdex_api.config import HDRconfig
+from hetdex_tools.spectra_h5 import SpectraSink
 
 from copy import deepcopy
 from collections.abc import Mapping
 
-from multiprocessing import Process, Manager
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, as_completed
+from collections import deque
+import threading
 import time
 
 if not sys.warnoptions:
@@ -118,9 +132,47 @@ if not sys.warnoptions:
 
 LATEST_HDR_NAME = HDRconfig.LATEST_HDR_NAME
 config = HDRconfig()
-bad_amps_table = Table.read(config.badamp)
-galaxy_cat = Table.read(config.rc3cat, format="ascii")
-             
+
+# number of sources in a shot whose fibers are read in a single pass
+SOURCE_BATCH_SIZE = 100
+
+# shots read ahead of the extraction with --prefetch and the cap in MB on
+# the fiber data held by shots that were read but not yet extracted
+PREFETCH_DEPTH = 2
+PREFETCH_MEMORY_MB = 2000
+
+# serializes the HDF5 calls of the prefetch thread (shot reads) and of
+# the main thread (--h5 writes), the HDF5 library is not thread safe
+_hdf5_lock = threading.Lock()
+
+# flag catalogs are read by load_flag_tables() the first time they are needed
+bad_amps_table = None
+galaxy_cat = None
+meteor_table = None
+
+# lookups built from the flag catalogs for get_flags_many()
+amp_index = None
+galaxy_index = None
+
+
+def load_flag_tables():
+    """
+    Read the bad amp, RC3 galaxy and meteor tables used by get_flags()
+    and build their lookups once per process
+    """
+
+    global bad_amps_table, galaxy_cat, meteor_table, amp_index, galaxy_index
+
+    if bad_amps_table is None:
+        bad_amps_table = Table.read(config.badamp)
+        amp_index = get_amp_flag_index(bad_amps_table)
+    if galaxy_cat is None:
+        galaxy_cat = Table.read(config.rc3cat, format="ascii")
+        galaxy_index = get_galaxy_index(galaxy_cat)
+    if meteor_table is None:
+        meteor_table = get_meteor_table(config.meteor)
+
+
 def merge(dict1, dict2):
     """ Return a new dictionary by merging two dictionaries recursively. """
     result = deepcopy(dict1)
@@ -134,285 +186,456 @@ def merge(dict1, dict2):
     return result
 
 
+def get_flags_many(fiber_info_list):
+    """
+    Get flags for all sources of a shot in a few vectorized passes
+
+    Parameters
+    ----------
+    fiber_info_list
+        list of fiber_info arrays, one per source, with rows of
+        (fiberid, multiframe, ra, dec, weight)
+
+    Returns
+    -------
+    flags
+        list of (meteor_flag, gal_flag, amp_flag, flag) tuples, True
+        where the source is good
+    """
+
+    load_flag_tables()
+
+    nfib = np.array([len(fiber_info) for fiber_info in fiber_info_list])
+    if np.sum(nfib) == 0:
+        return [(True, True, True, True)] * len(fiber_info_list)
+
+    fibers = np.concatenate(
+        [np.asarray(fiber_info) for fiber_info in fiber_info_list if len(fiber_info) > 0]
+    )
+    fiberid = fibers[:, 0].astype(str)
+    ra = fibers[:, 2].astype(float)
+    dec = fibers[:, 3].astype(float)
+    source = np.repeat(np.arange(len(fiber_info_list)), nfib)
+    shotid = np.array([int(f[0:11]) for f in fiberid])
+
+    amp_good = amp_flags_from_fiberids(fiberid, amp_index)
+    meteor_good = meteor_flags_from_radec(ra, dec, shotid, meteor_table)
+    gal_good = ~gal_flags_from_radec(ra, dec, galaxy_index)
+
+    # a source is flagged if any of its fibers is
+    def all_good(good):
+        nbad = np.bincount(source[~good], minlength=len(fiber_info_list))
+        return nbad == 0
+
+    flags = []
+    for meteor_flag, gal_flag, amp_flag in zip(
+        all_good(meteor_good), all_good(gal_good), all_good(amp_good)
+    ):
+        flag = meteor_flag * gal_flag * amp_flag
+        flags.append((bool(meteor_flag), bool(gal_flag), bool(amp_flag), bool(flag)))
+
+    return flags
+
+
 def get_flags(fiber_info):
     """ Get flags from fiber_info """
+    return get_flags_many([fiber_info])[0]
 
-    global bad_amps_table, galaxy_cat
-    meteor_flag = True
-    gal_flag = True
-    amp_flag = True
-    flag = True
-    
-    coords = []
-    
-    for x in fiber_info:
-        fiberid, multiframe, ra, dec, weights = x
-        if amp_flag_from_fiberid(fiberid, bad_amps_table):
-            continue
-        else:
-            amp_flag = False
-        try:
-            coords.append(SkyCoord(ra=ra, dec=dec, unit='deg'))
-        except:
-            pass
-    try:
-        shotid = int(fiberid[0:11])
-        meteor_flag = meteor_flag_from_coords(
-            coords,
-            shotid=shotid
-        )
-    except:
-        pass
-    try:
-        gal_flag = gal_flag_from_coords(coords, galaxy_cat)
-    except:
-        pass
-
-    flag = meteor_flag * gal_flag * amp_flag
 
-    return meteor_flag, gal_flag, amp_flag, flag
+def get_source_id(args, ind):
+    """ Return the source ID for an index into the input source list """
+    if np.size(args.ID) > 1:
+        return args.ID[ind]
+    else:
+        return args.ID
 
-    
-def get_source_spectra(shotid, args):
-    E = Extract()
-    source_dict = {}
 
+def get_shot_fwhm(shotid, args):
+    """ Return the seeing FWHM of a shot from the survey class """
+    sel_shot = args.survey_class.shotid == shotid
     if args.survey == "hdr1":
+        return args.survey_class.fwhm_moffat[sel_shot][0]
+    else:
+        return args.survey_class.fwhm_virus[sel_shot][0]
+
+
+def get_shot_job(shotid, args):
+    """
+    Bundle everything needed to extract the sources matched to a
+    single shot into a small, picklable namespace. Only the matched
+    source IDs and coordinates are stored so that sending a job to a
+    worker process does not copy the full input catalog or the open
+    survey HDF5 file.
+    """
+    job = types.SimpleNamespace()
+    job.shotid = shotid
+    job.survey = args.survey
+    job.rad = args.rad
+    job.ffsky = args.ffsky
+    job.fiberweights = args.fiberweights
+    job.log = args.log
+    job.fwhm = get_shot_fwhm(shotid, args)
+
+    idx = np.atleast_1d(args.matched_sources[shotid])
+    job.ID = [get_source_id(args, ind) for ind in idx]
+
+    if args.coords.isscalar:
+        job.ra = np.repeat(args.coords.ra.deg, np.size(idx))
+        job.dec = np.repeat(args.coords.dec.deg, np.size(idx))
+    else:
+        job.ra = args.coords.ra.deg[idx]
+        job.dec = args.coords.dec.deg[idx]
+
+    return job
+
+
+def read_shot(job):
+    """
+    I/O stage of a shot extraction. Open the shot of a job created by
+    get_shot_job() and read the fibers around every source. The shot
+    file is closed before returning, so the result can be handed to
+    extract_shot_data() in another thread.
+
+    Returns
+    -------
+    shot_data
+        namespace with the job, the Extract object, the list of
+        get_fiberinfo_for_coords() results for each batch of sources,
+        the number of bytes of fiber data read and the read time
+    """
+    shot_data = types.SimpleNamespace(job=job, E=None, batches=[], nbytes=0,
+                                      read_time=0.0)
+    if len(job.ID) == 0:
+        return shot_data
+
+    if job.survey == "hdr1":
         source_num_switch = 20
     else:
         source_num_switch = 0
 
-    if len(args.matched_sources[shotid]) > 0:
-        args.log.info("Working on shot: %s" % shotid)
-        if args.survey == "hdr1":
-            fwhm = args.survey_class.fwhm_moffat[args.survey_class.shotid == shotid][0]
-        else:
-            fwhm = args.survey_class.fwhm_virus[args.survey_class.shotid == shotid][0]
+    start = time.time()
 
-        moffat = E.moffat_psf(fwhm, 10.5, 0.25)
+    # pytables is not thread safe so prefetch threads read one at a time
+    with _hdf5_lock:
+        E = Extract()
 
-        if len(args.matched_sources[shotid]) > source_num_switch:
-            E.load_shot(shotid, fibers=True, survey=args.survey)
+        if len(job.ID) > source_num_switch:
+            E.load_shot(job.shotid, fibers=True, survey=job.survey)
         else:
-            E.load_shot(shotid, fibers=False, survey=args.survey)
+            E.load_shot(job.shotid, fibers=False, survey=job.survey)
 
-        for ind in args.matched_sources[shotid]:
-            try:
-                info_result = E.get_fiberinfo_for_coord(
-                    args.coords[ind],
-                    radius=args.rad,
-                    ffsky=args.ffsky,
-                    return_fiber_info=True,
-                )
-            except TypeError:
-                info_result = E.get_fiberinfo_for_coord(
-                    args.coords,
-                    radius=args.rad,
-                    ffsky=args.ffsky,
-                    return_fiber_info=True,
-                )
-            if info_result is not None:
+        coords = SkyCoord(ra=job.ra, dec=job.dec, unit="deg")
+
+        # fibers are read for a batch of sources at once
+        for i in np.arange(0, len(job.ID), SOURCE_BATCH_SIZE):
+            info_results = E.get_fiberinfo_for_coords(
+                coords[i : i + SOURCE_BATCH_SIZE],
+                radius=job.rad,
+                ffsky=job.ffsky,
+                return_fiber_info=True,
+            )
+            shot_data.batches.append(info_results)
+            shot_data.nbytes += np.sum(
+                [
+                    info[6].nbytes + info[7].nbytes + info[8].nbytes
+                    for info in info_results
+                    if info is not None
+                ]
+            )
+
+        E.close()
+
+    shot_data.E = E
+    shot_data.read_time = time.time() - start
+
+    return shot_data
+
+
+def extract_shot_data(shot_data):
+    """
+    Compute stage of a shot extraction. Build the weights and spectra
+    of every source from the fibers read by read_shot()
+
+    Returns
+    -------
+    source_dict
+        dictionary of {ID: {shotid: [spec, spec_err, weights,
+        fiber_weights, fiber_info, flags]}} holding plain numpy arrays
+    """
+    source_dict = {}
+    job = shot_data.job
+    shotid = job.shotid
+    E = shot_data.E
+
+    if len(job.ID) == 0:
+        return source_dict
+
+    job.log.info("Working on shot: %s" % shotid)
+
+    moffat = E.moffat_psf(job.fwhm, 10.5, 0.25)
+
+    for i, info_results in zip(
+        np.arange(0, len(job.ID), SOURCE_BATCH_SIZE), shot_data.batches
+    ):
+
+        batch_ID = job.ID[i : i + SOURCE_BATCH_SIZE]
+
+        found = [k for k, info in enumerate(info_results) if info is not None]
+
+        weights_list = E.build_weights_many(
+            [info_results[k][2] for k in found],
+            [info_results[k][3] for k in found],
+            [info_results[k][0] for k in found],
+            [info_results[k][1] for k in found],
+            moffat,
+        )
+
+        for k, weights in zip(found, weights_list):
+
+            ID = batch_ID[k]
+            job.log.info("Extracting %s" % ID)
+
+            ifux, ifuy, xc, yc, ra, dec, data, error, mask, fiberid, \
+                multiframe = info_results[k]
+
+            spectrum_aper, spectrum_aper_error = E.get_spectrum(
+                data, error, mask, weights
+            )
+
+            # add in the total weight of each fiber (as the sum of its weight per wavebin)
+            if job.fiberweights:
                 try:
-                    args.log.info("Extracting %s" % args.ID[ind])
+                    fiber_weights = np.array(
+                        [x for x in zip(ra, dec, np.sum(weights * mask, axis=1))]
+                    )
                 except:
-                    args.log.info("Extracting %s" % args.ID)
-
-                ifux, ifuy, xc, yc, ra, dec, data, error, mask, fiberid, \
-                    multiframe = info_result
-
-                weights = E.build_weights(xc, yc, ifux, ifuy, moffat)
-                result = E.get_spectrum(data, error, mask, weights)
-                spectrum_aper, spectrum_aper_error = [res for res in result]
-
-                #add in the total weight of each fiber (as the sum of its weight per wavebin)
-                if args.fiberweights:
-                    try:
-                        fiber_weights = np.array( [x for x in zip(ra, dec, np.sum(weights*mask, axis=1))])
-                    except:
-                        fiber_weights = []
-                else:
                     fiber_weights = []
+            else:
+                fiber_weights = []
+
+            # get fiber info no matter what so we can flag
+            try:
+                fiber_info = np.array(
+                    [
+                        x
+                        for x in zip(
+                            fiberid, multiframe, ra, dec, np.sum(weights * mask, axis=1)
+                        )
+                    ]
+                )
+            except:
+                job.log.warning("Could not get fiber info, no flagging created")
+                fiber_info = []
+
+            source_dict.setdefault(ID, {})[shotid] = [
+                spectrum_aper,
+                spectrum_aper_error,
+                weights.sum(axis=0),
+                fiber_weights,
+                fiber_info,
+                None,
+            ]
+
+    # flag all sources of the shot at once
+    flagged = [ID for ID in source_dict if len(source_dict[ID][shotid][4]) > 0]
+    flags_list = get_flags_many([source_dict[ID][shotid][4] for ID in flagged])
+    for ID, flags in zip(flagged, flags_list):
+        source_dict[ID][shotid][5] = flags
 
-                # get fiber info no matter what so we can flag
-                try:
-                    fiber_info = np.array( [
-                        x for x in zip(fiberid,
-                                       multiframe,
-                                       ra,
-                                       dec,
-                                       np.sum(weights*mask, axis=1))])
-                except:
-                    fiber_info = []
-
-                if len(fiber_info) > 0:
-                    flags = get_flags(fiber_info)
-                else:
-                    flags = None
-                    
-                if np.size(args.ID) > 1:
-                    if args.ID[ind] in source_dict:
-                        source_dict[args.ID[ind]][shotid] = [
-                            spectrum_aper,
-                            spectrum_aper_error,
-                            weights.sum(axis=0),
-                            fiber_weights,
-                            fiber_info,
-                            flags,
-                        ]
-                    else:
-                        source_dict[args.ID[ind]] = dict()
-                        source_dict[args.ID[ind]][shotid] = [
-                            spectrum_aper,
-                            spectrum_aper_error,
-                            weights.sum(axis=0),
-                            fiber_weights,
-                            fiber_info,
-                            flags,
-                        ]
-                else:
-                    if args.ID in source_dict:
-                        source_dict[args.ID][shotid] = [
-                            spectrum_aper,
-                            spectrum_aper_error,
-                            weights.sum(axis=0),
-                            fiber_weights,
-                            fiber_info,
-                            flags,
-                        ]
-                    else:
-                        source_dict[args.ID] = dict()
-                        source_dict[args.ID][shotid] = [
-                            spectrum_aper,
-                            spectrum_aper_error,
-                            weights.sum(axis=0),
-                            fiber_weights,
-                            fiber_info,
-                            flags,
-                        ]
-
-        E.shoth5.close()
-        
     return source_dict
-        
 
-def get_source_spectra_mp(source_dict, shotid, manager, args):
-    E = Extract()
 
-    if args.survey == "hdr1":
-        source_num_switch = 20
-    else:
-        source_num_switch = 0
+def extract_shot(job):
+    """
+    Extract spectra for all sources in a shot job created by
+    get_shot_job(). This is the single code path used for both
+    serial and multiprocessing extractions.
 
-    if len(args.matched_sources[shotid]) > 0:
-        args.log.info("Working on shot: %s" % shotid)
-        if args.survey == "hdr1":
-            fwhm = args.survey_class.fwhm_moffat[args.survey_class.shotid == shotid][0]
-        else:
-            fwhm = args.survey_class.fwhm_virus[args.survey_class.shotid == shotid][0]
+    Returns
+    -------
+    source_dict
+        dictionary of {ID: {shotid: [spec, spec_err, weights,
+        fiber_weights, fiber_info, flags]}} holding plain numpy arrays
+    """
+    return extract_shot_data(read_shot(job))
 
-        moffat = E.moffat_psf(fwhm, 10.5, 0.25)
 
-        if len(args.matched_sources[shotid]) > source_num_switch:
-            E.load_shot(shotid, fibers=True, survey=args.survey)
-        else:
-            E.load_shot(shotid, fibers=False, survey=args.survey)
+def get_source_spectra(shotid, args):
+    """
+    Extract spectra for all sources in args.matched_sources[shotid]
+
+    Parameters
+    ----------
+    shotid
+        integer shotid to extract on
+    args
+        namespace of extraction options as built by main() or
+        get_spectra()
+
+    Returns
+    -------
+    source_dict
+        dictionary of {ID: {shotid: [spec, spec_err, weights,
+        fiber_weights, fiber_info, flags]}}
+    """
+    if len(args.matched_sources[shotid]) == 0:
+        return {}
+
+    return extract_shot(get_shot_job(shotid, args))
+
+
+def add_to_source_dict(source_dict, shot_source_dict):
+    """
+    Add the spectra of a single shot to the running source dictionary
+    in place. Each ID/shotid pair is produced by one shot only so no
+    recursive merge is needed.
+    """
+    for ID, shot_dict in shot_source_dict.items():
+        source_dict.setdefault(ID, {}).update(shot_dict)
+
+    return source_dict
+
+
+def store_shot(source_dict, shotid, shot_source_dict, sink=None):
+    """
+    Store the spectra of a finished shot. With a SpectraSink they are
+    appended to its file and the shot is marked complete, otherwise
+    they are added to the running source dictionary.
+    """
+    if sink is None:
+        add_to_source_dict(source_dict, shot_source_dict)
+    else:
+        # the prefetch thread may be reading the next shot file
+        with _hdf5_lock:
+            sink.write_shot(shotid, shot_source_dict)
+
+    return source_dict
 
-        for ind in args.matched_sources[shotid]:
+
+def iter_prefetched_shots(jobs, depth=PREFETCH_DEPTH, max_memory_mb=PREFETCH_MEMORY_MB):
+    """
+    Yield read_shot() results for a list of jobs in order while a
+    background thread reads the fibers of the next shots. At most depth
+    shots are read ahead and no new read is started while the shots
+    already read but not yet consumed hold more than max_memory_mb of
+    fiber data. The shot being waited on is always read.
+
+    Yields
+    ------
+    shot_data, wait_time
+        read_shot() result and the time the consumer waited for it
+    """
+    jobs = iter(jobs)
+    pending = deque()
+    lock = threading.RLock()
+
+    def buffered_mb():
+        return np.sum(
+            [f.result().nbytes for f in pending if f.done() and not f.exception()]
+        ) / 1e6
+
+    with ThreadPoolExecutor(max_workers=1) as executor:
+
+        def fill(future=None):
+            # reads are started one at a time, each when the previous one
+            # finishes, so the memory cap sees the size of every read shot
+            with lock:
+                if any(not f.done() for f in pending):
+                    return
+                if len(pending) >= max(1, depth):
+                    return
+                if len(pending) > 0 and buffered_mb() >= max_memory_mb:
+                    return
+                job = next(jobs, None)
+                if job is None:
+                    return
+                new = executor.submit(read_shot, job)
+                pending.append(new)
+            new.add_done_callback(fill)
+
+        fill()
+        while True:
+            with lock:
+                if not pending:
+                    break
+                future = pending[0]
+            start = time.time()
             try:
-                info_result = E.get_fiberinfo_for_coord(
-                    args.coords[ind],
-                    radius=args.rad,
-                    ffsky=args.ffsky,
-                    return_fiber_info=True,
-                )
-            except TypeError:
-                info_result = E.get_fiberinfo_for_coord(
-                    args.coords,
-                    radius=args.rad,
-                    ffsky=args.ffsky,
-                    return_fiber_info=True,
-                )
-            if info_result is not None:
-                if np.size(args.ID) > 1:
-                    args.log.info("Extracting %s" % args.ID[ind])
-                else:
-                    args.log.info("Extracting %s" % args.ID)
-                ifux, ifuy, xc, yc, ra, dec, data, error, mask, fiberid, \
-                    multiframe = info_result
- 
-                weights = E.build_weights(xc, yc, ifux, ifuy, moffat)
-
-                result = E.get_spectrum(data, error, mask, weights)
-
-                spectrum_aper, spectrum_aper_error = [res for res in result]
-                
-                #add in the total weight of each fiber (as the sum of its weight per wavebin)
-                if args.fiberweights:
-                    
-                    try:
-                        fiber_weights = np.array( [x for x in zip(ra,dec,np.sum(weights*mask,axis=1))])
-                    except:
-                        fiber_weights = []
-                else:
-                    fiber_weights = []
-                    
-                # get fiber info no matter what so we can flag
-                try:
-                    fiber_info = np.array( [x for x in zip(fiberid, multiframe, ra, dec, np.sum(weights*mask, axis=1))])
-                except:
-                    args.log.warning('Could not get fiber info, no flagging created')
-                    fiber_info = []
-
-                if len(fiber_info) > 0:
-                    flags = get_flags(fiber_info)
-                else:
-                    flags = None
-                    
-                if np.size(args.ID) > 1:
-                    if args.ID[ind] in source_dict:
-                        source_dict[args.ID[ind]][shotid] = [
-                            spectrum_aper,
-                            spectrum_aper_error,
-                            weights.sum(axis=0),
-                            fiber_weights,
-                            fiber_info,
-                            flags,
-                        ]
-                    else:
-                        source_dict[args.ID[ind]] = manager.dict()
-                        source_dict[args.ID[ind]][shotid] = [
-                            spectrum_aper,
-                            spectrum_aper_error,
-                            weights.sum(axis=0),
-                            fiber_weights,
-                            fiber_info,
-                            flags,
-                        ]
-                else:
-                    if args.ID in source_dict:
-                        source_dict[args.ID][shotid] = [
-                            spectrum_aper,
-                            spectrum_aper_error,
-                            weights.sum(axis=0),
-                            fiber_weights,
-                            fiber_info,
-                            flags,
-                        ]
-                    else:
-                        source_dict[args.ID] = manager.dict()
-                        source_dict[args.ID][shotid] = [
-                            spectrum_aper,
-                            spectrum_aper_error,
-                            weights.sum(axis=0),
-                            fiber_weights,
-                            fiber_info,
-                            flags,
-                        ]
-
-        E.shoth5.close()
-        
+                shot_data = future.result()
+            except Exception as e:
+                shot_data = e
+            wait_time = time.time() - start
+            with lock:
+                pending.popleft()
+            fill()
+            yield shot_data, wait_time
+
+
+def extract_shots_pipelined(jobs, source_dict, args, sink=None):
+    """
+    Extract a list of shot jobs in the current process, overlapping the
+    fiber reads of the next shots (read_shot) with the extraction of the
+    current one (extract_shot_data). The prefetch depth and memory cap
+    are taken from args.prefetch and args.prefetch_mb. Per shot and
+    total read, wait and extraction times are logged: when the reads
+    are hidden behind the extraction the wait time is close to zero.
+    """
+    depth = args.prefetch
+    max_memory_mb = getattr(args, "prefetch_mb", PREFETCH_MEMORY_MB)
+
+    args.log.info(
+        "Extracting %i shots with a prefetch depth of %i (%.0f MB cap)"
+        % (len(jobs), depth, max_memory_mb)
+    )
+
+    read_total = 0.0
+    wait_total = 0.0
+    compute_total = 0.0
+    start = time.time()
+
+    for job, (shot_data, wait_time) in zip(
+        jobs, iter_prefetched_shots(jobs, depth=depth, max_memory_mb=max_memory_mb)
+    ):
+        if isinstance(shot_data, Exception):
+            args.log.warning("Extraction failed for shot %s: %s" % (job.shotid, shot_data))
+            continue
+
+        t0 = time.time()
+        try:
+            store_shot(source_dict, job.shotid, extract_shot_data(shot_data), sink)
+        except Exception as e:
+            args.log.warning("Extraction failed for shot %s: %s" % (job.shotid, e))
+        compute_time = time.time() - t0
+
+        read_total += shot_data.read_time
+        wait_total += wait_time
+        compute_total += compute_time
+
+        args.log.info(
+            "Shot %s: read %.2f s, waited %.2f s, extracted %.2f s, %.1f MB"
+            % (job.shotid, shot_data.read_time, wait_time, compute_time,
+               shot_data.nbytes / 1e6)
+        )
+
+    wall = time.time() - start
+    args.log.info(
+        "Pipeline totals: read %.2f s, waited %.2f s, extracted %.2f s, wall %.2f s, "
+        "overlap %.2f s" % (read_total, wait_total, compute_total, wall,
+                           max(0.0, read_total + compute_total - wall))
+    )
+
     return source_dict
-        
+
+
+def get_nproc(njobs, nproc=None):
+    """ Number of worker processes to use for njobs shots """
+    if nproc is None:
+        try:
+            nproc = len(os.sched_getaffinity(0))
+        except AttributeError:
+            nproc = os.cpu_count() or 1
+    return int(np.maximum(1, np.minimum(nproc, njobs)))
+
 
 def return_astropy_table(Source_dict,
                          fiberweights=False,
@@ -502,77 +725,69 @@ def return_astropy_table(Source_dict,
 
 def get_spectra_dictionary(args):
 
-    args.matched_sources = {}
-    shots_of_interest = []
-
-    count = 0
-
     # this radius applies to the inital shot search and requires a large
     # aperture for the wide FOV of VIRUS
     max_sep = 11.0 * u.arcmin
 
     args.log.info("Finding shots of interest")
 
-    for i, coord in enumerate(args.survey_class.coords):
-        dist = args.coords.separation(coord)
-        sep_constraint = dist < max_sep
-        shotid = args.survey_class.shotid[i]
-        idx = np.where(sep_constraint)[0]
+    # callers that keep a shot index resident (get_spec_server) match
+    # the sources themselves
+    if getattr(args, "matched_sources", None) is None:
+        args.matched_sources = args.survey_class.get_shot_matches(
+            args.coords, max_sep=max_sep, footprint=getattr(args, "footprint", False)
+        )
+    shots_of_interest = list(args.matched_sources.keys())
 
-        if np.size(idx) > 0:
+    sink = getattr(args, "sink", None)
+    if sink is not None and len(sink.completed) > 0:
+        args.log.info(
+            "Skipping %i shots already in %s" % (len(sink.completed), sink.filename)
+        )
+        shots_of_interest = [
+            shotid for shotid in shots_of_interest if int(shotid) not in sink.completed
+        ]
 
-            args.matched_sources[shotid] = idx
-            count += np.size(idx)
-            if len(idx) > 0:
-                shots_of_interest.append(shotid)
+    count = np.sum([np.size(args.matched_sources[shotid]) for shotid in shots_of_interest])
 
     args.log.info("Number of shots of interest: %i" % len(shots_of_interest))
     args.log.info("Extracting %i sources" % count)
 
-    if args.multiprocess:
+    # schedule the largest shots first so they do not trail at the end
+    jobs = [get_shot_job(shotid, args) for shotid in shots_of_interest]
+    jobs.sort(key=lambda job: len(job.ID), reverse=True)
 
-        manager = Manager()
-        Sources = manager.dict()
+    Source_dict = {}
 
-        start = time.time()
-        njobs = np.size(shots_of_interest)
+    start = time.time()
 
-        ntasks = 32
+    if args.multiprocess and len(jobs) > 1:
 
-        for i in np.arange(0, njobs, ntasks):
-            jobs = [
-                Process(
-                    target=get_source_spectra_mp, args=(Sources, shotid, manager, args)
-                )
-                for shotid in shots_of_interest[i : np.minimum(njobs, i + ntasks)]
-            ]
+        nproc = get_nproc(len(jobs), getattr(args, "nproc", None))
+        args.log.info("Extracting on %i shots with %i processes" % (len(jobs), nproc))
 
-            for j in jobs:
-                j.start()
-            for j in jobs:
-                j.join()
-
-        end = time.time()
-        args.log.info(
-            "Extraction of sources completed in %.2f minutes." % ((end - start) / 60.0)
-        )
-
-        # convert manager dict to a regular dictionary object to pickle
-        Source_dict = {}
-        count = 0
-        for ID in Sources.keys():
-            Source_dict[ID] = {}
-            for shotid in Sources[ID].keys():
-                count += 1
-                Source_dict[ID][shotid] = list(Sources[ID][shotid])
+        with ProcessPoolExecutor(max_workers=nproc) as executor:
+            futures = {executor.submit(extract_shot, job): job.shotid for job in jobs}
 
+            for future in as_completed(futures):
+                # drop the future so its result is freed once stored
+                shotid = futures.pop(future)
+                try:
+                    store_shot(Source_dict, shotid, future.result(), sink)
+                except Exception as e:
+                    args.log.warning(
+                        "Extraction failed for shot %s: %s" % (shotid, e)
+                    )
+    elif getattr(args, "prefetch", 0) > 0:
+        extract_shots_pipelined(jobs, Source_dict, args, sink=sink)
     else:
-        Source_dict = {}
-        for shotid in shots_of_interest:
-            shot_source_dict = get_source_spectra(shotid, args)
+        for job in jobs:
+            store_shot(Source_dict, job.shotid, extract_shot(job), sink)
 
-            if shot_source_dict:
-                Source_dict = merge(Source_dict, shot_source_dict)
+    end = time.time()
+    args.log.info(
+        "Extraction of sources completed in %.2f minutes." % ((end - start) / 60.0)
+    )
 
     return Source_dict
 
@@ -592,6 +807,14 @@ def get_parser():
         default=None,
     )
 
+    parser.add_argument(
+        "-sl",
+        "--shotlist",
+        help="""File with a list of integer shotids to extract on""",
+        type=str,
+        default=None,
+    )
+
     parser.add_argument(
         "-i", "--infile", help="""File with table of ID/RA/DEC""", default=None
     )
@@ -639,6 +862,42 @@ def get_parser():
         action="store_true",
     )
 
+    parser.add_argument(
+        "--nproc",
+        "-nproc",
+        help="""Number of worker processes used with --multiprocess.
+        Defaults to the number of available cores""",
+        type=int,
+        default=None,
+    )
+
+    parser.add_argument(
+        "--footprint",
+        "-footprint",
+        help="""Only extract sources that fall on an IFU of each shot""",
+        default=False,
+        required=False,
+        action="store_true",
+    )
+
+    parser.add_argument(
+        "--prefetch",
+        "-prefetch",
+        help="""Number of shots whose fibers are read in a background
+        thread while the current shot is extracted. Default is 0 (off).
+        Ignored with --multiprocess""",
+        type=int,
+        default=0,
+    )
+
+    parser.add_argument(
+        "--prefetch_mb",
+        "-prefetch_mb",
+        help="""Cap in MB on the fiber data of prefetched shots""",
+        type=float,
+        default=PREFETCH_MEMORY_MB,
+    )
+
     parser.add_argument(
         "--merge",
         "-merge",
@@ -673,6 +932,16 @@ def get_parser():
         action="store_true",
     )
 
+    parser.add_argument(
+        "--h5",
+        "-h5",
+        help="""Stream spectra to an HDF5 file as each shot finishes.
+        Rerunning with the same outfile skips the completed shots""",
+        default=False,
+        required=False,
+        action="store_true",
+    )
+
     parser.add_argument(
         "--pickle",
         "-pkl",
@@ -834,8 +1103,20 @@ def main(argv=None):
 
         args.survey_class = args.survey_class[sel_shot]
 
-    else:
-        pass
+    elif args.shotlist:
+        shotlist = np.loadtxt(args.shotlist, dtype=int, ndmin=1)
+        sel_shot = np.isin(args.survey_class.shotid, shotlist)
+        args.survey_class = args.survey_class[sel_shot]
+
+    if args.h5:
+        outfile = args.outfile + ".h5"
+        args.log.info("Streaming spectra to " + outfile)
+        args.sink = SpectraSink(outfile, ID=args.ID)
+        get_spectra_dictionary(args)
+        args.sink.close()
+        args.survey_class.close()
+        args.log.info("Saved output file to " + outfile)
+        return
 
     # main function to retrieve spectra dictionary
     Source_dict = get_spectra_dictionary(args)
@@ -896,6 +1177,10 @@ def get_spectra(
     fiberweights=False,
     return_fiber_info=False,
     loglevel='WARNING',
+    nproc=None,
+    footprint=False,
+    outfile=None,
+    prefetch=0,
 ):
     """
     Function to retrieve PSF-weighted, ADR and aperture corrected
@@ -916,10 +1201,10 @@ def get_spectra(
         Default is 3.5
     multiprocess: bool
         boolean flag to use multiprocessing. This will greatly
-        speed up its operation as it will extract on 32 shots at
-        time. But only use this when on a compute node. Use
-        idev, a jupyter notebook, or submit the job as a single
-        python slurm job. Default is True
+        speed up its operation as it will extract on one shot
+        per available core at a time. But only use this when on
+        a compute node. Use idev, a jupyter notebook, or submit
+        the job as a single python slurm job. Default is True
     shotid: int
         list of integer shotids to do extractions on. By default
         it will search the whole survey except for shots located
@@ -942,18 +1227,37 @@ def get_spectra(
     loglevel: str
         Level to set logging. Options are ERROR, WARNING, INFO,
         DEBUG. Defaults to WARNING
+    nproc: int
+        number of worker processes when multiprocess=True. Defaults
+        to the number of available cores
+    footprint: bool
+        only extract sources that fall on an IFU of each shot, using
+        the shot PA and fplane. Default is False
+    outfile: str
+        HDF5 file to stream the spectra to as each shot finishes
+        (see hetdex_tools.spectra_h5). Shots already completed in
+        outfile are skipped. Fiber info and fiber weights are not
+        stored. Default is None, which keeps all spectra in memory
+    prefetch: int
+        when multiprocess=False, number of shots whose fibers are read
+        in a background thread while the current shot is extracted.
+        Default is 0 (off)
 
     Returns
     -------
     sources
         an astropy table object of source spectra for all input
         coords/ID that have spectra in the survey shots. There
-        is one row per source ID/shotid observation.
+        is one row per source ID/shotid observation. If outfile
+        is given, outfile is returned instead
     """
 
     args = types.SimpleNamespace()
 
     args.multiprocess = multiprocess
+    args.nproc = nproc
+    args.footprint = footprint
+    args.prefetch = prefetch
     args.coords = coords
     args.rad = rad * u.arcsec
     args.survey = survey
@@ -1018,6 +1322,13 @@ def get_spectra(
     else:
         args.ID = ID
 
+    if outfile is not None:
+        args.sink = SpectraSink(outfile, ID=args.ID)
+        get_spectra_dictionary(args)
+        args.sink.close()
+        args.survey_class.close()
+        return outfile
+
     Source_dict = get_spectra_dictionary(args)
 
     args.survey_class.close()
@@ -36,7 +36,7 @@ from matplotlib.colors import LogNorm
 from astropy.visualization import ZScaleInterval
 
 from hetdex_api.input_utils import setup_logging
-from hetdex_api.shot import Fibers
+from hetdex_api.shot import Fibers, match_string_dtype
 from hetdex_api.detections import Detections
 from elixer import catalogs
 
@@ -134,6 +134,7 @@ def get_2Dimage_wave(detectid_obj, detects, fibers, width=100, height=50):
     fibnum_obj = fiber_table["fibnum"][maxfib]
     fiber_id_obj = fiber_table["fiber_id"][maxfib]
 
+    fiber_id_obj = match_string_dtype(fiber_id_obj, fibers.fiber_id)
     idx = np.where(fibers.fiber_id == fiber_id_obj)[0][0]
 
     im_fib = fibers.hdfile.root.Data.Fibers.cols.wavelength[idx]
@@ -364,7 +365,7 @@ def main(argv=None):
 
     args.log.info("Opening shot: " + str(shotid_i))
 
-    fibers = Fibers(args.shotid, survey=args.survey)
+    fibers = Fibers(args.shotid, survey=args.survey, lazy=True)
 
     if args.h5file:
 
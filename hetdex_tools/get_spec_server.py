@@ -0,0 +1,528 @@
+# -*- coding: utf-8 -*-
+"""
+
+get_spec_server.py
+==================
+
+A long running local extraction service for get_spec.py. The server
+keeps the survey table, a spatial index of the shot centres, the bad
+amp and galaxy flag tables, the PSF caches and a pool of open shot
+files in memory, and answers extraction requests over a Unix domain
+socket. A request then only pays for the extraction itself instead of
+the full start up of get_spec.py.
+
+Start the server (e.g. in the background of an interactive node)
+
+python3 get_spec_server.py --survey hdr2.1 &
+
+and call it with the same arguments as hetdex_tools.get_spec.get_spectra
+
+>>> from hetdex_tools.get_spec_server import get_spectra
+>>> coords = SkyCoord(150.02548 * u.deg, 2.087987 * u.deg)
+>>> sources = get_spectra(coords, ID='cosmos_LAE')
+
+The socket lives in a directory only accessible to the user running
+the server ($XDG_RUNTIME_DIR/hetdex_api, or a private directory in the
+temporary directory). The client refuses sockets and servers owned by
+another user. Messages are a JSON header followed by the numpy arrays
+it references in npz format, so no pickles are exchanged.
+
+"""
+
+import io
+import json
+import os
+import os.path as op
+import socket
+import socketserver
+import stat
+import struct
+import tempfile
+import time
+import types
+import logging
+import argparse as ap
+
+import numpy as np
+
+from astropy.coordinates import SkyCoord
+from astropy.table import Table, Column
+import astropy.units as u
+
+from hetdex_api.config import HDRconfig
+from hetdex_api.input_utils import setup_logging
+
+LATEST_HDR_NAME = HDRconfig.LATEST_HDR_NAME
+
+# maximum number of shot files the server keeps open
+SERVER_SHOT_FILES = 32
+
+# lengths of the JSON header and of the npz array payload
+_HEADER = struct.Struct("!QQ")
+
+
+def check_owner(path, is_type, private=False):
+    """
+    Raise PermissionError unless path is of the expected type (checked
+    without following symlinks) and owned by the current user. With
+    private=True it must also be inaccessible to other users
+    """
+    st = os.lstat(path)
+    if not is_type(st.st_mode) or st.st_uid != os.getuid():
+        raise PermissionError("%s is not owned by the current user" % path)
+    if private and st.st_mode & 0o077:
+        raise PermissionError("%s is accessible to other users" % path)
+
+
+def get_socket_dir():
+    """ Per user directory for the server socket, mode 0700 """
+    runtime_dir = os.environ.get("XDG_RUNTIME_DIR")
+    if runtime_dir and op.isdir(runtime_dir):
+        socket_dir = op.join(runtime_dir, "hetdex_api")
+    else:
+        socket_dir = op.join(tempfile.gettempdir(), "hetdex_api_%i" % os.getuid())
+
+    try:
+        os.mkdir(socket_dir, 0o700)
+    except FileExistsError:
+        pass
+    check_owner(socket_dir, stat.S_ISDIR, private=True)
+
+    return socket_dir
+
+
+def get_default_socket():
+    """ Default socket path, one per user """
+    return op.join(get_socket_dir(), "get_spec.sock")
+
+
+def check_peer(sock):
+    """ Raise PermissionError if the other end runs as another user """
+    if not hasattr(socket, "SO_PEERCRED"):
+        return
+    creds = sock.getsockopt(socket.SOL_SOCKET, socket.SO_PEERCRED, struct.calcsize("3i"))
+    pid, uid, gid = struct.unpack("3i", creds)
+    if uid != os.getuid():
+        raise PermissionError("get_spec server peer runs as another user")
+
+
+def _pack(obj, arrays):
+    """
+    JSON representation of obj. Numpy arrays are replaced by a
+    reference into arrays, astropy tables by their columns
+    """
+    if isinstance(obj, Table):
+        return {
+            "__table__": [
+                {
+                    "name": name,
+                    "unit": None if col.unit is None else col.unit.to_string(),
+                    "data": _pack(np.asarray(col), arrays),
+                }
+                for name, col in obj.columns.items()
+            ]
+        }
+    if isinstance(obj, np.ndarray):
+        if obj.dtype.kind == "O":
+            return {
+                "__objects__": [_pack(np.asarray(x), arrays) for x in obj.ravel()],
+                "shape": list(obj.shape),
+            }
+        name = "a%i" % len(arrays)
+        arrays[name] = obj
+        return {"__array__": name}
+    if isinstance(obj, np.generic):
+        return obj.item()
+    if isinstance(obj, dict):
+        return {str(key): _pack(value, arrays) for key, value in obj.items()}
+    if isinstance(obj, (list, tuple)):
+        return [_pack(value, arrays) for value in obj]
+    return obj
+
+
+def _unpack(obj, arrays):
+    """ Inverse of _pack() """
+    if isinstance(obj, dict):
+        if "__table__" in obj:
+            table = Table()
+            for col in obj["__table__"]:
+                table.add_column(
+                    Column(_unpack(col["data"], arrays), name=col["name"], unit=col["unit"])
+                )
+            return table
+        if "__array__" in obj:
+            return arrays[obj["__array__"]]
+        if "__objects__" in obj:
+            data = np.empty(len(obj["__objects__"]), dtype=object)
+            for i, value in enumerate(obj["__objects__"]):
+                data[i] = _unpack(value, arrays)
+            return data.reshape(obj["shape"])
+        return {key: _unpack(value, arrays) for key, value in obj.items()}
+    if isinstance(obj, list):
+        return [_unpack(value, arrays) for value in obj]
+    return obj
+
+
+def send_message(sock, obj):
+    """
+    Send an object of JSON types, numpy arrays and astropy tables as a
+    JSON header followed by the arrays in npz format
+    """
+    arrays = {}
+    header = json.dumps(_pack(obj, arrays)).encode()
+    buf = io.BytesIO()
+    np.savez(buf, **arrays)
+    payload = buf.getvalue()
+    sock.sendall(_HEADER.pack(len(header), len(payload)) + header + payload)
+
+
+def recv_message(sock):
+    """ Receive an object sent with send_message() """
+
+    def recv_exactly(n):
+        chunks = []
+        while n > 0:
+            chunk = sock.recv(min(n, 1 << 20))
+            if not chunk:
+                raise ConnectionError("socket closed")
+            chunks.append(chunk)
+            n -= len(chunk)
+        return b"".join(chunks)
+
+    header_size, payload_size = _HEADER.unpack(recv_exactly(_HEADER.size))
+    header = json.loads(recv_exactly(header_size).decode())
+    with np.load(io.BytesIO(recv_exactly(payload_size)), allow_pickle=False) as npz:
+        arrays = {name: npz[name] for name in npz.files}
+
+    return _unpack(header, arrays)
+
+
+class ExtractionServer:
+    def __init__(self, survey=LATEST_HDR_NAME, tpmin=0.08,
+                 max_files=SERVER_SHOT_FILES, log=None):
+        """
+        Load everything an extraction needs once
+
+        Parameters
+        ----------
+        survey
+            data release to serve
+        tpmin
+            include only shots above tpmin
+        max_files
+            number of shot files kept open in the shot pool
+        """
+        from hetdex_api.survey import Survey
+        from hetdex_api.shot import enable_shot_pool
+        from hetdex_api.spatial_index import SkyKDTree
+        from hetdex_tools import get_spec
+
+        self.get_spec = get_spec
+        self.survey = survey.lower()
+
+        if log is None:
+            self.log = setup_logging()
+        else:
+            self.log = log
+
+        start = time.time()
+
+        S = Survey(self.survey)
+        ind_good_shots = S.remove_shots()
+        if tpmin:
+            self.survey_class = S[ind_good_shots * (S.response_4540 > tpmin)]
+        else:
+            self.survey_class = S[ind_good_shots]
+
+        self.shot_tree = SkyKDTree(self.survey_class.ra, self.survey_class.dec)
+
+        get_spec.load_flag_tables()
+        enable_shot_pool(max_files=max_files)
+
+        self.log.info(
+            "Server ready for %s with %i shots in %.1f s"
+            % (self.survey, np.size(self.survey_class.shotid), time.time() - start)
+        )
+
+    def match_shots(self, coords, shotid=None, max_sep=11.0 * u.arcmin):
+        """
+        Shot to source index mapping from the resident shot centre index,
+        in the same form as Survey.get_shot_matches()
+        """
+        idx_list = self.shot_tree.query_radius(
+            np.atleast_1d(coords.ra.deg), np.atleast_1d(coords.dec.deg), max_sep
+        )
+
+        src = np.concatenate(
+            [np.full(np.size(idx), i) for i, idx in enumerate(idx_list)]
+            + [np.zeros(0, dtype=int)]
+        )
+        shot = np.concatenate(list(idx_list) + [np.zeros(0, dtype=int)])
+
+        if shotid is not None:
+            keep = np.isin(self.survey_class.shotid[shot], np.atleast_1d(shotid))
+            src, shot = src[keep], shot[keep]
+
+        # survey order, then source order within a shot
+        order = np.lexsort((src, shot))
+        src, shot = src[order], shot[order]
+
+        matched_sources = {}
+        for i in np.unique(shot):
+            matched_sources[self.survey_class.shotid[i]] = src[shot == i]
+
+        return matched_sources
+
+    def get_spectra(self, coords, ID=None, rad=3.5, shotid=None, ffsky=False,
+                    fiberweights=False, return_fiber_info=False):
+        """ Server side of get_spectra(). Returns an astropy table """
+        args = types.SimpleNamespace()
+        args.multiprocess = False
+        args.coords = coords
+        args.rad = rad * u.arcsec
+        args.survey = self.survey
+        args.ffsky = ffsky
+        args.fiberweights = fiberweights
+        args.return_fiber_info = return_fiber_info
+        args.survey_class = self.survey_class
+        args.log = self.log
+
+        if ID is None:
+            if coords.isscalar:
+                args.ID = 1
+            else:
+                args.ID = np.arange(1, len(coords) + 1)
+        else:
+            args.ID = ID
+
+        args.matched_sources = self.match_shots(coords, shotid=shotid)
+
+        Source_dict = self.get_spec.get_spectra_dictionary(args)
+
+        return self.get_spec.return_astropy_table(
+            Source_dict, fiberweights=fiberweights, return_fiber_info=return_fiber_info
+        )
+
+    def handle(self, request):
+        """ Answer one request dictionary """
+        command = request.get("command")
+
+        if command == "ping":
+            return {"survey": self.survey, "pid": os.getpid()}
+        elif command == "get_spectra":
+            survey = request.pop("survey", None)
+            if survey is not None and survey.lower() != self.survey:
+                raise ValueError(
+                    "server runs %s, not %s" % (self.survey, survey.lower())
+                )
+            kwargs = request["kwargs"]
+            kwargs["coords"] = SkyCoord(
+                kwargs.pop("ra") * u.deg, kwargs.pop("dec") * u.deg
+            )
+            return self.get_spectra(**kwargs)
+        else:
+            raise ValueError("unknown command %s" % command)
+
+
+class _RequestHandler(socketserver.BaseRequestHandler):
+    def handle(self):
+        server = self.server
+        try:
+            check_peer(self.request)
+            request = recv_message(self.request)
+        except (ConnectionError, PermissionError, ValueError):
+            return
+
+        if request.get("command") == "shutdown":
+            send_message(self.request, {"status": "ok", "result": None})
+            server.stop = True
+            return
+
+        start = time.time()
+        try:
+            response = {"status": "ok", "result": server.extraction.handle(request)}
+        except Exception as e:
+            server.extraction.log.warning("Request failed: %s" % e)
+            response = {"status": "error", "error": repr(e)}
+        server.extraction.log.info(
+            "%s answered in %.2f s" % (request.get("command"), time.time() - start)
+        )
+        send_message(self.request, response)
+
+
+def serve(extraction, socket_path=None):
+    """
+    Serve requests for an ExtractionServer on a Unix domain socket until
+    a shutdown request arrives. Requests are answered one at a time
+    """
+    if socket_path is None:
+        socket_path = get_default_socket()
+
+    if op.lexists(socket_path):
+        check_owner(socket_path, stat.S_ISSOCK)
+        if server_available(socket_path):
+            raise RuntimeError("a server is already listening on " + socket_path)
+        os.remove(socket_path)
+
+    old_umask = os.umask(0o077)
+    try:
+        server = socketserver.UnixStreamServer(socket_path, _RequestHandler)
+    finally:
+        os.umask(old_umask)
+
+    server.extraction = extraction
+    server.stop = False
+
+    extraction.log.info("Listening on " + socket_path)
+    try:
+        while not server.stop:
+            server.handle_request()
+    finally:
+        server.server_close()
+        if op.exists(socket_path):
+            os.remove(socket_path)
+
+
+def request(message, socket_path=None, timeout=None):
+    """
+    Send one request to the server and return its result. Raises
+    PermissionError if the socket or the server belongs to another user
+    """
+    if socket_path is None:
+        socket_path = get_default_socket()
+
+    check_owner(socket_path, stat.S_ISSOCK)
+
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as sock:
+        sock.settimeout(timeout)
+        sock.connect(socket_path)
+        check_peer(sock)
+        send_message(sock, message)
+        response = recv_message(sock)
+
+    if response["status"] != "ok":
+        raise RuntimeError("get_spec server error: " + response["error"])
+
+    return response["result"]
+
+
+def server_available(socket_path=None, timeout=1.0):
+    """ True if a server of the current user answers on socket_path """
+    try:
+        if socket_path is None:
+            socket_path = get_default_socket()
+        if not op.lexists(socket_path):
+            return False
+        request({"command": "ping"}, socket_path=socket_path, timeout=timeout)
+        return True
+    except (OSError, RuntimeError, ValueError):
+        return False
+
+
+def shutdown(socket_path=None):
+    """ Ask the server to exit """
+    return request({"command": "shutdown"}, socket_path=socket_path)
+
+
+def get_spectra(
+    coords,
+    ID=None,
+    rad=3.5,
+    shotid=None,
+    survey=None,
+    ffsky=False,
+    fiberweights=False,
+    return_fiber_info=False,
+    socket_path=None,
+):
+    """
+    Client for a running get_spec server with the same arguments and
+    output as hetdex_tools.get_spec.get_spectra. The tpmin cut is the
+    one the server was started with and the extraction runs in the
+    server process
+
+    Parameters
+    ----------
+    coords
+        list astropy coordinates
+    ID
+        list of ID names (must be same length as coords). Will
+        generate a running index if no ID is given
+    rad
+        radius of circular aperture to be extracted in arcsec.
+        Default is 3.5
+    shotid: int
+        list of integer shotids to do extractions on. By default
+        all shots of the server are searched
+    survey: str
+        if given, raise an error if the server runs another
+        data release
+    ffsky: bool
+        Use the full frame 2D sky subtraction model
+    fiberweights: bool
+        include the fiber_weights column
+    return_fiber_info: bool
+        include the fiber_info column
+    socket_path: str
+        server socket. Defaults to get_default_socket()
+
+    Returns
+    -------
+    sources
+        an astropy table object of source spectra with one row per
+        source ID/shotid observation
+    """
+    kwargs = {
+        "ra": np.asarray(coords.ra.deg),
+        "dec": np.asarray(coords.dec.deg),
+        "ID": ID,
+        "rad": rad,
+        "shotid": shotid,
+        "ffsky": ffsky,
+        "fiberweights": fiberweights,
+        "return_fiber_info": return_fiber_info,
+    }
+    return request(
+        {"command": "get_spectra", "survey": survey, "kwargs": kwargs},
+        socket_path=socket_path,
+    )
+
+
+def get_parser():
+    parser = ap.ArgumentParser(
+        description="""Run a local get_spec extraction server""", add_help=True
+    )
+    parser.add_argument("--survey", "-survey", type=str, default=LATEST_HDR_NAME,
+                        help="""Data Release you want to access""")
+    parser.add_argument("-tpmin", "--tpmin", type=float, default=0.08)
+    parser.add_argument("--socket", "-socket", type=str, default=None,
+                        help="""Socket path. Defaults to get_spec.sock in a
+                        private per user directory""")
+    parser.add_argument("--max_files", "-max_files", type=int,
+                        default=SERVER_SHOT_FILES,
+                        help="""Number of shot files kept open""")
+    parser.add_argument("--stop", "-stop", default=False, action="store_true",
+                        help="""Stop a running server""")
+    return parser
+
+
+def main(argv=None):
+    """ Main Function """
+    parser = get_parser()
+    args = parser.parse_args(argv)
+
+    if args.stop:
+        shutdown(socket_path=args.socket)
+        return
+
+    log = setup_logging()
+    log.setLevel(logging.INFO)
+
+    extraction = ExtractionServer(
+        survey=args.survey, tpmin=args.tpmin, max_files=args.max_files, log=log
+    )
+    serve(extraction, socket_path=args.socket)
+
+
+if __name__ == "__main__":
+    main()
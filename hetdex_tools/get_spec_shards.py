@@ -0,0 +1,331 @@
+# -*- coding: utf-8 -*-
+"""
+
+get_spec_shards.py
+==================
+
+Split a large get_spec.py extraction into shards of shots that can be
+run on separate nodes, and merge the results.
+
+plan
+    cross-match the input catalog to the survey shots once, estimate
+    the cost of every shot from its number of sources and bin the
+    shots into nshards shards of about equal cost. For every shard a
+    source catalog (shard_NNN.cat) and a shot list (shard_NNN.shots)
+    are written to outdir together with plan.json
+run
+    run the shards of a plan in a local process pool. Each shard is
+    an ordinary get_spec.py call streaming to shard_NNN.h5, so a
+    shard can equally be submitted as a Slurm job with
+
+    hetdex_get_spec -i shard_001.cat -sl shard_001.shots --h5 -o shard_001
+
+merge
+    concatenate the shard_NNN.h5 files into one HDF5 file indexed on
+    ID and shotid
+
+Examples
+--------
+
+python3 get_spec_shards.py plan -i '3dhst_input.cat' -n 16 -o shards
+python3 get_spec_shards.py run -o shards -nproc 16
+python3 get_spec_shards.py merge -o shards -f 3dhst.h5
+
+"""
+
+import os
+import os.path as op
+import glob
+import heapq
+import json
+import argparse as ap
+import numpy as np
+
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+from astropy.coordinates import SkyCoord
+from astropy.table import Table
+import astropy.units as u
+
+from hetdex_api.config import HDRconfig
+from hetdex_api.input_utils import setup_logging
+
+LATEST_HDR_NAME = HDRconfig.LATEST_HDR_NAME
+
+# time to read the fibers of a shot in units of the time to extract
+# one source. Used to weight shots with few sources when balancing
+SHOT_OVERHEAD = 50.0
+
+PLAN_FILE = "plan.json"
+
+
+def get_shard_name(ishard):
+    return "shard_%03d" % (ishard + 1)
+
+
+def estimate_shot_cost(nsources, shot_overhead=SHOT_OVERHEAD):
+    """
+    Relative cost of extracting nsources in one shot: a fixed cost for
+    reading the shot fibers plus one unit per source
+    """
+    return shot_overhead + np.asarray(nsources, dtype=float)
+
+
+def balance_shards(costs, nshards):
+    """
+    Assign items to nshards bins of about equal total cost. Items are
+    taken from the most to the least expensive and each goes into the
+    bin with the lowest total so far
+
+    Parameters
+    ----------
+    costs
+        array of item costs
+    nshards
+        number of bins
+
+    Returns
+    -------
+    shard
+        array with the bin index of each item
+    totals
+        array of the total cost of each bin
+    """
+    costs = np.asarray(costs, dtype=float)
+    nshards = int(max(1, min(nshards, np.size(costs))))
+
+    heap = [(0.0, i) for i in range(nshards)]
+    shard = np.zeros(np.size(costs), dtype=int)
+    totals = np.zeros(nshards)
+
+    for i in np.argsort(-costs, kind="stable"):
+        total, ishard = heapq.heappop(heap)
+        shard[i] = ishard
+        totals[ishard] = total + costs[i]
+        heapq.heappush(heap, (totals[ishard], ishard))
+
+    return shard, totals
+
+
+def read_catalog(infile):
+    """ Read an ID/ra/dec catalog the way get_spec.py does """
+    try:
+        table_in = Table.read(infile, format="ascii")
+        if table_in.colnames == ["col1", "col2", "col3"]:
+            table_in["col1"].name = "ID"
+            table_in["col2"].name = "ra"
+            table_in["col3"].name = "dec"
+    except Exception:
+        table_in = Table.read(infile, format="fits")
+
+    for name, alt in [("ID", "id"), ("ra", "RA"), ("dec", "DEC")]:
+        if name not in table_in.colnames:
+            table_in[alt].name = name
+
+    return table_in["ID", "ra", "dec"]
+
+
+def plan_shards(table_in, survey_class, nshards, outdir, footprint=False,
+                shot_overhead=SHOT_OVERHEAD, log=None):
+    """
+    Cross-match a catalog to the shots of a survey and write one source
+    catalog and shot list per shard
+
+    Parameters
+    ----------
+    table_in
+        astropy table with ID, ra and dec columns (degrees)
+    survey_class
+        Survey object of the shots to consider
+    nshards
+        number of shards
+    outdir
+        directory for the shard files
+    footprint
+        only keep sources on an IFU of each shot
+    shot_overhead
+        see SHOT_OVERHEAD
+
+    Returns
+    -------
+    plan
+        dictionary of the shard names, shot counts and estimated costs.
+        The list of shards is empty if no source falls on a shot
+    """
+    if not op.exists(outdir):
+        os.makedirs(outdir)
+
+    coords = SkyCoord(table_in["ra"], table_in["dec"], unit=u.deg)
+
+    matched_sources = survey_class.get_shot_matches(coords, footprint=footprint)
+    shotids = np.array(list(matched_sources.keys()), dtype=int)
+    nsources = np.array([np.size(idx) for idx in matched_sources.values()])
+
+    plan = {"shards": [], "footprint": footprint}
+
+    if np.size(shotids) == 0:
+        if log is not None:
+            log.warning("No source matches any shot, the plan has no shards")
+        return plan
+
+    costs = estimate_shot_cost(nsources, shot_overhead=shot_overhead)
+    shard, totals = balance_shards(costs, nshards)
+
+    for ishard in range(np.size(totals)):
+        name = get_shard_name(ishard)
+        sel = np.where(shard == ishard)[0]
+
+        idx = np.unique(np.concatenate([matched_sources[shotids[i]] for i in sel]))
+
+        table_in[idx].write(
+            op.join(outdir, name + ".cat"), format="ascii", overwrite=True
+        )
+        np.savetxt(op.join(outdir, name + ".shots"), np.sort(shotids[sel]), fmt="%i")
+
+        plan["shards"].append(
+            {
+                "name": name,
+                "nshots": int(np.size(sel)),
+                "nsources": int(np.sum(nsources[sel])),
+                "cost": float(totals[ishard]),
+            }
+        )
+        if log is not None:
+            log.info(
+                "%s: %i shots, %i extractions, cost %.0f"
+                % (name, np.size(sel), np.sum(nsources[sel]), totals[ishard])
+            )
+
+    return plan
+
+
+def get_shard_argv(outdir, shard, survey=LATEST_HDR_NAME, tpmin=0.08, footprint=False):
+    """ get_spec.py arguments to run one shard """
+    base = op.join(outdir, shard["name"])
+    argv = [
+        "-i", base + ".cat",
+        "-sl", base + ".shots",
+        "-o", base,
+        "--h5",
+        "--survey", survey,
+        "--tpmin", str(tpmin),
+    ]
+    if footprint:
+        argv.append("--footprint")
+    return argv
+
+
+def run_shard(argv):
+    from hetdex_tools import get_spec
+
+    get_spec.main(argv)
+    return argv
+
+
+def run_shards(outdir, nproc=None, log=None):
+    """
+    Run every shard of a plan in a local process pool. Completed shots
+    in each shard output are skipped, so an interrupted run can be
+    restarted with the same call
+    """
+    with open(op.join(outdir, PLAN_FILE), "r") as f:
+        plan = json.load(f)
+
+    argvs = [
+        get_shard_argv(outdir, shard, survey=plan["survey"], tpmin=plan["tpmin"],
+                       footprint=plan["footprint"])
+        for shard in plan["shards"]
+    ]
+
+    if nproc is None:
+        nproc = len(argvs)
+
+    with ProcessPoolExecutor(max_workers=max(1, min(nproc, len(argvs)))) as executor:
+        futures = [executor.submit(run_shard, argv) for argv in argvs]
+        for future in as_completed(futures):
+            argv = future.result()
+            if log is not None:
+                log.info("Finished shard %s" % argv[argv.index("-o") + 1])
+
+
+def get_parser():
+    parser = ap.ArgumentParser(
+        description="""Plan, run and merge sharded get_spec.py extractions""",
+        add_help=True,
+    )
+    subparsers = parser.add_subparsers(dest="command")
+
+    plan = subparsers.add_parser("plan", help="""Split a catalog into shards""")
+    plan.add_argument("-i", "--infile", help="""File with table of ID/RA/DEC""",
+                      required=True)
+    plan.add_argument("-n", "--nshards", help="""Number of shards""", type=int,
+                      required=True)
+    plan.add_argument("-o", "--outdir", help="""Directory for the shard files""",
+                      type=str, default="shards")
+    plan.add_argument("--survey", "-survey", type=str, default=LATEST_HDR_NAME,
+                      help="""Data Release you want to access""")
+    plan.add_argument("-tpmin", "--tpmin", type=float, default=0.08)
+    plan.add_argument("--footprint", "-footprint", default=False,
+                      action="store_true",
+                      help="""Only keep sources that fall on an IFU""")
+    plan.add_argument("--shot_overhead", type=float, default=SHOT_OVERHEAD,
+                      help="""Cost of reading a shot in units of one source""")
+
+    run = subparsers.add_parser("run", help="""Run the shards in a process pool""")
+    run.add_argument("-o", "--outdir", type=str, default="shards")
+    run.add_argument("-nproc", "--nproc", type=int, default=None,
+                     help="""Number of shards run at a time""")
+
+    merge = subparsers.add_parser("merge", help="""Merge the shard outputs""")
+    merge.add_argument("-o", "--outdir", type=str, default="shards")
+    merge.add_argument("-f", "--outfile", type=str, required=True,
+                       help="""Merged HDF5 file""")
+
+    return parser
+
+
+def main(argv=None):
+    """ Main Function """
+    parser = get_parser()
+    args = parser.parse_args(argv)
+    args.log = setup_logging()
+
+    if args.command == "plan":
+        from hetdex_api.survey import Survey
+
+        S = Survey(args.survey)
+        ind_good_shots = S.remove_shots()
+        if args.tpmin:
+            survey_class = S[ind_good_shots * (S.response_4540 > args.tpmin)]
+        else:
+            survey_class = S[ind_good_shots]
+
+        table_in = read_catalog(args.infile)
+        args.log.info("Planning %i shards for %i sources" % (args.nshards, len(table_in)))
+
+        plan = plan_shards(table_in, survey_class, args.nshards, args.outdir,
+                           footprint=args.footprint,
+                           shot_overhead=args.shot_overhead, log=args.log)
+        S.close()
+
+        plan["survey"] = args.survey
+        plan["tpmin"] = args.tpmin
+        with open(op.join(args.outdir, PLAN_FILE), "w") as f:
+            json.dump(plan, f, indent=2)
+
+    elif args.command == "run":
+        run_shards(args.outdir, nproc=args.nproc, log=args.log)
+
+    elif args.command == "merge":
+        from hetdex_tools.spectra_h5 import merge_spectra_h5
+
+        files = sorted(glob.glob(op.join(args.outdir, "shard_*.h5")))
+        args.log.info("Merging %i shard files to %s" % (len(files), args.outfile))
+        merge_spectra_h5(files, args.outfile)
+
+    else:
+        parser.print_help()
+
+
+if __name__ == "__main__":
+    main()
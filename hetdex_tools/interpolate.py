@@ -361,69 +361,22 @@ def make_data_cube(
 #                [-1.0*np.sin(rrot),
 #                 np.cos(rrot),0], [0,0,0]]
     
-    im_cube = np.zeros((nwave, ndim, ndim))
-
-    wave_i = wave_range[0]
-    i = 0
-
-    while wave_i <= wave_range[1]:
-        try:
-            im_src = E.make_narrowband_image(
-                ifux_cen,
-                ifuy_cen,
-                ifux,
-                ifuy,
-                data,
-                mask,
-                scale=pixscale.to(u.arcsec).value,
-                wrange=[wave_i, wave_i + dwave],
-                nchunks=1,
-                seeing_fac=fwhm,
-                convolve_image=convolve_image,
-                boxsize=imsize.to(u.arcsec).value,
-            )
-
-            im_slice = im_src[0]
-
-            if subcont:
-                zarray_blue = E.make_narrowband_image(
-                    ifux_cen,
-                    ifuy_cen,
-                    ifux,
-                    ifuy,
-                    data,
-                    mask,
-                    seeing_fac=fwhm,
-                    scale=pixscale.to(u.arcsec).value,
-                    boxsize=imsize.to(u.arcsec).value,
-                    nchunks=2,
-                    wrange=[wave_i-dcont, wave_i],
-                    convolve_image=convolve_image,
-                )
-                zarray_red = E.make_narrowband_image(
-                    ifux_cen,
-                    ifuy_cen,
-                    ifux,
-                    ifuy,
-                    data,
-                    mask,
-                    seeing_fac=fwhm,
-                    nchunks=2,
-                    scale=pixscale.to(u.arcsec).value,
-                    boxsize=imsize.to(u.arcsec).value,
-                    wrange=[wave_i + dwave, wave_i + dwave + dcont],
-                    convolve_image=convolve_image,
-                )
-
-                im_cont = (zarray_blue[0] + zarray_red[0])/(2*dcont)
-                im_slice = im_src[0] - dwave*im_cont
-    
-            im_cube[i, :, :] = im_slice
-
-        except Exception:
-            im_cube[i, :, :] = np.zeros((ndim, ndim))
-        wave_i += dwave
-        i += 1
+    im_cube = E.make_data_cube(
+        ifux_cen,
+        ifuy_cen,
+        ifux,
+        ifuy,
+        data,
+        mask,
+        scale=pixscale.to(u.arcsec).value,
+        boxsize=imsize.to(u.arcsec).value,
+        wrange=wave_range,
+        dwave=dwave,
+        seeing_fac=fwhm,
+        convolve_image=convolve_image,
+        subcont=subcont,
+        dcont=dcont,
+    )
 
     hdu = fits.PrimaryHDU(im_cube, header=w.to_header())
 
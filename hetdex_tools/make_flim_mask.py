@@ -76,7 +76,7 @@ fileh = tb.open_file(hdf_outfilename, "w")
 groupMask = fileh.create_group(fileh.root, "Mask", "Flux limit masks")
 
 # check if there are any meteors in the shot:
-met_tab = Table.read(config.meteor, format="ascii")
+met_tab = get_meteor_table(config.meteor)
 
 if shotid in met_tab["shotid"]:
     check_meteor = True
@@ -139,13 +139,25 @@ for ifu_name, tscube in flimhdf.itercubes():
         mask = np.ones_like(slice_, dtype=int)
 
     if check_amp or check_meteor:
-        for i in np.arange(0, 31):
-            for j in np.arange(0, 31):
+        # RA/DEC of the 31x31 grid, indexed [i, j]
+        ii, jj = np.meshgrid(np.arange(0, 31), np.arange(0, 31), indexing="ij")
+        ra_grid, dec_grid = wcs.wcs_pix2world(ii, jj, 0)
+
+        if check_meteor:
+            # flag the whole grid in one pass
+            flag_meteor = meteor_flags_from_radec(
+                ra_grid, dec_grid, shotid, met_tab
+            ).reshape(ii.shape)
+
+        if not check_amp:
+            mask[0:31, 0:31] = flag_meteor.T
+        else:
+            for i in np.arange(0, 31):
+                for j in np.arange(0, 31):
+
+                    coords = SkyCoord(ra_grid[i, j] * u.deg, dec_grid[i, j] * u.deg,
+                                      frame="icrs")
 
-                ra, dec = wcs.wcs_pix2world(i, j, 0)
-                coords = SkyCoord(ra * u.deg, dec * u.deg, frame="icrs")
-                
-                if check_amp:
                     flag_amp = amp_flag_from_closest_fiber(
                         coords,
                         FibIndex,
@@ -153,18 +165,15 @@ for ifu_name, tscube in flimhdf.itercubes():
                         maxdistance=12.0 * u.arcsec,
                         shotid=shotid,
                     )
-                else:
-                    flag_amp = True
 
-                if check_meteor:
-                    flag_meteor = meteor_flag_from_coords(coords, shotid)
-                    if flag_amp is not None:
-                        mask[j, i] = flag_amp * flag_meteor
+                    if check_meteor:
+                        if flag_amp is not None:
+                            mask[j, i] = flag_amp * flag_meteor[i, j]
+                        else:
+                            mask[j, i] = flag_meteor[i, j]
                     else:
-                        mask[j, i] = flag_meteor
-                else:
-                    if flag_amp is not None:
-                        mask[j, i] = flag_amp
+                        if flag_amp is not None:
+                            mask[j, i] = flag_amp
 
     if check_gal:
         # make galaxy mask
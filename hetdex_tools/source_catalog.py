@@ -21,7 +21,7 @@ from multiprocessing import Pool
 from regions import LineSkyRegion, PixCoord, LinePixelRegion
 
 from hetdex_api.config import HDRconfig
-from hetdex_api.survey import Survey
+from hetdex_api.survey import Survey, match_index
 from hetdex_api.detections import Detections
 import hetdex_tools.fof_kdtree as fof
 
@@ -41,6 +41,7 @@ wavelya = 1215.67
 waveoii = 3727.8
 
 deth5 = None
+detect_sorter = None
 
 def get_flux_noise_1sigma(detid, mask=False, add_apcor_fix=True):
 
@@ -52,14 +53,18 @@ def get_flux_noise_1sigma(detid, mask=False, add_apcor_fix=True):
     with a high flux limit value.
     """
     
-    global config, detect_table, deth5
+    global config, detect_table, deth5, detect_sorter
     
     sncut = 1
 
     if add_apcor_fix and deth5 is None:
         deth5 = tb.open_file(config.detecth5, 'r')
-    
-    sel_det = detect_table["detectid"] == detid
+
+    if detect_sorter is None:
+        detect_sorter = np.argsort(detect_table["detectid"], kind="stable")
+
+    sel_det = match_index([detid], detect_table["detectid"], sorter=detect_sorter)
+    sel_det = sel_det[sel_det >= 0]
     shotid = detect_table["shotid"][sel_det][0]
     ifuslot = detect_table["ifuslot"][sel_det][0]
     
@@ -177,12 +182,15 @@ def create_source_catalog(
     dets_all.close()
     del dets_all_table
 
-    global detect_table
+    global detect_table, detect_sorter
 
     detect_table = unique(
         vstack([detects_broad_table, detects_cont_table, detects_line_table]),
         keys='detectid')
 
+    # sorted lookup of detectid shared by the Pool workers
+    detect_sorter = np.argsort(detect_table["detectid"], kind="stable")
+
     detect_table.write('test.fits', overwrite=True)
 
     del detects_cont_table, detects_broad_table
@@ -0,0 +1,271 @@
+# -*- coding: utf-8 -*-
+"""
+
+spectra_h5.py
+=============
+
+Streaming HDF5 output for get_spec.py. The spectra of each shot are
+appended to the file as soon as the shot finishes and the shotid is
+then recorded as completed, so memory is bounded by one shot of
+spectra and a rerun on the same file skips the completed shots.
+
+The file holds two tables
+
+Spectra
+    one row per ID/shotid spectrum with the same columns as the
+    fits output of get_spec.py: ID, shotid, spec, spec_err, weights,
+    flag, gal_flag, amp_flag, meteor_flag
+Shots
+    one row per completed shot with the number of rows in Spectra
+    once the shot was written
+
+Examples
+--------
+
+python3 get_spec.py -i '3dhst_input.cat' -o '3dhst' --h5
+
+writes 3dhst.h5. If the job is killed, rerun the same command to
+continue from the last completed shot. To read the spectra back
+
+>>> from hetdex_tools.spectra_h5 import read_spectra_h5
+>>> sources = read_spectra_h5('3dhst.h5')
+
+"""
+
+import os.path as op
+import numpy as np
+import tables as tb
+
+from astropy.table import Table, Column
+import astropy.units as u
+
+NWAVE = 1036
+
+
+def get_spectra_description(id_itemsize):
+    """ Column description of the Spectra table """
+    return {
+        "ID": tb.StringCol(id_itemsize, pos=0),
+        "shotid": tb.Int64Col(pos=1),
+        "spec": tb.Float32Col(NWAVE, pos=2),
+        "spec_err": tb.Float32Col(NWAVE, pos=3),
+        "weights": tb.Float32Col(NWAVE, pos=4),
+        "flag": tb.Int32Col(pos=5),
+        "gal_flag": tb.Int32Col(pos=6),
+        "amp_flag": tb.Int32Col(pos=7),
+        "meteor_flag": tb.Int32Col(pos=8),
+    }
+
+
+class Shots(tb.IsDescription):
+    shotid = tb.Int64Col(pos=0)
+    nrows = tb.Int64Col(pos=1)
+
+
+class SpectraSink:
+    def __init__(self, filename, ID=None, resume=True):
+        """
+        Open an HDF5 file for streaming get_spec.py output
+
+        Parameters
+        ----------
+        filename
+            name of the HDF5 file
+        ID
+            input source IDs. Used to size the ID column of a new
+            file. IDs are stored as strings
+        resume
+            if True and filename exists, keep its completed shots and
+            append to it. Rows of a shot that was being written when
+            the previous run stopped are removed. If False any
+            existing file is overwritten
+
+        Raises
+        ------
+        ValueError
+            if resuming a file whose ID column is too short for one
+            of the IDs, which would otherwise be truncated
+        """
+        self.filename = filename
+
+        if ID is None:
+            id_itemsize = None
+        else:
+            id_itemsize = max([len(str(i)) for i in np.atleast_1d(ID)] + [1])
+
+        if resume and op.exists(filename):
+            self.fileh = tb.open_file(filename, mode="a")
+            self.spectra = self.fileh.root.Spectra
+            self.shots = self.fileh.root.Shots
+
+            itemsize = self.spectra.coldtypes["ID"].itemsize
+            if id_itemsize is not None and id_itemsize > itemsize:
+                self.fileh.close()
+                raise ValueError(
+                    "IDs of up to {} characters do not fit in the {} "
+                    "character ID column of {}. Use a new output file".format(
+                        id_itemsize, itemsize, filename
+                    )
+                )
+
+            if self.shots.nrows > 0:
+                nrows = self.shots.cols.nrows[-1]
+            else:
+                nrows = 0
+            if self.spectra.nrows > nrows:
+                self.spectra.remove_rows(start=nrows)
+                self.spectra.flush()
+        else:
+            if id_itemsize is None:
+                id_itemsize = 32
+
+            self.fileh = tb.open_file(filename, mode="w", title="get_spec output")
+            self.spectra = self.fileh.create_table(
+                self.fileh.root,
+                "Spectra",
+                get_spectra_description(id_itemsize),
+                "Extracted spectra",
+                expectedrows=100000,
+            )
+            self.shots = self.fileh.create_table(
+                self.fileh.root, "Shots", Shots, "Completed shots"
+            )
+
+        self.completed = set(self.shots.cols.shotid[:].tolist())
+
+    def write_shot(self, shotid, source_dict):
+        """
+        Append the spectra of one shot and record it as completed
+
+        Parameters
+        ----------
+        shotid
+            integer shotid
+        source_dict
+            dictionary of {ID: {shotid: [spec, spec_err, weights,
+            fiber_weights, fiber_info, flags]}} as returned by
+            get_spec.extract_shot()
+        """
+        row = self.spectra.row
+
+        for ID, shot_dict in source_dict.items():
+            for shot_i, values in shot_dict.items():
+                spec, spec_err, weights = values[0:3]
+                flags = values[5]
+
+                if np.sum(np.isfinite(spec)) == 0:
+                    continue
+
+                if flags is None:
+                    flags = (True, True, True, True)
+                meteor_flag, gal_flag, amp_flag, flag = flags
+
+                row["ID"] = str(ID)
+                row["shotid"] = shot_i
+                row["spec"] = spec
+                row["spec_err"] = spec_err
+                row["weights"] = weights
+                row["flag"] = flag
+                row["gal_flag"] = gal_flag
+                row["amp_flag"] = amp_flag
+                row["meteor_flag"] = meteor_flag
+                row.append()
+
+        self.spectra.flush()
+
+        # the shot is only marked complete once its spectra are on disk
+        shotrow = self.shots.row
+        shotrow["shotid"] = shotid
+        shotrow["nrows"] = self.spectra.nrows
+        shotrow.append()
+        self.shots.flush()
+
+        self.completed.add(int(shotid))
+
+    def close(self):
+        self.fileh.close()
+
+
+def read_spectra_h5(filename):
+    """
+    Read a get_spec.py HDF5 file into an astropy table with the same
+    columns as the fits output of get_spec.py
+    """
+    fileh = tb.open_file(filename, mode="r")
+    rows = fileh.root.Spectra.read()
+    fileh.close()
+
+    fluxden_u = 1e-17 * u.erg * u.s ** (-1) * u.cm ** (-2) * u.AA ** (-1)
+    wave_rect = 2.0 * np.arange(NWAVE) + 3470.0
+
+    output = Table()
+    output.add_column(Column(rows["ID"].astype(str), name="ID"))
+    output.add_column(Column(rows["shotid"], name="shotid"))
+    output.add_column(
+        Column(np.tile(wave_rect, (np.size(rows), 1)), unit=u.AA, name="wavelength")
+    )
+    output.add_column(Column(rows["spec"], unit=fluxden_u, name="spec"))
+    output.add_column(Column(rows["spec_err"], unit=fluxden_u, name="spec_err"))
+    output.add_column(Column(rows["weights"], name="weights"))
+    for name in ["flag", "gal_flag", "amp_flag", "meteor_flag"]:
+        output.add_column(Column(rows[name], name=name))
+
+    return output
+
+
+def merge_spectra_h5(files, outfile, chunksize=10000):
+    """
+    Concatenate get_spec.py HDF5 files into a single file and index it
+    on ID and shotid
+
+    Parameters
+    ----------
+    files
+        list of HDF5 files written by SpectraSink
+    outfile
+        name of the merged HDF5 file
+    chunksize
+        number of rows copied at a time
+    """
+    id_itemsize = 1
+    for filename in files:
+        with tb.open_file(filename, mode="r") as fileh:
+            id_itemsize = max(id_itemsize, fileh.root.Spectra.coldtypes["ID"].itemsize)
+
+    fileo = tb.open_file(outfile, mode="w", title="get_spec output")
+    spectra = fileo.create_table(
+        fileo.root,
+        "Spectra",
+        get_spectra_description(id_itemsize),
+        "Extracted spectra",
+        expectedrows=100000,
+    )
+    shots = fileo.create_table(fileo.root, "Shots", Shots, "Completed shots")
+
+    for filename in files:
+        with tb.open_file(filename, mode="r") as fileh:
+            table = fileh.root.Spectra
+            done = fileh.root.Shots.read()
+
+            # rows past the last completed shot belong to an unfinished shot
+            if np.size(done) > 0:
+                nrows = int(done["nrows"][-1])
+            else:
+                nrows = 0
+
+            offset = spectra.nrows
+            for start in range(0, nrows, chunksize):
+                rows = table.read(start=start, stop=min(start + chunksize, nrows))
+                spectra.append(rows.astype(spectra.dtype))
+            spectra.flush()
+
+            # row counts refer to the merged table
+            done["nrows"] += offset
+            shots.append(done)
+            shots.flush()
+
+    spectra.cols.ID.create_csindex()
+    spectra.cols.shotid.create_csindex()
+    shots.cols.shotid.create_csindex()
+
+    fileo.close()
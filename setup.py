@@ -49,7 +49,9 @@ setup(
                         'extract_sensitivity_cube = hetdex_api.flux_limits.hdf5_sensitivity_cubes:extract_sensitivity_cube',
                         'hetdex_get_spec = hetdex_tools.get_spec:main',
                         'hetdex_get_spec2D = hetdex_tools.get_spec2D:main',
-                        'hetdex_get_shots = hetdex_tools.get_shots_of_interest:main'
+                        'hetdex_get_shots = hetdex_tools.get_shots_of_interest:main',
+                        'hetdex_get_spec_shards = hetdex_tools.get_spec_shards:main',
+                        'hetdex_get_spec_server = hetdex_tools.get_spec_server:main'
                      ]
                    },
 
@@ -18,3 +18,130 @@ def datadir():
     return py.path.local(os.path.dirname(__file__)).join('data')
 
 
+
+
+# centers of the fiber clusters in the small FiberIndex test table
+FIBER_INDEX_CENTERS = [(150.0, 2.0), (150.004, 2.003), (0.001, -0.5), (210.0, 51.0)]
+
+
+@pytest.fixture
+def fiberindex_h5(tmp_path):
+    """ Write a small FiberIndex HDF5 file and return its name """
+    import numpy as np
+    import tables as tb
+    import healpy as hp
+
+    class FiberIndexRow(tb.IsDescription):
+        multiframe = tb.StringCol((20), pos=0)
+        fiber_id = tb.StringCol((38), pos=4)
+        shotid = tb.Int64Col()
+        healpix = tb.Int64Col(pos=5)
+        ra = tb.Float32Col(pos=1)
+        dec = tb.Float32Col(pos=2)
+        ifuxy = tb.Float32Col(shape=(2,))
+
+    rng = np.random.default_rng(42)
+    ra = []
+    dec = []
+    for ra0, dec0 in FIBER_INDEX_CENTERS:
+        ra.append((ra0 + rng.uniform(-15.0, 15.0, 60) / 3600.0) % 360.0)
+        dec.append(dec0 + rng.uniform(-15.0, 15.0, 60) / 3600.0)
+    ra = np.concatenate(ra)
+    dec = np.concatenate(dec)
+    nrows = np.size(ra)
+
+    data = np.zeros(nrows, dtype=tb.description.dtype_from_descr(FiberIndexRow))
+    data["ra"] = ra
+    data["dec"] = dec
+    data["shotid"] = np.where(np.arange(nrows) % 2, 20190101001, 20190101002)
+    data["multiframe"] = "multi_000_000_000_LL"
+    data["fiber_id"] = ["%d_%03d" % (s, i) for i, s in enumerate(data["shotid"])]
+    data["healpix"] = hp.ang2pix(2 ** 15, data["ra"], data["dec"], lonlat=True)
+    data["ifuxy"] = np.column_stack([np.arange(nrows), -np.arange(nrows)])
+
+    filename = str(tmp_path / "fiber_index.h5")
+    with tb.open_file(filename, mode="w") as fileh:
+        table = fileh.create_table(fileh.root, "FiberIndex", FiberIndexRow)
+        table.append(data)
+        table.cols.healpix.create_csindex()
+
+    return filename
+
+
+# fiber_id of the first fiber in the small shot file, as
+# shotid_expnum_multiframe_fibnum
+SHOT_FIBER_ID = "20190101001_1_multi_319_083_023_LL_001"
+
+
+@pytest.fixture(scope="session")
+def shot_h5_file(tmp_path_factory):
+    """
+    Write a small shot file with FiberIndex, Fibers and Images tables.
+    Pixel (i, j) of the amp image in row r of Images is
+    r * 2e6 + i * 1032 + j
+    """
+    import numpy as np
+    import tables as tb
+
+    class FiberIndexRow(tb.IsDescription):
+        multiframe = tb.StringCol((20), pos=0)
+        ra = tb.Float32Col(pos=1)
+        dec = tb.Float32Col(pos=2)
+        fiber_id = tb.StringCol((38), pos=4)
+        fibidx = tb.Int32Col()
+        expnum = tb.Int32Col()
+
+    class FiberRow(tb.IsDescription):
+        wavelength = tb.Float32Col((1032,))
+        trace = tb.Float32Col((1032,))
+
+    class ImageRow(tb.IsDescription):
+        multiframe = tb.StringCol((20), pos=0)
+        expnum = tb.Int32Col(pos=1)
+        clean_image = tb.Float32Col((1032, 1032))
+
+    multiframes = ["multi_319_083_023_LL", "multi_319_083_023_RU"]
+    rows = [(mf, exp, fib) for mf in multiframes for exp in [1, 2] for fib in range(10)]
+
+    index = np.zeros(len(rows), dtype=tb.description.dtype_from_descr(FiberIndexRow))
+    index["multiframe"] = [mf for mf, exp, fib in rows]
+    index["expnum"] = [exp for mf, exp, fib in rows]
+    index["fibidx"] = [fib for mf, exp, fib in rows]
+    index["fiber_id"] = [
+        "20190101001_%d_%s_%03d" % (exp, mf, fib + 1) for mf, exp, fib in rows
+    ]
+    index["ra"] = 150.0 + np.arange(len(rows)) / 3600.0
+    index["dec"] = 2.0
+
+    fibers = np.zeros(len(rows), dtype=tb.description.dtype_from_descr(FiberRow))
+    fibers["wavelength"] = 3470.0 + 2.0 * np.arange(1032)
+    fibers["trace"] = 100.0 + 20.0 * np.array([fib for mf, exp, fib in rows])[:, None]
+
+    pixels = np.arange(1032 * 1032, dtype=np.float32).reshape(1032, 1032)
+
+    filename = str(tmp_path_factory.mktemp("shot") / "20190101v001.h5")
+    with tb.open_file(filename, mode="w") as fileh:
+        group = fileh.create_group(fileh.root, "Data")
+        fileh.create_table(group, "FiberIndex", FiberIndexRow).append(index)
+        fileh.create_table(group, "Fibers", FiberRow).append(fibers)
+        images = fileh.create_table(group, "Images", ImageRow)
+        for i, (mf, exp) in enumerate([(mf, exp) for mf in multiframes for exp in [1, 2]]):
+            images.append([(mf, exp, pixels + i * 2e6)])
+
+    return filename
+
+
+@pytest.fixture
+def shot_h5(shot_h5_file, monkeypatch):
+    """ Make open_shot_file() open the small shot file for any shotid """
+    import tables as tb
+    import hetdex_api.shot as shot
+
+    monkeypatch.setattr(
+        shot,
+        "_open_shot_file",
+        lambda shotid, survey="hdr2.1": tb.open_file(shot_h5_file),
+    )
+    shot.clear_amp_image_cache()
+    yield shot_h5_file
+    shot.clear_amp_image_cache()
@@ -0,0 +1,76 @@
+"""
+
+Test the Images row lookup and the LRU cache of
+decoded amp images
+
+"""
+import pytest
+
+import hetdex_api.shot as shot
+
+
+@pytest.fixture
+def fileh(shot_h5):
+    fileh = shot.open_shot_file(20190101001)
+    yield fileh
+    shot.close_shot_file(fileh)
+
+
+def test_images_row_index(fileh):
+    index = shot.get_images_row_index(fileh)
+    assert index == {
+        ("multi_319_083_023_LL", 1): 0,
+        ("multi_319_083_023_LL", 2): 1,
+        ("multi_319_083_023_RU", 1): 2,
+        ("multi_319_083_023_RU", 2): 3,
+    }
+    # built once per file
+    assert shot.get_images_row_index(fileh) is index
+
+    im_str = shot.read_amp_image(fileh, multiframe="multi_319_083_023_RU", expnum=2)
+    im_bytes = shot.read_amp_image(fileh, multiframe=b"multi_319_083_023_RU", expnum=2)
+    im_row = shot.read_amp_image(fileh, row=3)
+    assert im_str is im_bytes and im_str is im_row
+    assert im_str[0, 0] == 3 * 2e6 and im_str[1, 2] == 3 * 2e6 + 1032 + 2
+
+
+def test_amp_image_is_cached_read_only(fileh):
+    im = shot.read_amp_image(fileh, multiframe="multi_319_083_023_LL", expnum=1)
+    assert not im.flags.writeable
+    with pytest.raises(ValueError):
+        im[0, 0] = 1.0
+
+    assert shot.read_amp_image(fileh, multiframe="multi_319_083_023_LL", expnum=1) is im
+    assert shot._amp_image_cache_nbytes == im.nbytes
+
+
+def test_amp_image_cache_eviction(fileh, monkeypatch):
+    nbytes = 1032 * 1032 * 4
+    # room for two images
+    monkeypatch.setattr(shot, "AMP_IMAGE_CACHE_MB", 2.5 * nbytes / 1e6)
+
+    first = shot.read_amp_image(fileh, row=0)
+    shot.read_amp_image(fileh, row=1)
+    # row 0 is now the most recently used
+    assert shot.read_amp_image(fileh, row=0) is first
+    shot.read_amp_image(fileh, row=2)
+
+    keys = [key[1] for key in shot._amp_image_cache]
+    assert keys == [0, 2]
+    assert shot._amp_image_cache_nbytes == 2 * nbytes
+
+    assert shot.read_amp_image(fileh, row=0) is first
+    assert shot.read_amp_image(fileh, row=1) is not None
+    assert [key[1] for key in shot._amp_image_cache] == [0, 1]
+
+
+def test_clear_amp_image_cache(fileh):
+    shot.read_amp_image(fileh, multiframe="multi_319_083_023_LL", expnum=2)
+    assert shot._amp_image_cache_nbytes > 0
+    assert fileh.filename in shot._images_row_index
+
+    shot.clear_amp_image_cache()
+
+    assert len(shot._amp_image_cache) == 0
+    assert shot._amp_image_cache_nbytes == 0
+    assert len(shot._images_row_index) == 0
@@ -0,0 +1,31 @@
+"""
+
+Test that the sparse data cube builder reproduces
+make_narrowband_image slice by slice
+
+"""
+import numpy as np
+from hetdex_api.extract import Extract
+
+
+def test_data_cube_matches_narrowband_images():
+    E = Extract()
+    E.get_ADR(angle=30.0)
+
+    rng = np.random.default_rng(0)
+    xloc = rng.uniform(-8.0, 8.0, 150)
+    yloc = rng.uniform(-8.0, 8.0, 150)
+    data = rng.normal(1.0, 0.3, (150, E.wave.size))
+    mask = np.ones_like(data)
+
+    kwargs = dict(scale=0.5, boxsize=12.0, seeing_fac=1.8, convolve_image=True)
+    cube = E.make_data_cube(
+        0.3, -0.2, xloc, yloc, data, mask, wrange=[4000, 4020], dwave=2.0,
+        adr_tol=1e-9, **kwargs
+    )
+
+    for i, wave in enumerate(4000 + 2.0 * np.arange(cube.shape[0])):
+        image = E.make_narrowband_image(
+            0.3, -0.2, xloc, yloc, data, mask, wrange=[wave, wave + 2.0], **kwargs
+        )[0]
+        assert np.allclose(cube[i], image, atol=1e-10)
@@ -0,0 +1,72 @@
+"""
+
+Test the batched KD-tree matching of Detections against a
+direct separation and wavelength search
+
+"""
+import numpy as np
+import astropy.units as u
+from astropy.coordinates import SkyCoord
+
+from hetdex_api.detections import Detections
+
+
+def make_detections(ndet=5000, seed=1):
+    rng = np.random.default_rng(seed)
+    detects = Detections.__new__(Detections)
+    detects.lazy = False
+    detects.detectid = np.arange(ndet) + 2100000000
+    detects.ra = rng.uniform(150.0, 150.2, ndet)
+    detects.dec = rng.uniform(2.0, 2.2, ndet)
+    detects.wave = rng.uniform(3500.0, 5500.0, ndet)
+    detects.shotid = rng.choice([20190101001, 20190101002], ndet)
+    detects.coords = SkyCoord(detects.ra * u.deg, detects.dec * u.deg)
+    return detects
+
+
+def test_find_match_many():
+    detects = make_detections()
+    rng = np.random.default_rng(2)
+    coords = SkyCoord(
+        rng.uniform(150.0, 150.2, 50) * u.deg, rng.uniform(2.0, 2.2, 50) * u.deg
+    )
+    wave = rng.uniform(3500.0, 5500.0, 50)
+    radius = 20.0 * u.arcsec
+
+    idx_list = detects.find_match_many(coords, radius=radius, wave=wave, dwave=50.0)
+    best_idx, best_sep = detects.find_nearest_match(
+        coords, radius=radius, wave=wave, dwave=50.0
+    )
+
+    for i, coord in enumerate(coords):
+        sep = detects.coords.separation(coord)
+        expected = np.where((sep < radius) & (np.abs(detects.wave - wave[i]) < 50.0))[0]
+        assert np.array_equal(idx_list[i], expected)
+
+        if np.size(expected) > 0:
+            assert best_idx[i] == expected[np.argmin(sep[expected])]
+            assert np.isclose(best_sep[i].to_value(u.arcsec), np.min(sep[expected]).arcsec)
+        else:
+            assert best_idx[i] == -1
+
+    # the single coordinate API returns the same matches as a mask
+    mask = detects.find_match(coords[0], radius=radius, wave=wave[0], dwave=50.0)
+    assert np.array_equal(np.where(mask)[0], idx_list[0])
+
+
+def test_query_by_wave_and_slicing():
+    detects = make_detections()
+
+    idx = detects.query_by_wave_many([4000.0, 5000.0], dwave=10.0)
+    for i, w in enumerate([4000.0, 5000.0]):
+        assert np.array_equal(idx[i], np.where(np.abs(detects.wave - w) < 10.0)[0])
+
+    coord = SkyCoord(150.1 * u.deg, 2.1 * u.deg)
+    mask = detects.query_by_coords(coord, 1.0 * u.arcmin)
+
+    # the index of a sliced object is rebuilt for its own rows
+    subset = detects[detects.shotid == 20190101001]
+    submask = subset.query_by_coords(coord, 1.0 * u.arcmin)
+    assert np.array_equal(
+        subset.detectid[submask], detects.detectid[mask & (detects.shotid == 20190101001)]
+    )
@@ -0,0 +1,49 @@
+"""
+
+Test the vectorized extinction and aperture
+correction functions against the per-detection
+loops they replace
+
+"""
+import numpy as np
+import extinction
+from hetdex_api.extinction import get_deredden_factor, get_apcor_at_wave
+
+
+def test_deredden_factor_matches_fitzpatrick99():
+    rng = np.random.default_rng(0)
+    wave = rng.uniform(3500.0, 5500.0, 500)
+    ebv = rng.uniform(0.0, 0.1, 500)
+    Rv = 2.742
+
+    expected = [
+        10 ** (0.4 * extinction.fitzpatrick99(np.array([w]), Rv * e, Rv)[0])
+        for w, e in zip(wave, ebv)
+    ]
+
+    assert np.allclose(get_deredden_factor(wave, ebv, Rv=Rv), expected, rtol=1e-12)
+
+
+def test_apcor_at_wave_matches_loop():
+    rng = np.random.default_rng(1)
+    wave = rng.uniform(3500.0, 5500.0, 300)
+    wave_spec = np.tile(np.linspace(3470.0, 5540.0, 1036), (300, 1))
+    apcor = rng.uniform(0.5, 1.0, (300, 1036))
+
+    expected = [
+        apcor[i, np.where(wave_spec[i, :] > wave[i])[0][0]] for i in range(300)
+    ]
+
+    assert np.array_equal(
+        get_apcor_at_wave(wave, wave_spec, apcor, chunksize=128), expected
+    )
+
+
+def test_apcor_at_wave_beyond_red_end():
+    wave = np.array([3400.0, 3470.0, 5540.0, 6000.0])
+    wave_spec = np.tile(np.linspace(3470.0, 5540.0, 1036), (4, 1))
+    apcor = np.tile(np.linspace(0.5, 1.0, 1036), (4, 1))
+
+    result = get_apcor_at_wave(wave, wave_spec, apcor)
+
+    assert np.array_equal(result, [apcor[0, 0], apcor[0, 1], 1.0, 1.0])
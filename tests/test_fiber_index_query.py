@@ -0,0 +1,100 @@
+"""
+
+Test the batched FiberIndex positional queries against
+a per-coordinate healpix disc search
+
+"""
+import numpy as np
+import pytest
+import tables as tb
+import healpy as hp
+import astropy.units as u
+from astropy.coordinates import SkyCoord
+
+import hetdex_api.survey as survey
+from conftest import FIBER_INDEX_CENTERS
+
+NSIDE = 2 ** 15
+
+
+class FakeConfig:
+    def __init__(self, fiberindexh5):
+        self.fiberindexh5 = fiberindexh5
+
+
+@pytest.fixture
+def fiber_index(fiberindex_h5, monkeypatch):
+    config = FakeConfig(fiberindex_h5)
+    monkeypatch.setattr(survey, "HDRconfig", lambda survey: config)
+
+    fiber_index = survey.FiberIndex()
+    yield fiber_index
+    fiber_index.close()
+
+
+def query_disc_loop(table, coord, radius, shotid=None):
+    """ One healpix read per pixel of the disc, as before batching """
+    ra_sep = radius.to(u.degree).value + 3.0 / 3600.0
+    vec = hp.ang2vec(coord.ra.deg, coord.dec.deg, lonlat=True)
+
+    rows = [table.read_where("healpix == hpix") for hpix in hp.query_disc(
+        NSIDE, vec, ra_sep * np.pi / 180)]
+    rows = np.concatenate([np.zeros(0, dtype=table.dtype)] + rows)
+
+    if shotid:
+        rows = rows[rows["shotid"] == shotid]
+
+    fibcoords = SkyCoord(rows["ra"] * u.deg, rows["dec"] * u.deg)
+    return rows[coord.separation(fibcoords) < radius]
+
+
+def test_discs_are_not_contiguous():
+    coords = SkyCoord([c[0] for c in FIBER_INDEX_CENTERS] * u.deg,
+                      [c[1] for c in FIBER_INDEX_CENTERS] * u.deg)
+    ra_sep = (10.0 + 3.0) / 3600.0 * np.pi / 180
+    vec = hp.ang2vec(coords.ra.deg, coords.dec.deg, lonlat=True)
+
+    for v in vec:
+        pix = np.sort(hp.query_disc(NSIDE, v, ra_sep))
+        assert np.any(np.diff(pix) != 1)
+
+
+@pytest.mark.parametrize("shotid", [None, 20190101001, 1])
+def test_query_region_many(fiber_index, shotid):
+    ra = [c[0] for c in FIBER_INDEX_CENTERS] + [30.0]
+    dec = [c[1] for c in FIBER_INDEX_CENTERS] + [-30.0]
+    coords = SkyCoord(ra * u.deg, dec * u.deg)
+    radius = 10.0 * u.arcsec
+
+    tables = fiber_index.query_region_many(coords, radius=radius, shotid=shotid)
+    assert len(tables) == len(coords)
+
+    for coord, tab in zip(coords, tables):
+        expected = query_disc_loop(
+            fiber_index.hdfile.root.FiberIndex, coord, radius, shotid=shotid
+        )
+        assert sorted(tab["fiber_id"]) == sorted(expected["fiber_id"].astype(str))
+        if shotid:
+            assert np.all(tab["shotid"] == shotid)
+
+    # the last coordinate has no fibers and shotid 1 does not exist
+    assert len(tables[-1]) == 0
+    if shotid == 1:
+        assert all(len(tab) == 0 for tab in tables)
+    else:
+        assert all(len(tab) > 0 for tab in tables[:-1])
+
+
+def test_get_closest_fiberid(fiber_index):
+    rows = fiber_index.hdfile.root.FiberIndex.read()
+    fibcoords = SkyCoord(rows["ra"] * u.deg, rows["dec"] * u.deg)
+
+    for ra, dec in FIBER_INDEX_CENTERS:
+        coord = SkyCoord(ra * u.deg, dec * u.deg)
+        sep = coord.separation(fibcoords)
+        assert np.min(sep) < 8.0 * u.arcsec
+        expected = rows["fiber_id"][np.argmin(sep)].decode()
+        assert fiber_index.get_closest_fiberid(coord) == expected
+
+    empty = SkyCoord(30.0 * u.deg, -30.0 * u.deg)
+    assert fiber_index.get_closest_fiberid(empty) is None
@@ -0,0 +1,89 @@
+"""
+
+Test that the memory-mapped FiberIndex sidecar gives
+the same answers as the HDF5 FiberIndex table
+
+"""
+import numpy as np
+import pytest
+import tables as tb
+import astropy.units as u
+from astropy.coordinates import SkyCoord
+
+import hetdex_api.survey as survey
+from h5tools.create_fiber_index_sidecar import write_fiberindex_sidecar
+from conftest import FIBER_INDEX_CENTERS
+
+
+class FakeConfig:
+    def __init__(self, fiberindexh5, sidecar):
+        self.fiberindexh5 = fiberindexh5
+        self.fiberindex_sidecar = sidecar
+
+
+@pytest.fixture
+def fiber_indexes(fiberindex_h5, tmp_path, monkeypatch):
+    sidecar = str(tmp_path / "sidecar")
+
+    with tb.open_file(fiberindex_h5, mode="r") as fileh:
+        write_fiberindex_sidecar(fileh.root.FiberIndex, sidecar, chunksize=50)
+
+    config = FakeConfig(fiberindex_h5, sidecar)
+    monkeypatch.setattr(survey, "HDRconfig", lambda survey: config)
+
+    h5 = survey.FiberIndex()
+    mm = survey.FiberIndex(memmap=True, sidecar=sidecar)
+    yield h5, mm
+    h5.close()
+    mm.close()
+
+
+def sort_rows(table):
+    return table[np.argsort(np.asarray(table["fiber_id"]))]
+
+
+def assert_same_rows(tab_h5, tab_mm):
+    assert tab_h5.colnames == tab_mm.colnames
+    assert len(tab_h5) == len(tab_mm)
+    tab_h5 = sort_rows(tab_h5)
+    tab_mm = sort_rows(tab_mm)
+    for name in tab_h5.colnames:
+        np.testing.assert_array_equal(tab_h5[name], tab_mm[name])
+
+
+def test_sidecar_columns(fiberindex_h5, fiber_indexes):
+    h5, mm = fiber_indexes
+
+    assert np.all(np.diff(mm.healpix) >= 0)
+    assert mm.ifuxy.shape == (mm.healpix.size, 2)
+
+    with tb.open_file(fiberindex_h5, mode="r") as fileh:
+        assert mm.colnames == fileh.root.FiberIndex.colnames
+
+
+@pytest.mark.parametrize("shotid", [None, 20190101001])
+@pytest.mark.parametrize("center", FIBER_INDEX_CENTERS)
+def test_sidecar_query_region(fiber_indexes, center, shotid):
+    h5, mm = fiber_indexes
+    coords = SkyCoord(center[0] * u.deg, center[1] * u.deg)
+
+    tab_h5 = h5.query_region(coords, radius=10.0 * u.arcsec, shotid=shotid)
+    tab_mm = mm.query_region(coords, radius=10.0 * u.arcsec, shotid=shotid)
+
+    assert len(tab_h5) > 0
+    assert_same_rows(tab_h5, tab_mm)
+
+
+@pytest.mark.parametrize("shotid", [None, 20190101002])
+def test_sidecar_get_fib_from_hp(fiber_indexes, shotid):
+    h5, mm = fiber_indexes
+
+    for hpix in np.unique(mm.healpix):
+        assert_same_rows(
+            h5.get_fib_from_hp(hpix, shotid=shotid),
+            mm.get_fib_from_hp(hpix, shotid=shotid),
+        )
+
+    # a pixel without fibers
+    assert len(mm.get_fib_from_hp(1, shotid=shotid)) == 0
+    assert len(h5.get_fib_from_hp(1, shotid=shotid)) == 0
@@ -0,0 +1,117 @@
+"""
+
+Test the indexed region query on a shot Fibers table
+against a brute-force angular separation cut, for
+sources across RA=0/360 and near the poles
+
+"""
+import numpy as np
+import pytest
+import tables as tb
+import astropy.units as u
+from astropy.coordinates import SkyCoord
+from astropy.table import Table
+
+import hetdex_api.shot as shot
+from hetdex_api.spatial_index import angular_separation
+
+SOURCES = [
+    (0.0002, 0.0),
+    (359.9998, 10.0),
+    (0.0, -45.0),
+    (180.0, 89.9995),
+    (90.0, -89.999),
+    (45.0, 89.9),
+]
+
+
+class FiberRow(tb.IsDescription):
+    multiframe = tb.StringCol((20), pos=0)
+    ra = tb.Float32Col(pos=1)
+    dec = tb.Float32Col(pos=2)
+    fiber_id = tb.StringCol((38), pos=4)
+    calfib = tb.Float32Col((4,))
+
+
+@pytest.fixture
+def shot_file(tmp_path, monkeypatch):
+    rng = np.random.default_rng(3)
+    ra = []
+    dec = []
+    for ra0, dec0 in SOURCES:
+        # fibers out to 20" around each source, with RA offsets scaled so
+        # they also spread all the way around the poles
+        r = rng.uniform(0.0, 20.0, 400) / 3600.0
+        theta = rng.uniform(0.0, 2.0 * np.pi, 400)
+        dec_i = dec0 + r * np.sin(theta)
+        over = np.abs(dec_i) > 90.0
+        dec_i[over] = np.sign(dec_i[over]) * 180.0 - dec_i[over]
+        ra_i = ra0 + r * np.cos(theta) / np.cos(np.deg2rad(dec_i))
+        ra_i[over] += 180.0
+        ra.append(np.mod(ra_i, 360.0))
+        dec.append(dec_i)
+
+    data = np.zeros(400 * len(SOURCES), dtype=tb.description.dtype_from_descr(FiberRow))
+    data["ra"] = np.concatenate(ra)
+    data["dec"] = np.concatenate(dec)
+    data["fiber_id"] = ["fib_%04d" % i for i in range(np.size(data))]
+    data["multiframe"] = "multi_000_000_000_LL"
+    data["calfib"] = np.arange(np.size(data))[:, None]
+
+    filename = str(tmp_path / "shot.h5")
+    with tb.open_file(filename, mode="w") as fileh:
+        group = fileh.create_group(fileh.root, "Data")
+        table = fileh.create_table(group, "Fibers", FiberRow)
+        table.append(data)
+        table.cols.ra.create_csindex()
+
+    monkeypatch.setattr(
+        shot, "_open_shot_file", lambda shotid, survey="hdr2.1": tb.open_file(filename)
+    )
+    return data
+
+
+def brute_force(data, ra, dec, radius):
+    sep = angular_separation(ra, dec, data["ra"], data["dec"])
+    return data[sep < radius / 3600.0]
+
+
+@pytest.mark.parametrize("radius", [3.0, 10.0])
+def test_read_fibers_in_region(shot_file, radius):
+    coords = SkyCoord([s[0] for s in SOURCES] * u.deg, [s[1] for s in SOURCES] * u.deg)
+
+    fileh = shot.open_shot_file(20190101001)
+    rows_list = shot.read_fibers_in_region(fileh.root.Data.Fibers, coords, radius)
+    shot.close_shot_file(fileh)
+
+    assert len(rows_list) == len(SOURCES)
+    for (ra, dec), rows in zip(SOURCES, rows_list):
+        expected = brute_force(shot_file, ra, dec, radius)
+        assert np.size(expected) > 0
+        assert sorted(rows["fiber_id"]) == sorted(expected["fiber_id"])
+
+
+def test_get_fibers_table(shot_file):
+    coords = SkyCoord([s[0] for s in SOURCES] * u.deg, [s[1] for s in SOURCES] * u.deg)
+
+    tables = shot.get_fibers_table(20190101001, coords=coords, radius=5.0 * u.arcsec)
+    assert isinstance(tables, list) and len(tables) == len(SOURCES)
+    for (ra, dec), tab in zip(SOURCES, tables):
+        assert isinstance(tab, Table)
+        expected = brute_force(shot_file, ra, dec, 5.0)
+        assert sorted(tab["fiber_id"]) == sorted(expected["fiber_id"].astype(str))
+
+    # a scalar coordinate gives a single table, an empty region None
+    tab = shot.get_fibers_table(20190101001, coords=coords[0], radius=5.0)
+    assert isinstance(tab, Table) and len(tab) == len(tables[0])
+
+    rows = shot.get_fibers_table(
+        20190101001, coords=coords[0], radius=5.0, astropy=False
+    )
+    assert isinstance(rows, np.ndarray)
+    np.testing.assert_array_equal(rows["calfib"], tab["calfib"])
+
+    empty = SkyCoord(120.0 * u.deg, 30.0 * u.deg)
+    assert shot.get_fibers_table(20190101001, coords=empty) is None
+    assert shot.get_fibers_table(20190101001, coords=SkyCoord(
+        [120.0, 0.0002] * u.deg, [30.0, 0.0] * u.deg))[0] is None
@@ -0,0 +1,83 @@
+"""
+
+Test that lazy and eager Fibers objects give the same
+column values and fiber lookups
+
+"""
+import numpy as np
+import pytest
+import tables as tb
+
+import hetdex_api.shot as shot
+from hetdex_api.shot import Fibers
+from conftest import SHOT_FIBER_ID
+
+
+@pytest.fixture
+def fibers(shot_h5):
+    opened = {
+        "eager": Fibers(20190101001),
+        "lazy": Fibers(20190101001, lazy=True),
+        "bytes": Fibers(20190101001, lazy=True, unicode=False),
+    }
+    yield opened
+    for fib in opened.values():
+        fib.close()
+
+
+def test_lazy_columns_match_eager(shot_h5, fibers):
+    with tb.open_file(shot_h5) as fileh:
+        colnames = fileh.root.Data.FiberIndex.colnames
+
+    # only ra and dec are read when a lazy object is opened
+    assert "fiber_id" not in fibers["lazy"].__dict__
+
+    for name in colnames:
+        eager = getattr(fibers["eager"], name)
+        lazy = getattr(fibers["lazy"], name)
+        assert eager.dtype == lazy.dtype
+        np.testing.assert_array_equal(eager, lazy)
+
+    assert fibers["lazy"].fiber_id.dtype.kind == "U"
+    assert fibers["lazy"].fiber_id[0] == SHOT_FIBER_ID
+    np.testing.assert_array_equal(
+        fibers["lazy"].coords.ra.deg, fibers["eager"].coords.ra.deg
+    )
+
+
+def test_lazy_bytes_columns(fibers):
+    fiber_id = fibers["bytes"].fiber_id
+    assert fiber_id.dtype.kind == "S"
+    np.testing.assert_array_equal(fiber_id.astype(str), fibers["eager"].fiber_id)
+
+
+@pytest.mark.parametrize("mode", ["eager", "lazy", "bytes"])
+def test_get_fib_image2D(fibers, mode):
+    fib = fibers[mode]
+
+    # the fiber trace is at x=100 and 4000AA is pixel y=265
+    im = fib.get_fib_image2D(wave_obj=4000.0, fiber_id=SHOT_FIBER_ID)
+    assert im.shape == (40, 60)
+    assert im[20, 30] == 100 * 1032 + 265
+
+    # the same fiber in exposure 2 of the RU amp, by multiframe
+    im = fib.get_fib_image2D(
+        wave_obj=4000.0,
+        multiframe_obj="multi_319_083_023_RU",
+        fibnum_obj=1,
+        expnum_obj=2,
+    )
+    assert im[20, 30] == 3 * 2e6 + 100 * 1032 + 265
+
+
+@pytest.mark.parametrize("pool", [False, True])
+def test_shared_fibers_decode(shot_h5, pool):
+    if pool:
+        shot.enable_shot_pool()
+    try:
+        fib = shot.get_shot_fibers(20190101001)
+        assert fib.multiframe.dtype.kind == "U"
+        assert fib.fiber_id[0] == SHOT_FIBER_ID
+        fib.close()
+    finally:
+        shot.disable_shot_pool()
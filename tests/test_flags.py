@@ -0,0 +1,106 @@
+"""
+
+Test the vectorized source flags against the per source
+implementations in hetdex_api.mask
+
+"""
+import numpy as np
+import astropy.units as u
+from astropy.coordinates import SkyCoord
+from astropy.table import Table
+
+from hetdex_api.mask import (
+    amp_flag_from_fiberid,
+    amp_flags_from_fiberids,
+    get_amp_flag_index,
+    gal_flag_from_coords,
+    gal_flags_from_radec,
+    get_galaxy_index,
+    meteor_distance,
+    meteor_flags_from_radec,
+)
+from hetdex_api.spatial_index import angular_separation
+
+
+def test_amp_flags():
+    bad_amps = Table(
+        {
+            "shotid": [20190101001, 20190101001, 20190101002],
+            "multiframe": ["multi_319_083_023_LL", "multi_319_083_023_RU",
+                           "multi_319_083_023_LL"],
+            "flag": [1, 0, 0],
+        }
+    )
+    fiberids = [
+        "20190101001_1_multi_319_083_023_LL_001",
+        "20190101001_2_multi_319_083_023_RU_011",
+        "20190101002_3_multi_319_083_023_LL_101",
+    ]
+    flags = amp_flags_from_fiberids(fiberids + ["20190101003_1_multi_319_083_023_LL_001"],
+                                    get_amp_flag_index(bad_amps))
+
+    assert list(flags[:3]) == [bool(amp_flag_from_fiberid(f, bad_amps)) for f in fiberids]
+    # amps missing from the table are not flagged
+    assert flags[3]
+
+    # nothing is flagged when the table is empty
+    flags = amp_flags_from_fiberids(fiberids, get_amp_flag_index(bad_amps[:0]))
+    assert flags.dtype == bool and list(flags) == [True, True, True]
+
+
+def test_gal_flags_match_regions():
+    rng = np.random.default_rng(3)
+    galaxy_cat = Table(
+        {
+            "Coords": ["10h00m00s +02d00m00s", "12h00m00s +50d00m00s"],
+            "SemiMajorAxis": [1.5, 1.0],
+            "SemiMinorAxis": [0.4, 0.6],
+            "PositionAngle": [30.0, 120.0],
+        }
+    )
+    gal_coords = SkyCoord(galaxy_cat["Coords"])
+
+    ra = np.concatenate(
+        [c.ra.deg + rng.uniform(-0.05, 0.05, 50) / np.cos(c.dec.rad) for c in gal_coords]
+    )
+    dec = np.concatenate([c.dec.deg + rng.uniform(-0.05, 0.05, 50) for c in gal_coords])
+
+    flags = gal_flags_from_radec(ra, dec, get_galaxy_index(galaxy_cat))
+    expected = [
+        gal_flag_from_coords(SkyCoord(r, d, unit="deg"), galaxy_cat)
+        for r, d in zip(ra, dec)
+    ]
+
+    assert list(flags) == expected
+    assert np.any(flags) and not np.all(flags)
+
+
+def test_meteor_flags():
+    met_tab = Table({"shotid": [1, 2], "a": [1.0, 2.0], "b": [0.02, -0.01]})
+
+    ra = np.full(4, 100.0)
+    offset = np.array([5.0, 20.0, 5.0, 5.0]) / 3600.0
+    dec = 1.0 + 0.02 * ra + offset
+    shotid = np.array([1, 1, 2, 3])
+
+    flags = meteor_flags_from_radec(ra, dec, shotid, met_tab, streaksize=12 * u.arcsec)
+
+    # only the position within 12 arcsec of the streak of its own shot
+    assert list(flags) == [False, True, True, True]
+
+
+def test_meteor_distance_matches_sampled_track():
+    rng = np.random.default_rng(4)
+    ra0, dec0, b = 200.0, 50.0, -0.7
+    a = dec0 - b * ra0
+
+    ra = ra0 + rng.uniform(-0.2, 0.2, 40)
+    dec = dec0 + b * (ra - ra0) + rng.uniform(-30.0, 30.0, 40) / 3600.0
+
+    dist = meteor_distance(ra, dec, a, b)
+
+    # the sampled search of meteor_flag_from_coords
+    for k in range(np.size(ra)):
+        ra_met = ra[k] + np.arange(-180, 180, 0.05) / 3600.0
+        sampled = np.min(angular_separation(ra[k], dec[k], ra_met, a + b * ra_met))
+        assert abs(dist[k] - sampled) * 3600.0 < 0.1
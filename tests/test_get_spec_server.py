@@ -0,0 +1,100 @@
+"""
+
+Test the get_spec server protocol and its resident
+shot index against Survey.get_shot_matches
+
+"""
+import os
+import socket
+import threading
+import types
+import numpy as np
+import pytest
+import astropy.units as u
+from astropy.coordinates import SkyCoord
+from astropy.table import Table
+
+from hetdex_api.input_utils import setup_logging
+from hetdex_api.spatial_index import SkyKDTree
+from hetdex_api.survey import Survey
+import hetdex_tools.get_spec_server as server
+
+
+def make_server():
+    rng = np.random.default_rng(4)
+    extraction = server.ExtractionServer.__new__(server.ExtractionServer)
+    extraction.survey = "hdr2.1"
+    extraction.log = setup_logging()
+    extraction.survey_class = types.SimpleNamespace(
+        ra=rng.uniform(149.0, 151.0, 40),
+        dec=rng.uniform(1.0, 3.0, 40),
+        shotid=20190101000 + np.arange(40),
+    )
+    extraction.shot_tree = SkyKDTree(
+        extraction.survey_class.ra, extraction.survey_class.dec
+    )
+    return extraction
+
+
+def test_match_shots_matches_survey():
+    extraction = make_server()
+    rng = np.random.default_rng(5)
+    coords = SkyCoord(rng.uniform(149.0, 151.0, 300) * u.deg,
+                      rng.uniform(1.0, 3.0, 300) * u.deg)
+
+    expected = Survey.get_shot_matches(extraction.survey_class, coords)
+    matched = extraction.match_shots(coords)
+
+    assert list(matched.keys()) == list(expected.keys())
+    for shotid in expected:
+        assert np.array_equal(matched[shotid], expected[shotid])
+
+
+def test_server_roundtrip(tmp_path):
+    extraction = make_server()
+
+    def get_spectra(coords, **kwargs):
+        table = Table([np.atleast_1d(coords.ra.deg)], names=["ra"])
+        table["spec"] = np.ones((len(table), 3)) * u.AA
+        table["fiber_info"] = np.empty(len(table), dtype=object)
+        for i in range(len(table)):
+            table["fiber_info"][i] = np.array([["f%i" % j, "1.0"] for j in range(i + 1)])
+        return table
+
+    extraction.get_spectra = get_spectra
+    socket_path = str(tmp_path / "get_spec.sock")
+
+    thread = threading.Thread(target=server.serve, args=(extraction, socket_path))
+    thread.start()
+    try:
+        for _ in range(100):
+            if server.server_available(socket_path):
+                break
+            threading.Event().wait(0.05)
+
+        coords = SkyCoord([150.0, 150.1] * u.deg, [2.0, 2.1] * u.deg)
+        table = server.get_spectra(coords, socket_path=socket_path)
+        assert np.allclose(table["ra"], [150.0, 150.1])
+        assert table["spec"].unit == u.AA
+        assert table["fiber_info"][1].shape == (2, 2)
+
+        with pytest.raises(RuntimeError):
+            server.get_spectra(coords, survey="hdr1", socket_path=socket_path)
+    finally:
+        server.shutdown(socket_path)
+        thread.join(10)
+
+    assert not thread.is_alive()
+
+
+@pytest.mark.skipif(os.getuid() != 0, reason="needs to chown the socket")
+def test_refuses_foreign_socket(tmp_path):
+    socket_path = str(tmp_path / "get_spec.sock")
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as sock:
+        sock.bind(socket_path)
+        sock.listen(1)
+        os.chown(socket_path, 12345, 12345)
+
+        with pytest.raises(PermissionError):
+            server.request({"command": "ping"}, socket_path=socket_path)
+        assert not server.server_available(socket_path)
@@ -0,0 +1,46 @@
+"""
+
+Test that read_rows and read_fiber_rows return rows
+in the order of the requested indices for contiguous
+and sparse reads, for whole rows and a single field
+
+"""
+import numpy as np
+import pytest
+import tables as tb
+
+from hetdex_api.h5utils import read_rows
+from hetdex_api.shot import read_fiber_rows
+
+
+@pytest.fixture
+def table(tmp_path):
+    data = np.zeros(100, dtype=[("fiber_id", "S8"), ("ra", "f8"), ("dec", "f8")])
+    data["fiber_id"] = ["f%03d" % i for i in range(100)]
+    data["ra"] = np.arange(100)
+    data["dec"] = -np.arange(100)
+
+    fileh = tb.open_file(str(tmp_path / "fibers.h5"), mode="w")
+    yield fileh.create_table(fileh.root, "Fibers", obj=data)
+    fileh.close()
+
+
+@pytest.mark.parametrize("idx", [[5, 3, 3, 7], [90, 0, 45, 0], []])
+def test_read_rows(table, idx):
+    rows = read_fiber_rows(table, idx, fields=["ra", "fiber_id"])
+    assert rows.dtype.names == ("ra", "fiber_id")
+    np.testing.assert_array_equal(rows["ra"], np.asarray(idx, dtype=float))
+
+    rows = read_rows(table, idx)
+    assert rows.dtype.names == ("fiber_id", "ra", "dec")
+    np.testing.assert_array_equal(rows["ra"], np.asarray(idx, dtype=float))
+
+    dec = read_rows(table, idx, field="dec")
+    assert dec.dtype.names is None
+    np.testing.assert_array_equal(dec, -np.asarray(idx, dtype=float))
+
+
+def test_read_rows_keeps_shape(table):
+    idx = np.array([[1, 2], [80, 1]])
+    ra = read_rows(table, idx, field="ra")
+    np.testing.assert_array_equal(ra, idx)
@@ -0,0 +1,57 @@
+"""
+
+Import-time regression checks. Heavy dependencies
+must not be loaded until they are used and a second
+HDRconfig for the same survey must not probe the
+filesystem
+
+"""
+import os
+import os.path as op
+import subprocess
+import sys
+import pytest
+
+from hetdex_api.config import HDRconfig
+
+REPO_DIR = op.dirname(op.dirname(op.abspath(__file__)))
+
+# loaded inside the functions that need them, never at import
+HEAVY_MODULES = ["dustmaps", "speclite", "extinction", "scipy.interpolate"]
+
+
+def imported_modules(module):
+    """ Import module in a fresh interpreter and return sys.modules """
+    code = "import sys; import {}; print(' '.join(sys.modules))".format(module)
+    env = dict(os.environ, PYTHONPATH=REPO_DIR)
+    out = subprocess.run(
+        [sys.executable, "-c", code],
+        capture_output=True, text=True, check=True, env=env,
+    ).stdout
+    return set(out.split())
+
+
+@pytest.mark.parametrize(
+    "module", ["hetdex_api.config", "hetdex_api.extinction", "hetdex_api.detections"]
+)
+def test_heavy_dependencies_are_deferred(module):
+    modules = imported_modules(module)
+    assert module in modules
+    for heavy in HEAVY_MODULES:
+        assert heavy not in modules
+
+
+def test_hdrconfig_is_memoized(monkeypatch):
+    config = HDRconfig()
+
+    def fail(path):
+        raise AssertionError("filesystem probed for " + path)
+
+    monkeypatch.setattr(op, "exists", fail)
+    assert HDRconfig().__dict__ == config.__dict__
+
+
+def test_hdrconfig_copies_are_independent():
+    config = HDRconfig()
+    config.hdr_dir["hdr2.1"] = "/nowhere"
+    assert HDRconfig().hdr_dir["hdr2.1"] != "/nowhere"
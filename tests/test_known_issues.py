@@ -0,0 +1,128 @@
+"""
+
+Test the compiled known issues masks and their cache
+
+"""
+import os
+import os.path as op
+
+import numpy as np
+import pytest
+from astropy.table import Table
+
+from hetdex_api.known_issues import (
+    KnownIssues,
+    BAD_DETECT,
+    BAD_SHOT,
+    BAD_AMP,
+    BAD_PIX,
+    METEOR,
+)
+
+
+def write_lists(tmpdir):
+    sources = {}
+
+    sources["baddetect"] = op.join(tmpdir, "baddetects.list")
+    np.savetxt(sources["baddetect"], [2100000001, 2100000005], fmt="%i")
+
+    sources["badshot"] = op.join(tmpdir, "badshots.list")
+    np.savetxt(sources["badshot"], [20190102001], fmt="%i")
+
+    sources["badamp"] = op.join(tmpdir, "amp_flag.fits")
+    Table(
+        {
+            "shotid": [20190101001, 20190101001],
+            "multiframe": ["multi_319_083_023_LL", "multi_319_083_023_RU"],
+            "flag": [1, 0],
+        }
+    ).write(sources["badamp"])
+
+    sources["badamp2"] = op.join(tmpdir, "badamps.list")
+    Table(
+        {
+            "multiframe": ["multi_401_010_020_LL"],
+            "date_start": [20190101],
+            "date_end": [20190105],
+        }
+    ).write(sources["badamp2"], format="ascii")
+
+    sources["badpix"] = op.join(tmpdir, "badpix.list")
+    with open(sources["badpix"], "w") as f:
+        f.write("multi_319_083_023_LL 10 20 100 200\n")
+        f.write("multi_319_083_023_LL 500 600 900 1000\n")
+
+    sources["meteor"] = op.join(tmpdir, "meteor.txt")
+    Table({"shotid": [20190101001], "a": [1.0], "b": [0.02]}).write(
+        sources["meteor"], format="ascii"
+    )
+
+    return sources
+
+
+def test_known_issues_bitmask(tmp_path):
+    sources = write_lists(str(tmp_path))
+    cache_dir = str(tmp_path / "cache")
+
+    detectid = np.arange(2100000000, 2100000008)
+    shotid = np.array([20190101001] * 6 + [20190102001, 20190201001])
+    multiframe = np.array(
+        [
+            "multi_319_083_023_LL",
+            "multi_319_083_023_LL",
+            "multi_319_083_023_RU",
+            "multi_319_083_023_LL",
+            "multi_401_010_020_LL",
+            "multi_319_083_023_LL",
+            "multi_319_083_023_LL",
+            "multi_401_010_020_LL",
+        ]
+    )
+    date = shotid // 1000
+    x_raw = np.array([50, 15, 50, 550, 50, 50, 50, 50])
+    y_raw = np.array([50, 150, 50, 950, 50, 50, 50, 50])
+    ra = np.full(8, 100.0)
+    dec = np.full(8, 10.0)
+    dec[5] = 1.0 + 0.02 * 100.0 + 5.0 / 3600.0
+
+    issues = KnownIssues("hdr2.1", cache_dir=cache_dir, sources=sources)
+    bitmask = issues.get_bitmask(
+        detectid, shotid, multiframe=multiframe, date=date,
+        x_raw=x_raw, y_raw=y_raw, ra=ra, dec=dec,
+    )
+
+    assert list(bitmask) == [
+        0,
+        BAD_DETECT | BAD_PIX,
+        BAD_AMP,
+        BAD_PIX,
+        BAD_AMP,
+        BAD_DETECT | METEOR,
+        BAD_SHOT,
+        0,
+    ]
+
+    # the second load reads the compiled cache
+    assert op.exists(issues.filename)
+    cached = KnownIssues("hdr2.1", cache_dir=cache_dir, sources=sources)
+    assert cached.filename == issues.filename
+    assert np.array_equal(cached.arrays["amp_keys"], issues.arrays["amp_keys"])
+
+    # an updated list gets a new cache file
+    stat = os.stat(sources["badshot"])
+    os.utime(sources["badshot"], ns=(stat.st_atime_ns, stat.st_mtime_ns + 10 ** 9))
+    assert KnownIssues("hdr2.1", cache_dir=cache_dir, sources=sources).filename != issues.filename
+
+
+def test_missing_list_is_not_cached(tmp_path):
+    sources = write_lists(str(tmp_path))
+    os.remove(sources["badpix"])
+    cache_dir = str(tmp_path / "cache")
+
+    with pytest.warns(UserWarning):
+        issues = KnownIssues("hdr2.1", cache_dir=cache_dir, sources=sources)
+
+    assert not op.exists(issues.filename)
+    assert issues.bad_shot([20190102001])[0]
+    with pytest.raises(FileNotFoundError):
+        issues.bad_pix(["multi_319_083_023_LL"], [15], [150])
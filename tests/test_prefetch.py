@@ -0,0 +1,44 @@
+"""
+
+Test that prefetched shots come back in order and
+that the memory cap limits how far reads run ahead
+
+"""
+import time
+import types
+
+import hetdex_tools.get_spec as get_spec
+
+
+def test_prefetch_order_and_memory_cap(monkeypatch):
+    started = []
+
+    def read_shot(job):
+        started.append(job.shotid)
+        return types.SimpleNamespace(job=job, nbytes=10 ** 8, read_time=0.0)
+
+    monkeypatch.setattr(get_spec, "read_shot", read_shot)
+    jobs = [types.SimpleNamespace(shotid=i) for i in range(6)]
+
+    shotids = []
+    for shot_data, wait_time in get_spec.iter_prefetched_shots(
+        jobs, depth=4, max_memory_mb=50
+    ):
+        time.sleep(0.05)
+        # once one 100 MB shot is buffered no further read is started
+        assert len(started) - len(shotids) <= 2
+        shotids.append(shot_data.job.shotid)
+
+    assert shotids == list(range(6))
+
+
+def test_sink_writes_hold_hdf5_lock():
+    locked = []
+
+    class Sink:
+        def write_shot(self, shotid, source_dict):
+            locked.append(get_spec._hdf5_lock.locked())
+
+    get_spec.store_shot({}, 20190101001, {}, sink=Sink())
+
+    assert locked == [True]
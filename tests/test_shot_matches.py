@@ -0,0 +1,51 @@
+"""
+
+Test the KD-tree shot cross-match against the
+per-shot separation loop it replaces
+
+"""
+import types
+import numpy as np
+import astropy.units as u
+from astropy.coordinates import SkyCoord
+
+from hetdex_api.survey import Survey
+from hetdex_api.shot import in_ifu_footprint
+
+
+def test_shot_matches_match_separation_loop():
+    rng = np.random.default_rng(2)
+    survey = types.SimpleNamespace(
+        ra=rng.uniform(149.0, 151.0, 50),
+        dec=rng.uniform(1.0, 3.0, 50),
+        shotid=20190101000 + np.arange(50),
+    )
+    coords = SkyCoord(
+        rng.uniform(149.0, 151.0, 2000) * u.deg, rng.uniform(1.0, 3.0, 2000) * u.deg
+    )
+    max_sep = 11.0 * u.arcmin
+
+    expected = {}
+    for i, coord in enumerate(SkyCoord(survey.ra * u.deg, survey.dec * u.deg)):
+        idx = np.where(coords.separation(coord) < max_sep)[0]
+        if np.size(idx) > 0:
+            expected[survey.shotid[i]] = idx
+
+    matched = Survey.get_shot_matches(survey, coords, max_sep=max_sep)
+
+    assert list(matched.keys()) == list(expected.keys())
+    for shotid in expected:
+        assert np.array_equal(matched[shotid], expected[shotid])
+
+
+def test_in_ifu_footprint():
+    fplane = np.zeros(2, dtype=[("ifuslot", "i4"), ("fpx", "f8"), ("fpy", "f8")])
+    fplane["fpx"] = [0.0, 200.0]
+    fplane["fpy"] = [0.0, 0.0]
+
+    # shot centre lies on the first IFU and the IFU gap does not
+    ra0, dec0 = 150.0, 2.0
+    ra = np.array([ra0, ra0 + 100.0 / 3600.0 / np.cos(np.deg2rad(dec0)), ra0])
+    dec = np.array([dec0, dec0, dec0 + 100.0 / 3600.0])
+
+    assert list(in_ifu_footprint(ra, dec, ra0, dec0, 0.0, fplane)) == [True, False, False]
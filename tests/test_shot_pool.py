@@ -0,0 +1,78 @@
+"""
+
+Test that the ShotPool only closes evicted handles once
+they are released
+
+"""
+import tables as tb
+
+import hetdex_api.shot as shot
+
+
+def test_pool_keeps_referenced_handles(tmp_path, monkeypatch):
+    def open_file(shotid, survey="hdr2.1"):
+        filename = str(tmp_path / ("%s.h5" % shotid))
+        with tb.open_file(filename, mode="a") as fileh:
+            pass
+        return tb.open_file(filename, mode="r")
+
+    monkeypatch.setattr(shot, "_open_shot_file", open_file)
+    pool = shot.enable_shot_pool(max_files=1)
+    try:
+        first = shot.open_shot_file(20190101001)
+        second = shot.open_shot_file(20190101002)
+
+        # the first handle is still held so it is not closed
+        assert first.isopen and second.isopen
+        assert pool.stats()["open_files"] == 2
+
+        shot.close_shot_file(first)
+        assert not first.isopen
+        assert pool.stats()["open_files"] == 1
+
+        # a released handle stays pooled until it is evicted
+        shot.close_shot_file(second)
+        assert second.isopen
+        assert shot.open_shot_file(20190101002) is second
+        shot.close_shot_file(second)
+
+        third = shot.open_shot_file(20190101001)
+        assert third.isopen and not second.isopen
+        shot.close_shot_file(third)
+    finally:
+        shot.disable_shot_pool()
+
+    assert not third.isopen
+
+
+def test_pool_refs_follow_open_handles(tmp_path, monkeypatch):
+    def open_file(shotid, survey="hdr2.1"):
+        filename = str(tmp_path / ("%s.h5" % shotid))
+        with tb.open_file(filename, mode="a") as fileh:
+            pass
+        return tb.open_file(filename, mode="r")
+
+    monkeypatch.setattr(shot, "_open_shot_file", open_file)
+    pool = shot.enable_shot_pool(max_files=1)
+    try:
+        first = shot.open_shot_file(20190101001)
+        shot.open_shot_file(20190101001)
+
+        # a handle closed behind the pool's back is replaced and its
+        # count is not carried over to the new handle
+        first.close()
+        second = shot.open_shot_file(20190101001)
+        assert second is not first and second.isopen
+        assert first not in pool.refs
+        assert pool.refs[second] == 1
+        assert not pool.owns(first)
+
+        shot.close_shot_file(second)
+        third = shot.open_shot_file(20190101002)
+        shot.close_shot_file(third)
+
+        # only pooled handles are counted
+        assert list(pool.refs) == [third]
+        assert not second.isopen
+    finally:
+        shot.disable_shot_pool()
@@ -0,0 +1,81 @@
+"""
+
+Test the unit-vector KD-tree against direct
+SkyCoord separations
+
+"""
+import pytest
+import numpy as np
+import astropy.units as u
+from astropy.coordinates import SkyCoord
+from hetdex_api.spatial_index import (SkyKDTree, angle_to_chord,
+                                      angular_separation, chord_to_angle,
+                                      to_degrees)
+
+
+@pytest.fixture(scope="module")
+def fibers_radec():
+    """ Random fiber-like positions in a 12 arcmin field """
+    rng = np.random.default_rng(1234)
+    ra = 150.0 + rng.uniform(-0.1, 0.1, 20000)
+    dec = 2.0 + rng.uniform(-0.1, 0.1, 20000)
+    return ra, dec
+
+
+def test_chord_round_trip():
+    angles = np.array([0.0, 1.0 / 3600.0, 0.5, 45.0, 179.0])
+    assert np.allclose(chord_to_angle(angle_to_chord(angles)), angles)
+
+
+def test_angular_separation(fibers_radec):
+    ra, dec = fibers_radec
+    sep = angular_separation(150.0, 2.0, ra, dec)
+    sep_sky = SkyCoord(150.0 * u.deg, 2.0 * u.deg).separation(
+        SkyCoord(ra * u.deg, dec * u.deg))
+    assert np.allclose(sep, sep_sky.deg, rtol=0, atol=1e-10)
+
+
+@pytest.mark.parametrize("radius, expected", [(3.0 * u.arcsec, 3.0 / 3600.0),
+                                              (3.0, 3.0 / 3600.0),
+                                              (0.5 * u.deg, 0.5)])
+def test_to_degrees(radius, expected):
+    assert np.isclose(to_degrees(radius), expected)
+
+
+@pytest.mark.parametrize("radius", [1.5, 3.5, 12.0])
+def test_query_radius_matches_separation(fibers_radec, radius):
+    ra, dec = fibers_radec
+    tree = SkyKDTree(ra, dec)
+    fib_coords = SkyCoord(ra * u.deg, dec * u.deg)
+
+    rng = np.random.default_rng(42)
+    ra_src = 150.0 + rng.uniform(-0.08, 0.08, 25)
+    dec_src = 2.0 + rng.uniform(-0.08, 0.08, 25)
+
+    idx_list = tree.query_radius(ra_src, dec_src, radius / 3600.0)
+
+    for ra_i, dec_i, idx in zip(ra_src, dec_src, idx_list):
+        sep = SkyCoord(ra_i * u.deg, dec_i * u.deg).separation(fib_coords)
+        expected = np.where(sep < radius * u.arcsec)[0]
+        assert np.array_equal(idx, expected)
+
+
+def test_query_nearest_matches_catalog(fibers_radec):
+    ra, dec = fibers_radec
+    tree = SkyKDTree(ra, dec)
+    fib_coords = SkyCoord(ra * u.deg, dec * u.deg)
+    src = SkyCoord([150.01, 149.95] * u.deg, [2.02, 1.97] * u.deg)
+
+    sep, idx = tree.query_nearest(src.ra.deg, src.dec.deg)
+    idx_sky, sep_sky, _ = src.match_to_catalog_sky(fib_coords)
+
+    assert np.array_equal(idx, idx_sky)
+    assert np.allclose(sep, sep_sky.deg)
+
+
+def test_query_nearest_max_radius(fibers_radec):
+    ra, dec = fibers_radec
+    tree = SkyKDTree(ra, dec)
+    sep, idx = tree.query_nearest(10.0, -5.0, max_radius=1.0 * u.arcsec)
+    assert np.isinf(sep[0])
+    assert idx[0] == len(tree)
@@ -0,0 +1,93 @@
+"""
+
+Test the get_spec shard planner and the merge
+of shard outputs
+
+"""
+import types
+import numpy as np
+import tables as tb
+from astropy.table import Table
+from astropy.coordinates import SkyCoord
+
+from hetdex_api.survey import Survey
+from hetdex_tools.get_spec_shards import balance_shards, plan_shards, read_catalog
+from hetdex_tools.spectra_h5 import SpectraSink, merge_spectra_h5, read_spectra_h5, NWAVE
+
+
+def test_balance_shards():
+    costs = np.array([10.0, 9.0, 8.0, 3.0, 3.0, 2.0, 1.0])
+    shard, totals = balance_shards(costs, 3)
+
+    assert np.allclose(totals, [np.sum(costs[shard == i]) for i in range(3)])
+    assert np.allclose(np.sort(totals), [12.0, 12.0, 12.0])
+
+
+def test_plan_and_merge(tmp_path):
+    rng = np.random.default_rng(3)
+    survey = types.SimpleNamespace(
+        ra=np.array([150.0, 150.5, 151.0, 151.5]),
+        dec=np.full(4, 2.0),
+        shotid=20190101001 + np.arange(4),
+    )
+    survey.get_shot_matches = lambda coords, **kw: Survey.get_shot_matches(
+        survey, coords, **kw
+    )
+    table_in = Table(
+        [np.arange(500), rng.uniform(149.9, 151.6, 500), rng.uniform(1.9, 2.1, 500)],
+        names=["ID", "ra", "dec"],
+    )
+
+    plan = plan_shards(table_in, survey, 2, str(tmp_path), shot_overhead=0.0)
+    assert len(plan["shards"]) == 2
+
+    shots = [np.loadtxt(str(tmp_path / (s["name"] + ".shots")), dtype=int, ndmin=1)
+             for s in plan["shards"]]
+    assert sorted(np.concatenate(shots)) == list(survey.shotid)
+
+    # each shard catalog holds every source its shots need
+    for s, shotlist in zip(plan["shards"], shots):
+        cat = read_catalog(str(tmp_path / (s["name"] + ".cat")))
+        sel = np.isin(survey.shotid, shotlist)
+        sub = types.SimpleNamespace(
+            ra=survey.ra[sel], dec=survey.dec[sel], shotid=survey.shotid[sel]
+        )
+        matched = Survey.get_shot_matches(
+            sub, SkyCoord(cat["ra"], cat["dec"], unit="deg")
+        )
+        assert np.sum([np.size(idx) for idx in matched.values()]) == s["nsources"]
+
+    files = []
+    for i, s in enumerate(plan["shards"]):
+        filename = str(tmp_path / (s["name"] + ".h5"))
+        sink = SpectraSink(filename, ID=["a" * (i + 1)])
+        spec = np.ones(NWAVE)
+        ID = "a" * (i + 1)
+        sink.write_shot(shots[i][0], {ID: {shots[i][0]: [spec, spec, spec, [], [], None]}})
+        sink.close()
+        files.append(filename)
+
+    merged = str(tmp_path / "merged.h5")
+    merge_spectra_h5(files, merged)
+
+    output = read_spectra_h5(merged)
+    assert list(output["ID"]) == ["a", "aa"]
+
+    fileh = tb.open_file(merged)
+    assert fileh.root.Spectra.cols.shotid.is_indexed
+    assert list(fileh.root.Shots.cols.nrows[:]) == [1, 2]
+    fileh.close()
+
+
+def test_plan_without_matches(tmp_path):
+    survey = types.SimpleNamespace(
+        ra=np.array([150.0]), dec=np.array([2.0]), shotid=np.array([20190101001])
+    )
+    survey.get_shot_matches = lambda coords, **kw: Survey.get_shot_matches(
+        survey, coords, **kw
+    )
+    table_in = Table([[1, 2], [10.0, 10.1], [-5.0, -5.1]], names=["ID", "ra", "dec"])
+
+    plan = plan_shards(table_in, survey, 4, str(tmp_path))
+
+    assert plan["shards"] == []
@@ -0,0 +1,60 @@
+"""
+
+Test the streaming get_spec HDF5 output and
+resuming from a partially written file
+
+"""
+import numpy as np
+import pytest
+import tables as tb
+
+from hetdex_tools.spectra_h5 import SpectraSink, read_spectra_h5, NWAVE
+
+
+def shot_dict(shotid, IDs):
+    spec = np.ones(NWAVE)
+    return {ID: {shotid: [spec * ID, spec, spec, [], [], None]} for ID in IDs}
+
+
+def test_sink_resumes_after_partial_shot(tmp_path):
+    filename = str(tmp_path / "spec.h5")
+
+    sink = SpectraSink(filename, ID=[1, 22, 333])
+    sink.write_shot(20190101001, shot_dict(20190101001, [1, 22]))
+
+    # rows of a second shot reach the file but it is never marked complete
+    sink.spectra.append(sink.spectra.read())
+    sink.close()
+
+    sink = SpectraSink(filename)
+    assert sink.completed == {20190101001}
+    assert sink.spectra.nrows == 2
+    sink.write_shot(20190101002, shot_dict(20190101002, [333]))
+    sink.close()
+
+    output = read_spectra_h5(filename)
+    assert list(output["ID"]) == ["1", "22", "333"]
+    assert list(output["shotid"]) == [20190101001, 20190101001, 20190101002]
+    assert np.all(output["spec"][2] == 333)
+    assert np.all(output["flag"] == 1)
+
+    fileh = tb.open_file(filename)
+    assert list(fileh.root.Shots.cols.nrows[:]) == [2, 3]
+    fileh.close()
+
+
+def test_sink_rejects_longer_ids_on_resume(tmp_path):
+    filename = str(tmp_path / "spec.h5")
+
+    SpectraSink(filename, ID=[1, 22]).close()
+
+    sink = SpectraSink(filename, ID=[1, 22])
+    sink.close()
+
+    with pytest.raises(ValueError):
+        SpectraSink(filename, ID=[1, 22, 333])
+
+    # the file was closed and is left as it was
+    sink = SpectraSink(filename)
+    assert sink.spectra.coldtypes["ID"].itemsize == 2
+    sink.close()
@@ -0,0 +1,29 @@
+"""
+
+Test the sort/searchsorted join used to attach
+survey columns to detections
+
+"""
+import numpy as np
+from hetdex_api.survey import match_index
+
+
+def test_match_index_matches_where_loop():
+    rng = np.random.default_rng(3)
+    keys = rng.permutation(np.arange(20190101001, 20190101401))
+    values = rng.choice(np.append(keys, [1, 2, 3]), 5000)
+
+    idx = match_index(values, keys)
+
+    expected = np.full(np.size(values), -1)
+    for index, key in enumerate(keys):
+        expected[np.where(values == key)] = index
+
+    assert np.array_equal(idx, expected)
+
+
+def test_match_index_strings():
+    keys = np.array(["20190201v014", "20190105v011", "20190208v023"])
+    values = np.array(["20190208v023", "20190101v001", "20190105v011"])
+
+    assert np.array_equal(match_index(values, keys), [2, -1, 1])